@@ -4,46 +4,25 @@ import os
 from utils.logging_setup import get_logger
 from utils.text import convert_none_to_empty_string
 from config.api_keys import pool
+from config.settings import get_setting
+from core.archive import ARCHIVE_ENABLED, archive, archive_handover
 from core.models import HandoverData
-from core.group import group_devices
+from core.fuzzy_group import group_for_output
 from core.filename import generate_filename
-from core.extractor import extract_from_image, extract_text_from_pdf
-from template.filler import fill_word_template
+from core.extractor import extract_handover, extract_text_from_pdf, guess_mime_type
+from core.jobs import STATUS_DONE, USE_WORKERS, job_queue
+from core.merge import merge_handovers
+from core.pages import select_pages
+from core.readiness import KEY_INVALID, WARMUP_ENABLED, warm_up
+from core.serial_index import serial_index
+from core.singleflight import content_key
+from core.usage import usage_ledger, usage_scope
+from render.pipeline import FORMATS, render_outputs
 
 logger = get_logger('ui')
 
-PROMPT_TEMPLATE = """
-Hãy trích xuất thông tin từ Biên bản bàn giao và trả về JSON hợp lệ.
-
-**Cấu trúc JSON bắt buộc:**
-{
-  "shd": "Số định danh (số hợp đồng, PO, v.v.)",
-  "shd_type": "Loại: 'Hợp đồng', 'PO', 'Đề nghị', hoặc 'Khác'",
-  "cty": "Tên công ty bên giao",
-  "ds": [
-    {
-      "ttb": "Tên thiết bị",
-      "model": "Model (nếu có, không bao gồm số REF)",
-      "ref": "Số REF (Reference number, nếu có)",
-      "hang": "Hãng",
-      "nsx": "Nước sản xuất",
-      "dvt": "Đơn vị tính",
-      "sl": Số lượng (số nguyên),
-      "seri": ["danh sách số seri"] hoặc null,
-      "pk": ["danh sách phụ kiện"] hoặc null
-    }
-  ]
-}
-
-**Quy tắc quan trọng:**
-1. pk PHẢI là một ARRAY các chuỗi, ví dụ: ["Dây nguồn", "Cáp USB"]
-2. pk KHÔNG được gộp thành một chuỗi dài
-3. Nếu không có thông tin, trả về null
-4. KHÔNG có Markdown code block, chỉ trả về JSON thuần
-5. Đọc CHÍNH XÁC model/model number - cẩn thận với các số giống nhau (VD: 0/O, 1/I/l, 2/Z, 5/S, 6/G, 8/B)
-6. Nếu không chắc chắn, ghi lại như trong tài liệu
-7. Nhận diện chính xác số Seri và số REF (Reference number) của thiết bị nếu có.
-"""
+WORKER_WAIT_TIMEOUT = get_setting('WORKERS', 'UI_TIMEOUT', 300.0, float)
+ARCHIVE_UI_LIMIT = 20
 
 
 @st.cache_resource
@@ -56,9 +35,184 @@ def check_prerequisites() -> bool:
         st.error("Thiếu file mẫu 'bbbg.docx'")
         return False
 
+    if WARMUP_ENABLED:
+        # Runs once per server process (cache_resource): clients, template and key health are warm
+        report = warm_up()
+        invalid = [k.fingerprint for k in report.keys if k.state == KEY_INVALID]
+        if invalid:
+            st.warning(f"Key bị từ chối, sẽ bỏ qua: {', '.join(invalid)}")
+        if not report.ready:
+            st.error(f"Chưa sẵn sàng:\n\n{report.describe()}")
+            return False
+
     return True
 
 
+def show_downloads(data, grouped, output_formats, doc_id: str = "", source_name: str = "") -> None:
+    """Success banner plus one download button per rendered format; the result is archived."""
+    filename = generate_filename(data, grouped)
+    outputs = show_download_buttons(render_outputs(data, grouped, output_formats or ['docx'], filename))
+    archive_handover(doc_id, source_name, data, grouped, outputs)
+
+
+def show_download_buttons(outputs) -> list:
+    """Success banner, then a download button for each output (rendered here or by a worker).
+
+    Returns the outputs shown, so a rendering generator can be archived afterwards.
+    """
+    st.markdown("""
+    <div style="
+        padding: 1rem 1.25rem;
+        background: #0d2818;
+        border: 1px solid #166534;
+        border-radius: 10px;
+        margin-bottom: 1rem;
+    ">
+        <div style="font-weight: 600; color: #4ade80; font-size: 0.9rem;">Trích xuất thành công</div>
+        <div style="font-size: 0.85rem; color: #22c55e; margin-top: 2px;">File đã sẵn sàng tải xuống.</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    shown = []
+    for output in outputs:
+        st.download_button(
+            f"Tải file {output.format.upper()}",
+            output.content,
+            output.filename,
+            output.mime,
+            key=f"download_{output.format}",
+        )
+        shown.append(output)
+    return shown
+
+
+def run_in_worker(uploaded_file, file_bytes, mime, output_formats) -> None:
+    """Worker mode: queue the upload, wait for a worker process, show its results.
+
+    The job id is kept in the session per document and formats, so reruns
+    (download clicks, widget changes) wait on the same job instead of queueing
+    the document again.
+    """
+    formats = output_formats or ['docx']
+    doc_id = content_key(file_bytes)
+    job_key = (doc_id, tuple(formats))
+    jobs = st.session_state.setdefault('worker_jobs', {})
+    job_id = jobs.get(job_key)
+    if job_id is None or job_queue.get(job_id) is None:
+        job_id = job_queue.submit(uploaded_file.name, file_bytes, mime, doc_id, formats)
+        jobs[job_key] = job_id
+    with st.spinner("Đang chờ worker xử lý..."):
+        job = job_queue.wait(job_id, timeout=WORKER_WAIT_TIMEOUT)
+
+    if job is None or not job.finished:
+        st.warning("Chưa có worker nào nhận việc. Kiểm tra `python worker.py` đang chạy.")
+        return
+    if job.status != STATUS_DONE:
+        show_failure()
+        return
+    for message in job.result.get('duplicates', []):
+        st.warning(message)
+    for message in job.result.get('merges', []):
+        st.info(message)
+    show_download_buttons(job.outputs)
+
+
+def show_usage() -> None:
+    """Today's API usage, per key (fingerprint) and per stage."""
+    summary = usage_ledger.summary()
+    with st.expander("Mức sử dụng API hôm nay"):
+        st.caption(summary.describe())
+        rows = [
+            {"": f"key {key_id}", "Lượt gọi": t.calls, "Trang OCR": t.pages, "Token": t.tokens}
+            for key_id, t in summary.by_key.items()
+        ] + [
+            {"": stage, "Lượt gọi": t.calls, "Trang OCR": t.pages, "Token": t.tokens}
+            for stage, t in summary.by_stage.items()
+        ]
+        if rows:
+            st.table(rows)
+
+
+def show_archive_search() -> None:
+    """Look up issued handovers by shd, company, model or serial and re-download them."""
+    with st.expander("Tra cứu biên bản đã lưu"):
+        query = st.text_input("Số hợp đồng/PO, công ty, model hoặc số seri", key="archive_query")
+        if not query:
+            return
+        entries = archive.search(query, limit=ARCHIVE_UI_LIMIT)
+        if not entries:
+            st.caption("Không tìm thấy biên bản nào.")
+            return
+        for entry in entries:
+            st.markdown(entry.describe())
+            if entry.docx_name:
+                st.download_button(
+                    f"Tải {entry.docx_name}",
+                    archive.load_docx(entry.id),
+                    entry.docx_name,
+                    FORMATS['docx'].mime,
+                    key=f"archive_{entry.id}",
+                )
+
+
+def show_failure() -> None:
+    st.markdown("""
+    <div style="
+        padding: 1rem 1.25rem;
+        background: #2d1215;
+        border: 1px solid #991b1b;
+        border-radius: 10px;
+    ">
+        <div style="font-weight: 600; color: #f87171; font-size: 0.9rem;">Không trích xuất được</div>
+        <div style="font-size: 0.85rem; color: #ef4444; margin-top: 2px;">Vui lòng thử lại với file khác hoặc kiểm tra chất lượng ảnh.</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+
+def merge_mode(output_formats) -> None:
+    """Several delivery notes for the same PO -> one consolidated handover.
+
+    A download click reruns the script with the button no longer pressed, so
+    the merge result and its rendered files are kept in the session, keyed on
+    the uploaded files and formats, and shown again until the upload changes.
+    """
+    uploaded_files = st.file_uploader(
+        "Chọn các file",
+        type=["pdf", "jpg", "png"],
+        accept_multiple_files=True,
+        help="Các biên bản giao hàng của cùng một PO/hợp đồng"
+    )
+    if not uploaded_files:
+        return
+    formats = output_formats or ['docx']
+    merge_key = (tuple(content_key(f.getvalue()) for f in uploaded_files), tuple(formats))
+
+    if st.button(f"Gộp {len(uploaded_files)} biên bản"):
+        with st.spinner("Đang trích xuất và gộp dữ liệu..."):
+            result = merge_handovers([(f.name, f.getvalue()) for f in uploaded_files])
+            outputs = []
+            if result is not None:
+                filename = generate_filename(result.data, result.grouped)
+                outputs = list(render_outputs(result.data, result.grouped, formats, filename))
+                archive_handover("", ", ".join(result.sources), result.data, result.grouped, outputs)
+        st.session_state['merge_result'] = (merge_key, result, outputs)
+
+    stored = st.session_state.get('merge_result')
+    if stored is None or stored[0] != merge_key:
+        return
+    _, result, outputs = stored
+    if result is None:
+        show_failure()
+        return
+    for conflict in result.conflicts + result.duplicates:
+        st.warning(conflict)
+    for merge in result.merges:
+        st.info(merge.describe())
+    if result.failed:
+        st.warning("Không trích xuất được: " + ", ".join(result.failed))
+    show_download_buttons(outputs)
+
+
 def main():
     st.set_page_config(
         page_title="Biên bản Bàn giao",
@@ -217,9 +371,23 @@ def main():
         Mistral OCR sẵn sàng &middot; {pool.size} key
     </div>
     """, unsafe_allow_html=True)
+    show_usage()
+    if ARCHIVE_ENABLED:
+        show_archive_search()
 
     st.markdown("---")
 
+    output_formats = st.multiselect(
+        "Định dạng xuất",
+        options=list(FORMATS),
+        default=['docx'],
+        format_func=str.upper,
+    )
+
+    if st.checkbox("Gộp nhiều biên bản giao hàng thành một biên bản bàn giao"):
+        merge_mode(output_formats)
+        return
+
     uploaded_file = st.file_uploader(
         "Chọn file",
         type=["pdf", "jpg", "png"],
@@ -255,72 +423,69 @@ def main():
         </div>
         """, unsafe_allow_html=True)
 
+        # Read the upload once and share it with every step below. On an
+        # unmodified BytesIO getvalue() returns the underlying bytes without
+        # copying, whereas getbuffer() would force a private copy.
+        file_bytes = uploaded_file.getvalue()
+        mime = guess_mime_type(uploaded_file.name, file_bytes)
+
         # Check PDF type (digital/searchable vs scanned) to inform the user
         is_digital_pdf = False
         num_pages = 0
-        if uploaded_file.name.lower().endswith('.pdf'):
+        if mime == 'application/pdf':
             try:
-                pdf_text = extract_text_from_pdf(uploaded_file.getvalue())
-                if pdf_text:
-                    is_digital_pdf = True
+                import fitz
+                with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+                    num_pages = len(doc)
             except Exception:
                 pass
+            if num_pages > 1:
+                page_spec = st.text_input(
+                    f"Chỉ xử lý các trang (tài liệu có {num_pages} trang)",
+                    placeholder="vd: 1-3, 5 — để trống để xử lý tất cả",
+                    help="Bỏ qua các trang phụ lục (CO/CQ, hướng dẫn sử dụng...) để xử lý nhanh hơn",
+                )
+                if page_spec.strip():
+                    try:
+                        file_bytes = select_pages(file_bytes, page_spec)
+                    except ValueError as e:
+                        st.error(str(e))
+                        st.stop()
+                    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+                        num_pages = len(doc)
             try:
-                import fitz
-                doc = fitz.open(stream=uploaded_file.getvalue(), filetype="pdf")
-                num_pages = len(doc)
+                pdf_text = extract_text_from_pdf(file_bytes)
+                if pdf_text:
+                    is_digital_pdf = True
             except Exception:
                 pass
 
         if is_digital_pdf:
             st.info(f"Đã phát hiện văn bản trong PDF ({num_pages} trang). Bắt đầu trích xuất trực tiếp...")
-        elif uploaded_file.name.lower().endswith('.pdf'):
+        elif mime == 'application/pdf':
             st.info(f"Không phát hiện văn bản trực tiếp. Đang chuyển đổi PDF ({num_pages} trang) sang ảnh và chạy Mistral OCR...")
 
-        with st.spinner("Đang trích xuất dữ liệu..."):
-            file_bytes = uploaded_file.getvalue()
-            mime = 'application/pdf' if uploaded_file.name.lower().endswith('.pdf') else 'image/jpeg'
-            data = extract_from_image(file_bytes, mime, PROMPT_TEMPLATE)
-
-        if data and 'ds' in data:
-            data = convert_none_to_empty_string(data)
-            handover = HandoverData.from_dict(data)
-            grouped = group_devices(handover.ds)
-
-            filename = generate_filename(data, grouped)
-            word_io = fill_word_template(data, grouped)
-
-            st.markdown("""
-            <div style="
-                padding: 1rem 1.25rem;
-                background: #0d2818;
-                border: 1px solid #166534;
-                border-radius: 10px;
-                margin-bottom: 1rem;
-            ">
-                <div style="font-weight: 600; color: #4ade80; font-size: 0.9rem;">Trích xuất thành công</div>
-                <div style="font-size: 0.85rem; color: #22c55e; margin-top: 2px;">File Word đã sẵn sàng tải xuống.</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-            st.download_button(
-                "Tải file Word",
-                word_io,
-                filename,
-                "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            )
-        else:
-            st.markdown("""
-            <div style="
-                padding: 1rem 1.25rem;
-                background: #2d1215;
-                border: 1px solid #991b1b;
-                border-radius: 10px;
-            ">
-                <div style="font-weight: 600; color: #f87171; font-size: 0.9rem;">Không trích xuất được</div>
-                <div style="font-size: 0.85rem; color: #ef4444; margin-top: 2px;">Vui lòng thử lại với file khác hoặc kiểm tra chất lượng ảnh.</div>
-            </div>
-            """, unsafe_allow_html=True)
+        if USE_WORKERS:
+            run_in_worker(uploaded_file, file_bytes, mime, output_formats)
+            return
+
+        doc_id = content_key(file_bytes)
+        with usage_scope(doc_id=doc_id):
+            with st.spinner("Đang trích xuất dữ liệu..."):
+                data = extract_handover(file_bytes, mime)
+
+            if data and 'ds' in data:
+                data = convert_none_to_empty_string(data)
+                handover = HandoverData.from_dict(data)
+                for duplicate in serial_index.check_and_record(doc_id, handover):
+                    st.warning(duplicate.describe())
+                grouped, merges = group_for_output(handover.ds)
+                for merge in merges:
+                    st.info(merge.describe())
+
+                show_downloads(data, grouped, output_formats, doc_id, uploaded_file.name)
+            else:
+                show_failure()
 
 
 if __name__ == "__main__":
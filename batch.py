@@ -0,0 +1,183 @@
+"""Batch runner — process many delivery notes from the command line.
+
+Usage:
+    python batch.py scans/*.pdf --out output
+    python batch.py note1.pdf note2.jpg --merge --formats docx xlsx
+    python batch.py scans/ --profile
+    python batch.py packets/ --pages 1-2
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Tuple
+from config.api_keys import pool
+from core.archive import archive_handover
+from core.extractor import extract_handover, guess_mime_type
+from core.filename import generate_filename
+from core.fuzzy_group import group_for_output
+from core.merge import DEFAULT_MERGE_WORKERS, merge_handovers
+from core.models import HandoverData
+from core.pages import parse_page_range, select_pages
+from core.readiness import WARMUP_ENABLED, warm_up
+from core.serial_index import serial_index
+from core.singleflight import content_key
+from core.usage import PRIORITY_LOW, BudgetExceeded, usage_ledger, usage_scope
+from render.pipeline import FORMATS, render_outputs
+from utils import profiling
+from utils.text import convert_none_to_empty_string
+from utils.logging_setup import get_logger
+
+logger = get_logger('batch')
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png')
+
+
+def collect_files(paths: List[str]) -> List[str]:
+    """Expand directories into supported files; keep explicit files as given."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    files.append(os.path.join(path, name))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            logger.warning(f"Skipping missing path: {path}")
+    return files
+
+
+def _read(path: str, pages: str = "") -> Tuple[str, bytes]:
+    """File name and content; PDFs are cut down to `pages` (e.g. '1-3,5') when given."""
+    with open(path, 'rb') as f:
+        name, content = os.path.basename(path), f.read()
+    if pages and guess_mime_type(name, content) == 'application/pdf':
+        content = select_pages(content, pages)
+    return name, content
+
+
+def write_outputs(
+    data, grouped, formats: List[str], out_dir: str, doc_id: str = "", source_name: str = "",
+) -> List[str]:
+    """Write every requested format to `out_dir` and archive the handover."""
+    filename = generate_filename(data, grouped)
+    written, outputs = [], []
+    for output in render_outputs(data, grouped, formats, filename):
+        path = os.path.join(out_dir, output.filename)
+        with open(path, 'wb') as f:
+            f.write(output.content.getbuffer())
+        written.append(path)
+        outputs.append(output)
+    archive_handover(doc_id, source_name, data, grouped, outputs)
+    return written
+
+
+def _check_budget() -> None:
+    """Batch work is low priority: defer it once keys near their usage budget."""
+    if pool.size and not usage_ledger.budget_available(pool.keys, PRIORITY_LOW):
+        raise BudgetExceeded("Đã gần hết hạn mức sử dụng API trong ngày")
+
+
+def process_one(path: str, formats: List[str], out_dir: str, pages: str = "") -> List[str]:
+    _check_budget()
+    name, file_bytes = _read(path, pages)
+    doc_id = content_key(file_bytes)
+    with usage_scope(doc_id=doc_id, priority=PRIORITY_LOW):
+        data = extract_handover(file_bytes, guess_mime_type(name, file_bytes))
+        if not data or 'ds' not in data:
+            raise ValueError(f"Không trích xuất được {name}")
+        data = convert_none_to_empty_string(data)
+        handover = HandoverData.from_dict(data)
+        for duplicate in serial_index.check_and_record(doc_id, handover):
+            print(f"CẢNH BÁO: {name}: {duplicate.describe()}", file=sys.stderr)
+        grouped, merges = group_for_output(handover.ds)
+        for merge in merges:
+            print(f"{name}: {merge.describe()}", file=sys.stderr)
+        return write_outputs(data, grouped, formats, out_dir, doc_id, name)
+
+
+def run_separate(files: List[str], formats: List[str], out_dir: str, workers: int, pages: str = "") -> int:
+    failures = 0
+    deferred = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_one, path, formats, out_dir, pages): path for path in files}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                for written in future.result():
+                    print(f"{path} -> {written}")
+            except BudgetExceeded:
+                deferred.append(path)
+            except Exception as e:
+                failures += 1
+                print(f"{path}: FAILED ({e})", file=sys.stderr)
+    if deferred:
+        print(f"Hoãn {len(deferred)} file do hết hạn mức API: {', '.join(sorted(deferred))}", file=sys.stderr)
+    return failures + len(deferred)
+
+
+def run_merged(files: List[str], formats: List[str], out_dir: str, workers: int, pages: str = "") -> int:
+    try:
+        _check_budget()
+    except BudgetExceeded as e:
+        print(f"Hoãn gộp {len(files)} file: {e}", file=sys.stderr)
+        return len(files)
+    with usage_scope(priority=PRIORITY_LOW):
+        result = merge_handovers([_read(path, pages) for path in files], max_workers=workers)
+    if result is None:
+        print("Không trích xuất được tài liệu nào.", file=sys.stderr)
+        return len(files)
+    for conflict in result.conflicts + result.duplicates:
+        print(f"CẢNH BÁO: {conflict}", file=sys.stderr)
+    for merge in result.merges:
+        print(merge.describe(), file=sys.stderr)
+    for name in result.failed:
+        print(f"{name}: FAILED", file=sys.stderr)
+    sources = ", ".join(result.sources)
+    for written in write_outputs(result.data, result.grouped, formats, out_dir, source_name=sources):
+        print(f"{len(result.sources)} tài liệu -> {written}")
+    return len(result.failed)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tạo biên bản bàn giao hàng loạt")
+    parser.add_argument('paths', nargs='+', help="File PDF/ảnh hoặc thư mục")
+    parser.add_argument('--out', default='output', help="Thư mục lưu kết quả")
+    parser.add_argument('--formats', nargs='+', default=['docx'], choices=list(FORMATS))
+    parser.add_argument('--workers', type=int, default=DEFAULT_MERGE_WORKERS)
+    parser.add_argument('--merge', action='store_true',
+                        help="Gộp tất cả biên bản giao hàng thành một biên bản bàn giao")
+    parser.add_argument('--pages', default="",
+                        help="Chỉ xử lý các trang này của mỗi PDF, vd: 1-3,5")
+    parser.add_argument('--profile', action='store_true',
+                        help="Profile mọi tài liệu và in bảng tổng hợp thời gian khi chạy xong")
+    args = parser.parse_args(argv)
+
+    files = collect_files(args.paths)
+    if not files:
+        parser.error("Không có file hợp lệ")
+    if args.pages:
+        try:
+            parse_page_range(args.pages, page_count=10**6)
+        except ValueError as e:
+            parser.error(str(e))
+    os.makedirs(args.out, exist_ok=True)
+    if args.profile:
+        profiling.enable_for_run()
+    if WARMUP_ENABLED:
+        warm_up()
+
+    if args.merge:
+        failures = run_merged(files, args.formats, args.out, args.workers, args.pages)
+    else:
+        failures = run_separate(files, args.formats, args.out, args.workers, args.pages)
+    print(usage_ledger.summary().describe(), file=sys.stderr)
+    if args.profile:
+        print(profiling.report(), file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Benchmark: archive search latency at a realistic archive size.
+
+Usage: python -m benchmarks.bench_archive_search [--records 200000] [--db /tmp/bench_archive.db]
+
+Fills a throwaway archive with synthetic handovers (3 devices, 2 serials
+each, ~40 suppliers), then times exact lookups by shd, company, model and
+serial, and free-text (FTS) searches. The .docx column is left empty so the
+file stays small; search never reads it.
+"""
+
+import os
+import time
+import random
+import argparse
+from core.archive import HandoverArchive
+from core.models import GroupedDevice
+
+COMPANIES = [f"Công ty TNHH Thiết bị Y tế Số {i}" for i in range(40)]
+NAMES = ["Máy đo huyết áp", "Máy thở", "Monitor theo dõi bệnh nhân", "Bơm tiêm điện", "Máy hút dịch"]
+
+
+def synthetic(i: int, rng: random.Random) -> dict:
+    return {
+        'shd_type': rng.choice(['Hợp đồng', 'PO']),
+        'shd': f"{i:06d}/HĐ-MB",
+        'cty': rng.choice(COMPANIES),
+        'ds': [
+            {
+                'ttb': rng.choice(NAMES), 'model': f"HEM-{rng.randint(1000, 9999)}", 'ref': '',
+                'hang': 'Omron', 'nsx': 'Nhật Bản', 'dvt': 'Cái', 'sl': 2,
+                'seri': [f"SN{i:07d}{d}{k}" for k in range(2)], 'pk': [],
+            }
+            for d in range(3)
+        ],
+    }
+
+
+def fill(archive: HandoverArchive, records: int) -> float:
+    rng = random.Random(42)
+    grouped = [GroupedDevice("Máy đo huyết áp", "HEM-7120", "", "Omron", "Nhật Bản", "Cái", 6, [], "")]
+    started = time.perf_counter()
+    with archive._lock:
+        for i in range(records):
+            archive.store(f"doc{i}", f"scan{i}.pdf", synthetic(i, rng), grouped, "", None)
+    return time.perf_counter() - started
+
+
+def timed(fn, *args, repeat: int = 20):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(*args)
+    return (time.perf_counter() - started) / repeat * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200_000)
+    parser.add_argument('--db', default='/tmp/bench_archive.db')
+    args = parser.parse_args()
+
+    archive = HandoverArchive(args.db)
+    if archive.count() < args.records:
+        missing = args.records - archive.count()
+        print(f"Inserting {missing} records ...")
+        elapsed = fill(archive, missing)
+        print(f"  {missing / elapsed:.0f} records/s, {os.path.getsize(args.db) / 2**20:.0f} MB")
+
+    target = args.records // 2
+    sample = synthetic(target, random.Random(0))
+    queries = [
+        ("by_shd", archive.by_shd, f"{target:06d}/HĐ-MB"),
+        ("by_company", archive.by_company, "CÔNG TY TNHH THIẾT BỊ Y TẾ SỐ 7"),
+        ("by_model", archive.by_model, "hem 7120"),
+        ("by_serial", archive.by_serial, f"sn{target:07d}01"),
+        ("search: serial", archive.search, f"SN{target:07d}01"),
+        ("search: words", archive.search, "may tho so 12"),
+        ("search: prefix", archive.search, sample['ds'][0]['model'][:6]),
+    ]
+    print(f"{'query':>16} {'ms':>8} {'hits':>6}")
+    for label, fn, text in queries:
+        ms, hits = timed(fn, text)
+        print(f"{label:>16} {ms:>8.2f} {hits:>6}")
+
+
+if __name__ == '__main__':
+    main()
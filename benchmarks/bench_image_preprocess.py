@@ -0,0 +1,75 @@
+"""Benchmark: photo preprocessing before OCR — payload size and time.
+
+Usage: python -m benchmarks.bench_image_preprocess [photo.jpg ...] [--repeat 3] [--upload-mbps 10]
+
+Without arguments, synthetic 12 MP "phone photos" of a delivery note are used.
+Upload time is estimated from the base64 payload at --upload-mbps.
+"""
+
+import io
+import base64
+import random
+import argparse
+import time
+from PIL import Image, ImageDraw, ImageFilter
+from utils.image import prepare_for_ocr, sniff_mime_type
+
+
+def make_photo(seed: int, size=(4032, 3024), angle: float = 2.0) -> bytes:
+    """A grey-desk photo of a printed table, slightly rotated, saved like a phone JPEG."""
+    rng = random.Random(seed)
+    page = Image.new('RGB', (2480, 3508), 'white')
+    draw = ImageDraw.Draw(page)
+    for row in range(40):
+        y = 300 + row * 75
+        draw.line([(150, y), (2330, y)], fill='black', width=3)
+        for col, x in enumerate((160, 400, 1100, 1500, 1900)):
+            text = f"HEM-{rng.randint(1000, 9999)} SN{rng.randint(10**6, 10**7)}" if col else str(row + 1)
+            draw.text((x, y + 20), text, fill='black')
+    page = page.rotate(angle, expand=True, fillcolor=(90, 85, 80))
+    photo = Image.new('RGB', size, (90, 85, 80))
+    page.thumbnail((size[0] * 0.7, size[1] * 0.9))
+    photo.paste(page, ((size[0] - page.width) // 2, (size[1] - page.height) // 2))
+    noise = Image.effect_noise(size, 20).convert('RGB')
+    photo = Image.blend(photo, noise, 0.08).filter(ImageFilter.GaussianBlur(1))
+    out = io.BytesIO()
+    photo.save(out, format='JPEG', quality=95)
+    return out.getvalue()
+
+
+def payload_size(data: bytes, mime: str) -> int:
+    return len(f"data:{mime};base64,") + len(base64.b64encode(data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('photos', nargs='*')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--upload-mbps', type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.photos:
+        samples = []
+        for path in args.photos:
+            with open(path, 'rb') as f:
+                samples.append((path, f.read()))
+    else:
+        samples = [(f"synthetic-{i}", make_photo(i, angle=a)) for i, a in enumerate((0.0, 2.0, -3.5))]
+
+    bytes_per_s = args.upload_mbps * 1e6 / 8
+    print(f"{'sample':<24} {'before (KB)':>12} {'after (KB)':>11} {'ratio':>6} "
+          f"{'prep (ms)':>10} {'upload before (s)':>18} {'upload after (s)':>17}")
+    for name, data in samples:
+        mime = sniff_mime_type(data) or 'image/jpeg'
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            out, out_mime = prepare_for_ocr(data, mime)
+            best = min(best, time.perf_counter() - started)
+        before, after = payload_size(data, mime), payload_size(out, out_mime)
+        print(f"{name[-24:]:<24} {before / 1024:>12.0f} {after / 1024:>11.0f} {before / after:>5.1f}x "
+              f"{best * 1000:>10.0f} {before / bytes_per_s:>18.2f} {after / bytes_per_s + best:>17.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark: handover parsing — convert + HandoverData.from_dict vs parse_handover.
+
+Usage: python -m benchmarks.bench_models [--docs 2000] [--devices 20] [--repeat 3]
+
+Builds synthetic extraction JSON (nulls where the chat model leaves fields
+empty, as it does in practice) and reports, per document: parse time, the
+peak memory allocated while parsing, and the memory the parsed models keep
+alive (what a batch merge or archive run holds for every document).
+"""
+
+import gc
+import time
+import argparse
+import tracemalloc
+from core.models import HandoverData, parse_handover
+from utils.text import convert_none_to_empty_string
+
+
+def make_documents(docs: int, devices: int) -> list:
+    return [
+        {
+            'shd': f"{d:05d}/HĐ-MB", 'shd_type': 'Hợp đồng', 'cty': f"Công ty TNHH Thiết bị Y tế Số {d % 40}",
+            'ds': [
+                {
+                    'ttb': f"Máy đo huyết áp {i}", 'model': f"HEM-{7000 + i}", 'ref': None,
+                    'hang': 'Omron', 'nsx': 'Nhật Bản' if i % 3 else None, 'dvt': 'Cái', 'sl': 2,
+                    'seri': [f"SN{d:05d}{i:03d}{k}" for k in range(2)],
+                    'pk': ["Dây nguồn", "Túi đựng"] if i % 2 else None,
+                }
+                for i in range(devices)
+            ],
+        }
+        for d in range(docs)
+    ]
+
+
+def legacy(raw: dict) -> HandoverData:
+    return HandoverData.from_dict(convert_none_to_empty_string(raw))
+
+
+def measure(parse, documents: list, repeat: int):
+    """(best seconds for all documents, peak bytes while parsing one, bytes retained by all results)."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for raw in documents:
+            parse(raw)
+        best = min(best, time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    parse(documents[0])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [parse(raw) for raw in documents]
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return best, peak, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    documents = make_documents(args.docs, args.devices)
+    print(f"{args.docs} documents x {args.devices} devices")
+    print(f"{'parser':>16} {'us/doc':>9} {'peak KB':>9} {'kept KB/doc':>12}")
+    results = {}
+    for label, parse in (("convert+from_dict", legacy), ("parse_handover", parse_handover)):
+        seconds, peak, retained = measure(parse, documents, args.repeat)
+        results[label] = (seconds, retained)
+        print(f"{label:>16} {seconds / args.docs * 1e6:>9.1f} {peak / 1024:>9.1f} "
+              f"{retained / args.docs / 1024:>12.2f}")
+    (old_s, old_m), (new_s, new_m) = results.values()
+    print(f"parse_handover: {old_s / new_s:.2f}x faster, {1 - new_m / old_m:.0%} less memory kept")
+
+
+if __name__ == '__main__':
+    main()
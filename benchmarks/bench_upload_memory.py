@@ -0,0 +1,68 @@
+"""Benchmark: peak memory of the upload -> OCR request path (tracemalloc).
+
+Usage: python -m benchmarks.bench_upload_memory [--sizes 5 20 50] [--getbuffer]
+
+"copying" reproduces the previous flow: getvalue() per consumer, then
+b64encode().decode() plus an f-string data URL, with the base64 string
+still alive while the request body is serialized. "zero-copy" reads the
+upload once and builds the data URL with sdk.adapter.build_data_url.
+
+The upload keeps a reference to its initial bytes, as Streamlit's
+UploadedFile does; --getbuffer shows that getbuffer() then costs a full copy.
+"""
+
+import io
+import os
+import json
+import base64
+import argparse
+import time
+import tracemalloc
+from sdk.adapter import build_data_url
+
+
+def copying_path(upload: io.BytesIO) -> int:
+    checks = [upload.getvalue(), upload.getvalue()]   # text-layer check, page count
+    file_bytes = upload.getvalue()
+    b64_data = base64.b64encode(file_bytes).decode('utf-8')
+    data_url = f"data:application/pdf;base64,{b64_data}"
+    body = json.dumps({"document": {"type": "document_url", "document_url": data_url}})
+    return len(body) + len(checks)
+
+
+def zero_copy_path(upload: io.BytesIO, use_getbuffer: bool = False) -> int:
+    file_bytes = upload.getbuffer() if use_getbuffer else upload.getvalue()
+    data_url = build_data_url(file_bytes, 'application/pdf')
+    body = json.dumps({"document": {"type": "document_url", "document_url": data_url}})
+    del file_bytes
+    return len(body)
+
+
+def measure(fn, upload: io.BytesIO):
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn(upload)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 20, 50], help="upload sizes in MB")
+    parser.add_argument('--getbuffer', action='store_true', help="read the upload with getbuffer()")
+    args = parser.parse_args()
+
+    print(f"{'upload (MB)':>11} {'copying peak (MB)':>18} {'zero-copy peak (MB)':>20} "
+          f"{'saved':>6} {'copying (s)':>12} {'zero-copy (s)':>14}")
+    for size in args.sizes:
+        content = os.urandom(size * 1024 * 1024)
+        old_peak, old_t = measure(copying_path, io.BytesIO(content))
+        new_peak, new_t = measure(lambda u: zero_copy_path(u, args.getbuffer), io.BytesIO(content))
+        print(f"{size:>11} {old_peak / 2**20:>18.1f} {new_peak / 2**20:>20.1f} "
+              f"{1 - new_peak / old_peak:>6.0%} {old_t:>12.2f} {new_t:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
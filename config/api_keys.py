@@ -1,13 +1,25 @@
 """API key management for Mistral — pooled with rotation."""
 
 import os
+import time
+import sqlite3
+import hashlib
+import threading
 from typing import Optional
+from config.settings import JOBS_DB_PATH, MODE_REPLAY, PLACEHOLDER_KEY, REPLAY_MODE, USE_WORKERS
 from utils.logging_setup import get_logger
 
 logger = get_logger('config.api_keys')
 
 CONFIG_FILE_PATH = 'config.ini'
 
+_HEALTH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS key_health (
+    key_id TEXT PRIMARY KEY,
+    invalid_at REAL
+) WITHOUT ROWID;
+"""
+
 
 def _collect_keys() -> list[str]:
     """Collect all available API keys from all sources."""
@@ -51,15 +63,48 @@ def _collect_keys() -> list[str]:
         except Exception:
             pass
 
+    # 4. Replay mode needs no real key, only one slot in the rotation
+    if not keys and REPLAY_MODE == MODE_REPLAY:
+        keys.append(PLACEHOLDER_KEY)
+
     return keys
 
 
+def key_fingerprint(api_key: str) -> str:
+    """Stable, non-reversible key id for logs and the usage table."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:10] if api_key else ''
+
+
 class ApiKeyPool:
-    """Pool of API keys with round-robin rotation."""
+    """Pool of API keys with round-robin rotation.
+
+    Keys rejected by the API (401/403, see core.readiness) are marked invalid
+    and skipped by the extraction loop. With `shared_path` (worker mode: the
+    jobs database) the marks are stored in SQLite, so every worker process
+    skips a key as soon as any of them has found it invalid.
+    """
 
-    def __init__(self):
+    def __init__(self, shared_path: Optional[str] = None):
         self._index = 0
         self._keys = _collect_keys()
+        self._invalid = set()
+        self._shared_path = shared_path
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Connections must not cross fork(): reopen in a child process
+        if self._db is None or self._pid != os.getpid():
+            directory = os.path.dirname(self._shared_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self._shared_path, timeout=30.0, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_HEALTH_SCHEMA)
+            self._pid = os.getpid()
+        return self._db
 
     def refresh(self):
         self._keys = _collect_keys()
@@ -75,9 +120,49 @@ class ApiKeyPool:
         self._index = (self._index + 1) % len(self._keys)
         return self._keys[self._index]
 
+    def mark_invalid(self, api_key: str) -> None:
+        self._invalid.add(api_key)
+        if self._shared_path:
+            self._write_health(
+                "INSERT OR REPLACE INTO key_health (key_id, invalid_at) VALUES (?, ?)",
+                (key_fingerprint(api_key), time.time()),
+            )
+
+    def mark_healthy(self, api_key: str) -> None:
+        """Clear an invalid mark, e.g. after the key answered a ping again."""
+        self._invalid.discard(api_key)
+        if self._shared_path:
+            self._write_health("DELETE FROM key_health WHERE key_id = ?", (key_fingerprint(api_key),))
+
+    def is_healthy(self, api_key: str) -> bool:
+        if api_key in self._invalid:
+            return False
+        if not self._shared_path:
+            return True
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT 1 FROM key_health WHERE key_id = ?", (key_fingerprint(api_key),),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read shared key health: {e}")
+            return True
+        return row is None
+
+    def _write_health(self, sql: str, params: tuple) -> None:
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(sql, params)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to store shared key health: {e}")
+
+    @property
+    def keys(self) -> list[str]:
+        return list(self._keys)
+
     @property
     def size(self) -> int:
         return len(self._keys)
 
 
-pool = ApiKeyPool()
+pool = ApiKeyPool(JOBS_DB_PATH if USE_WORKERS else None)
@@ -0,0 +1,73 @@
+"""Runtime settings — read from environment variables, then config.ini."""
+
+import os
+import configparser
+from typing import Any, Callable, Optional
+from utils.logging_setup import get_logger
+
+logger = get_logger('config.settings')
+
+CONFIG_FILE_PATH = 'config.ini'
+
+_config: Optional[configparser.ConfigParser] = None
+
+_TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def _load_config() -> configparser.ConfigParser:
+    global _config
+    if _config is None:
+        _config = configparser.ConfigParser()
+        if os.path.exists(CONFIG_FILE_PATH):
+            try:
+                _config.read(CONFIG_FILE_PATH, encoding='utf-8')
+            except Exception as e:
+                logger.warning(f"Failed to read {CONFIG_FILE_PATH}: {e}")
+    return _config
+
+
+def get_setting(section: str, name: str, default: Any = None, cast: Callable[[str], Any] = str) -> Any:
+    """Look up a setting: env var BBBG_<SECTION>_<NAME>, then config.ini [SECTION] name.
+
+    Returns `default` when the value is missing or cannot be cast.
+    """
+    env_name = f"BBBG_{section}_{name}".upper()
+    raw = os.environ.get(env_name)
+    if raw is None:
+        config = _load_config()
+        if config.has_option(section.upper(), name.lower()):
+            raw = config.get(section.upper(), name.lower())
+    if raw is None or str(raw).strip() == '':
+        return default
+    try:
+        return cast(str(raw).strip())
+    except (ValueError, TypeError):
+        logger.warning(f"Invalid value for {env_name}: {raw!r}, using default {default!r}")
+        return default
+
+
+def get_bool(section: str, name: str, default: bool = False) -> bool:
+    """Boolean setting — accepts 1/true/yes/on (case-insensitive)."""
+    return get_setting(section, name, default, cast=lambda v: v.lower() in _TRUE_VALUES)
+
+
+# Mistral models: the SDK adapter uses them as defaults, core.routing picks the chat tier
+OCR_MODEL = get_setting('MODELS', 'OCR', 'mistral-ocr-latest')
+SMALL_MODEL = get_setting('MODELS', 'SMALL', 'mistral-small-latest')
+LARGE_MODEL = get_setting('MODELS', 'LARGE', 'mistral-large-latest')
+
+# Worker mode: the job queue (core.jobs) and the shared rate limit buckets (sdk.rate_limit) use one database
+USE_WORKERS = get_bool('WORKERS', 'ENABLED', False)
+JOBS_DB_PATH = get_setting('WORKERS', 'PATH', 'jobs.db')
+
+# Record/replay of API responses (sdk.replay); the key pool needs the mode before any client exists
+MODE_OFF = 'off'
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+REPLAY_MODE = get_setting('REPLAY', 'MODE', MODE_OFF, str.lower)
+# Lets the key loop run once when replaying without any configured key
+PLACEHOLDER_KEY = 'replay-offline'
+
+if REPLAY_MODE not in (MODE_OFF, MODE_RECORD, MODE_REPLAY):
+    logger.warning(f"Unknown replay mode {REPLAY_MODE!r}, using {MODE_OFF!r}")
+    REPLAY_MODE = MODE_OFF
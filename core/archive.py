@@ -0,0 +1,326 @@
+"""Handover archive — every issued handover, searchable without reprocessing.
+
+Stores the extraction JSON, the grouped devices and the rendered .docx in
+SQLite. Exact lookups use B-tree indexes on the normalized shd, supplier
+(supplier_key, i.e. shorten_company_name without accents), model and
+serial; free text goes through an FTS5 index (accent-insensitive, prefix
+matching). Both stay sub-second at hundreds of thousands of records.
+
+A document (doc_id, the content key of the upload) is archived once: storing
+it again returns the existing record. Text is indexed and queried through
+strip_accents, so đ/Đ match d/D as the other diacritics do.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+from config.settings import get_bool, get_setting
+from core.fuzzy_group import canonicalize
+from core.models import GroupedDevice, parse_handover
+from core.profiles import supplier_key
+from core.serial_index import normalize_serial
+from utils.logging_setup import get_logger
+from utils.text import strip_accents
+
+logger = get_logger('core.archive')
+
+ARCHIVE_ENABLED = get_bool('ARCHIVE', 'ENABLED', True)
+ARCHIVE_PATH = get_setting('ARCHIVE', 'PATH', 'archive.db')
+DEFAULT_SEARCH_LIMIT = 50
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS handovers (
+    id INTEGER PRIMARY KEY,
+    doc_id TEXT,
+    filename TEXT,
+    shd TEXT,
+    shd_key TEXT,
+    shd_type TEXT,
+    cty TEXT,
+    cty_key TEXT,
+    device_count INTEGER,
+    created_at REAL,
+    data TEXT,
+    grouped TEXT,
+    docx_name TEXT,
+    docx BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_handovers_shd ON handovers (shd_key);
+CREATE INDEX IF NOT EXISTS idx_handovers_cty ON handovers (cty_key, created_at);
+CREATE TABLE IF NOT EXISTS archive_models (
+    model_key TEXT NOT NULL,
+    handover_id INTEGER NOT NULL,
+    PRIMARY KEY (model_key, handover_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS archive_serials (
+    serial_key TEXT NOT NULL,
+    handover_id INTEGER NOT NULL,
+    PRIMARY KEY (serial_key, handover_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS handover_fts USING fts5(
+    shd, cty, devices, serials,
+    content='', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+_FTS_SCHEMA = _SCHEMA[_SCHEMA.index("CREATE VIRTUAL TABLE"):]
+_DOC_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_handovers_doc ON handovers (doc_id) WHERE doc_id != ''"
+
+_SUMMARY_COLUMNS = "id, doc_id, filename, shd, shd_type, cty, device_count, created_at, docx_name"
+
+
+def shd_key(shd: str) -> str:
+    """Whitespace-free, uppercase, accent-free shd used for exact lookups ('HĐ 123' -> 'HD123')."""
+    return ''.join(strip_accents(shd or '').split()).upper()
+
+
+@dataclass
+class ArchiveEntry:
+    """One archived handover. `data`, `grouped` and `docx` are loaded by `get` only."""
+    id: int
+    doc_id: str
+    filename: str
+    shd: str
+    shd_type: str
+    cty: str
+    device_count: int
+    created_at: float
+    docx_name: str = ""
+    data: Optional[Dict[str, Any]] = None
+    grouped: Optional[List[Dict[str, Any]]] = None
+    docx: Optional[bytes] = None
+
+    def describe(self) -> str:
+        when = time.strftime('%d/%m/%Y', time.localtime(self.created_at))
+        return f"{when} · {self.shd_type} {self.shd or '?'} · {self.cty or '?'} · {self.device_count} thiết bị"
+
+
+def _fts_query(text: str) -> str:
+    """User text -> FTS5 query: every word must match, as a prefix."""
+    words = re.findall(r'\w+', strip_accents(text), flags=re.UNICODE)
+    return ' AND '.join(f'"{w}"*' for w in words)
+
+
+def _index_terms(handover) -> tuple:
+    """(model keys, serial keys, full-text row: shd, cty, devices, serials) of a parsed handover."""
+    model_keys = {canonicalize(d.model) for d in handover.ds if d.model}
+    serial_keys = {normalize_serial(s) for d in handover.ds for s in d.seri if s}
+    devices = ' '.join(f"{d.ttb} {d.model} {d.ref} {d.hang}" for d in handover.ds)
+    fts_row = (strip_accents(handover.shd), strip_accents(handover.cty), strip_accents(devices),
+               ' '.join(serial_keys))
+    return model_keys, serial_keys, fts_row
+
+
+class HandoverArchive:
+    """SQLite-backed archive. One connection, opened on first use, shared under a lock."""
+
+    def __init__(self, path: str = ARCHIVE_PATH):
+        self._path = path
+        self._lock = threading.RLock()
+        self._db = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self._path, timeout=30.0, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+            self._migrate(self._db)
+        return self._db
+
+    def _migrate(self, db: sqlite3.Connection) -> None:
+        """Bring an archive written by an older version up to SCHEMA_VERSION.
+
+        Version 1: a document used to be archived again on every UI rerun, and
+        đ was indexed as is. Keep the newest record per doc_id, recompute
+        shd_key, rebuild the (contentless) full-text index from the stored
+        JSON and make doc_id unique.
+        """
+        if db.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                stale = ("SELECT id FROM handovers WHERE doc_id != '' AND id NOT IN "
+                         "(SELECT MAX(id) FROM handovers WHERE doc_id != '' GROUP BY doc_id)")
+                db.execute(f"DELETE FROM archive_models WHERE handover_id IN ({stale})")
+                db.execute(f"DELETE FROM archive_serials WHERE handover_id IN ({stale})")
+                removed = db.execute(f"DELETE FROM handovers WHERE id IN ({stale})").rowcount
+                db.execute("DROP INDEX IF EXISTS idx_handovers_doc")
+                db.execute(_DOC_INDEX)
+                db.execute("DROP TABLE IF EXISTS handover_fts")
+                db.execute(_FTS_SCHEMA)
+                rows = db.execute("SELECT id, data FROM handovers").fetchall()
+                for handover_id, data in rows:
+                    handover = parse_handover(json.loads(data) if data else {})
+                    _, serial_keys, fts_row = _index_terms(handover)
+                    db.execute("UPDATE handovers SET shd_key = ? WHERE id = ?", (shd_key(handover.shd), handover_id))
+                    db.execute(
+                        "INSERT INTO handover_fts (rowid, shd, cty, devices, serials) VALUES (?, ?, ?, ?, ?)",
+                        (handover_id, *fts_row),
+                    )
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                if rows or removed:
+                    logger.info(f"Archive migrated to v{SCHEMA_VERSION}: {removed} duplicate(s) removed, "
+                                f"{len(rows)} record(s) reindexed")
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+
+    def store(
+        self,
+        doc_id: str,
+        filename: str,
+        data: Dict[str, Any],
+        grouped: List[GroupedDevice],
+        docx_name: str = "",
+        docx: Optional[bytes] = None,
+    ) -> int:
+        """Archive one handover; a doc_id already archived returns the existing record's id.
+
+        An existing record archived before its .docx was rendered gets `docx` attached.
+        """
+        handover = parse_handover(data)
+        model_keys, serial_keys, fts_row = _index_terms(handover)
+        with self._lock, self._conn:
+            if doc_id:
+                row = self._conn.execute("SELECT id FROM handovers WHERE doc_id = ?", (doc_id,)).fetchone()
+                if row is not None:
+                    if docx:
+                        self._conn.execute(
+                            "UPDATE handovers SET docx_name = ?, docx = ? WHERE id = ? AND docx IS NULL",
+                            (docx_name, sqlite3.Binary(docx), row[0]),
+                        )
+                    logger.debug(f"Handover {doc_id[:12]} already archived as {row[0]}")
+                    return row[0]
+            cur = self._conn.execute(
+                "INSERT INTO handovers (doc_id, filename, shd, shd_key, shd_type, cty, cty_key, device_count, "
+                "created_at, data, grouped, docx_name, docx) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc_id, filename, handover.shd, shd_key(handover.shd), handover.shd_type, handover.cty,
+                 supplier_key(handover.cty), len(handover.ds), time.time(),
+                 json.dumps(data, ensure_ascii=False),
+                 json.dumps([g.to_dict() for g in grouped], ensure_ascii=False),
+                 docx_name, sqlite3.Binary(docx) if docx else None),
+            )
+            handover_id = cur.lastrowid
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO archive_models (model_key, handover_id) VALUES (?, ?)",
+                [(k, handover_id) for k in model_keys],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO archive_serials (serial_key, handover_id) VALUES (?, ?)",
+                [(k, handover_id) for k in serial_keys],
+            )
+            self._conn.execute(
+                "INSERT INTO handover_fts (rowid, shd, cty, devices, serials) VALUES (?, ?, ?, ?, ?)",
+                (handover_id, *fts_row),
+            )
+        logger.info(f"Archived handover {handover_id}: shd={handover.shd!r}, {len(handover.ds)} devices")
+        return handover_id
+
+    def _entries(self, where: str, params: tuple, limit: int) -> List[ArchiveEntry]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_SUMMARY_COLUMNS} FROM handovers WHERE {where} ORDER BY created_at DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [ArchiveEntry(*row) for row in rows]
+
+    def by_shd(self, shd: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[ArchiveEntry]:
+        return self._entries("shd_key = ?", (shd_key(shd),), limit)
+
+    def by_company(self, cty: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[ArchiveEntry]:
+        return self._entries("cty_key = ?", (supplier_key(cty),), limit)
+
+    def by_model(self, model: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[ArchiveEntry]:
+        return self._entries(
+            "id IN (SELECT handover_id FROM archive_models WHERE model_key = ?)", (canonicalize(model),), limit)
+
+    def by_serial(self, serial: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[ArchiveEntry]:
+        return self._entries(
+            "id IN (SELECT handover_id FROM archive_serials WHERE serial_key = ?)", (normalize_serial(serial),), limit)
+
+    def search(self, text: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[ArchiveEntry]:
+        """Exact shd/serial/model/company matches first, then free-text (FTS) matches."""
+        text = text.strip()
+        if not text:
+            return []
+        found: Dict[int, ArchiveEntry] = {}
+        for lookup in (self.by_shd, self.by_serial, self.by_model, self.by_company):
+            for entry in lookup(text, limit):
+                found.setdefault(entry.id, entry)
+        query = _fts_query(text)
+        if query and len(found) < limit:
+            try:
+                fts = self._entries(
+                    "id IN (SELECT rowid FROM handover_fts WHERE handover_fts MATCH ? LIMIT ?)",
+                    (query, limit * 4), limit)
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Archive full-text query {query!r} failed: {e}")
+                fts = []
+            for entry in fts:
+                found.setdefault(entry.id, entry)
+        return list(found.values())[:limit]
+
+    def get(self, handover_id: int) -> Optional[ArchiveEntry]:
+        """Full record, including the extraction JSON, grouped devices and .docx."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_SUMMARY_COLUMNS}, data, grouped, docx FROM handovers WHERE id = ?", (handover_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        entry = ArchiveEntry(*row[:9])
+        entry.data = json.loads(row[9]) if row[9] else None
+        entry.grouped = json.loads(row[10]) if row[10] else None
+        entry.docx = row[11]
+        return entry
+
+    def load_docx(self, handover_id: int) -> Optional[bytes]:
+        """Only the archived .docx, without decoding the JSON columns."""
+        with self._lock:
+            row = self._conn.execute("SELECT docx FROM handovers WHERE id = ?", (handover_id,)).fetchone()
+        return row[0] if row else None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM handovers").fetchone()[0]
+
+
+archive = HandoverArchive()
+
+
+def archive_handover(
+    doc_id: str,
+    source_name: str,
+    data: Dict[str, Any],
+    grouped: List[GroupedDevice],
+    outputs: Sequence[Any],
+) -> Optional[int]:
+    """Archive a handover with its rendered .docx, if one was among `outputs`.
+
+    `outputs` are RenderedOutput (BytesIO content) or JobOutput (bytes). The
+    documents are already issued, so archive errors are only logged.
+    """
+    if not ARCHIVE_ENABLED:
+        return None
+    docx = next((o for o in outputs if o.format == 'docx'), None)
+    content = None
+    if docx is not None:
+        content = docx.content.getvalue() if hasattr(docx.content, 'getvalue') else bytes(docx.content)
+    try:
+        return archive.store(doc_id, source_name, data, grouped,
+                             docx.filename if docx else "", content)
+    except sqlite3.Error as e:
+        logger.warning(f"Failed to archive {source_name}: {e}")
+        return None
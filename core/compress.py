@@ -0,0 +1,161 @@
+"""OCR text compression — drop noise before the chat step.
+
+OCR markdown repeats page headers and footers on every page and carries
+image placeholders, page numbers, signature labels and legal preambles
+that the extraction never uses. This stage removes them, collapses
+whitespace and tightens markdown tables. Table rows are never dropped.
+Repeated lines are only looked for in the header/footer zone of each
+page, and role labels ("Đại diện bên giao") only after the last table,
+because a PDF text layer puts every table cell on its own line.
+In safe mode (the default) no rule removes a line holding a model- or
+serial-like token (letters and digits mixed, or a long digit run).
+"""
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Tuple
+from config.settings import get_bool
+from utils.text import strip_accents
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.compress')
+
+COMPRESSION_ENABLED = get_bool('COMPRESSION', 'ENABLED', True)
+SAFE_MODE = get_bool('COMPRESSION', 'SAFE', True)
+# Rough chars per token for Vietnamese/English OCR text, for the report only
+CHARS_PER_TOKEN = 3.5
+REPEAT_MAX_CHARS = 120          # longer repeated lines are content, not headers/footers
+EDGE_LINES = 4                  # header/footer zone: first and last non-empty lines of a page
+
+_IDENTIFIER_RE = re.compile(
+    r'\b(?=[\w\-/.]*\d)(?=[\w\-/.]*[A-Za-z])[A-Za-z0-9][\w\-/.]{2,}\b|\b\d{5,}\b'
+)
+_IMAGE_RE = re.compile(r'^!\[[^\]]*\]\([^)]*\)$')
+_PAGE_NUMBER_RE = re.compile(r'^(?:trang|page) \d+(?: (?:of|tren))? \d+$')      # matched on _key()
+_DASHED_NUMBER_RE = re.compile(r'^-\s*\d{1,3}\s*-$')
+_TABLE_SEPARATOR_RE = re.compile(r'^\|?\s*:?-{2,}:?\s*(?:\|\s*:?-{2,}:?\s*)*\|?$')
+_SPACES_RE = re.compile(r'[ \t ]+')
+
+# Matched on the whole accent-stripped line (punctuation removed)
+_SIGNATURE_HINTS = {'ky ghi ro ho ten', 'ky va ghi ro ho ten', 'ky ten dong dau', 'ky ho ten', 'ky dong dau',
+                    'ky ghi ro ho ten dong dau', 'ky ten va dong dau'}
+_ROLE_LABELS = {'dai dien ben giao', 'dai dien ben nhan', 'dai dien ben a', 'dai dien ben b', 'ben giao',
+                'ben nhan', 'giam doc', 'thu kho', 'nguoi giao', 'nguoi nhan', 'ke toan', 'nguoi lap'}
+_LEGAL_PREFIXES = ('can cu bo luat', 'can cu luat', 'can cu nghi dinh', 'can cu thong tu', 'can cu quyet dinh')
+_CLOSING_PREFIXES = ('bien ban duoc lap thanh', 'bien ban nay duoc lap thanh', 'bien ban lap xong')
+
+
+@dataclass
+class CompressionStats:
+    """Size of one document's chat input before and after compression."""
+    chars_before: int
+    chars_after: int
+    lines_removed: int
+
+    @property
+    def tokens_before(self) -> int:
+        return round(self.chars_before / CHARS_PER_TOKEN)
+
+    @property
+    def tokens_after(self) -> int:
+        return round(self.chars_after / CHARS_PER_TOKEN)
+
+    @property
+    def reduction(self) -> float:
+        return 1 - self.chars_after / self.chars_before if self.chars_before else 0.0
+
+    def describe(self) -> str:
+        return (f"~{self.tokens_before} -> ~{self.tokens_after} tokens ({self.reduction:.0%} less), "
+                f"{self.lines_removed} lines removed")
+
+
+def _key(line: str) -> str:
+    return ' '.join(re.sub(r'[^a-z0-9 ]+', ' ', strip_accents(line)).split())
+
+
+def has_identifier(line: str) -> bool:
+    """True if the line holds something that looks like a model, REF or serial number."""
+    return bool(_IDENTIFIER_RE.search(line))
+
+
+def _is_boilerplate(key: str, line: str) -> bool:
+    if _IMAGE_RE.match(line) or _DASHED_NUMBER_RE.match(line) or _PAGE_NUMBER_RE.match(key):
+        return True
+    return key in _SIGNATURE_HINTS or key.startswith(_LEGAL_PREFIXES) or key.startswith(_CLOSING_PREFIXES)
+
+
+def _edge_keys(page: str) -> List[str]:
+    """Keys of the short lines in a page's header/footer zone."""
+    lines = [line.strip() for line in page.splitlines() if line.strip()]
+    edges = lines[:EDGE_LINES] + lines[EDGE_LINES:][-EDGE_LINES:]
+    return list({_key(line) for line in edges if len(line) <= REPEAT_MAX_CHARS and not line.startswith('|')})
+
+
+def _normalize_table_row(line: str) -> str:
+    if _TABLE_SEPARATOR_RE.match(line):
+        cells = line.strip().strip('|').count('|') + 1
+        return '|' + '-|' * cells
+    cells = [c.strip() for c in line.strip().strip('|').split('|')]
+    return '|' + '|'.join(cells) + '|'
+
+
+def compress_pages(pages: List[str], safe: bool = SAFE_MODE) -> Tuple[str, CompressionStats]:
+    """Compress a document given as its page texts; returns (text, stats).
+
+    A single string without page boundaries is passed as one page: repeated
+    header/footer removal then has nothing to compare and is skipped.
+    """
+    # Header/footer lines: seen in the edge zone of at least two pages
+    edge_counts = Counter(k for page in pages for k in _edge_keys(page) if k)
+    repeated = {k for k, n in edge_counts.items() if n > 1}
+
+    lines = [_SPACES_RE.sub(' ', line).strip() for line in '\n\n'.join(pages).splitlines()]
+    table_rows = [i for i, line in enumerate(lines) if line.startswith('|')]
+    tables_end = table_rows[-1] if table_rows else len(lines)
+
+    out: List[str] = []
+    seen = set()
+    removed = 0
+    for i, line in enumerate(lines):
+        if not line:
+            if out and out[-1]:
+                out.append('')
+            continue
+        if line.startswith('|'):
+            row = _normalize_table_row(line)
+            if row.strip('|'):          # skip rows with only empty cells
+                out.append(row)
+            else:
+                removed += 1
+            continue
+        key = _key(line)
+        drop = (
+            _is_boilerplate(key, line)
+            or (key in repeated and key in seen)
+            or (i > tables_end and key in _ROLE_LABELS)
+        )
+        # Image placeholders ('![img-0.jpeg](img-0.jpeg)') carry no identifiers, whatever they look like
+        if drop and not (safe and has_identifier(line) and not _IMAGE_RE.match(line)):
+            removed += 1
+            continue
+        seen.add(key)
+        out.append(line)
+
+    compressed = '\n'.join(out).strip()
+    chars_before = sum(len(p) for p in pages)
+    return compressed, CompressionStats(chars_before, len(compressed), removed)
+
+
+def compress_ocr_text(text: str, safe: bool = SAFE_MODE) -> str:
+    """Compressed copy of one text without page boundaries."""
+    return compress_pages([text], safe)[0]
+
+
+def compress_for_chat(pages: List[str], doc_id: str = '') -> str:
+    """Compression stage between OCR and chat; logs the reduction per document."""
+    if not COMPRESSION_ENABLED or not any(pages):
+        return '\n\n'.join(pages)
+    compressed, stats = compress_pages(pages)
+    logger.info(f"Compressed OCR text: doc={doc_id[:12]} {stats.describe()} safe={SAFE_MODE}")
+    return compressed
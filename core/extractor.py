@@ -1,11 +1,27 @@
-"""AI extraction — Mistral OCR + chat with retry + key rotation."""
+"""AI extraction — OCR (Mistral or local, see sdk.ocr) + chat with retry + key rotation."""
 
 import json
 import time
-from typing import Optional, Dict, Any
+import hashlib
+from contextlib import ExitStack, closing
+from typing import Optional, Dict, Any, List
 from config.api_keys import pool
+from config.settings import get_bool, get_setting
+from core.models import handover_json_schema
+from core.table_parser import extract_table_from_pdf, find_pdf_tables, parse_markdown_tables
+from core.profiles import profile_store
+from core.compress import compress_for_chat
+from core.jobs import USE_WORKERS, job_queue
+from core.pages import EARLY_STOP, EarlyStop, PdfPageImages, drop_annex_pages
+from core.routing import LARGE, SMALL, RouteDecision, choose_tier, log_tier
+from core.singleflight import SingleFlight, content_key
+from core.usage import current_doc, usage_ledger, usage_scope
+from core.validation import needs_escalation, repair, validate_data
 from sdk.adapter import MistralAdapter, _parse_json_response
+from sdk.ocr import MistralOcrBackend, OcrBackend, is_transient, ocr_router
+from utils.image import prepare_for_ocr, sniff_mime_type
 from utils.logging_setup import get_logger
+from utils.profiling import profiled
 
 logger = get_logger('core.extractor')
 
@@ -17,6 +33,76 @@ SYSTEM_INSTRUCTION = (
     "Nếu không có thông tin, trả về null. Không thêm Markdown (```json)."
 )
 
+# Structured-output mode: the JSON shape is enforced by the schema, so the
+# system instruction only needs to set the role.
+STRUCTURED_SYSTEM_INSTRUCTION = (
+    "Bạn là một nhà phân tích tài liệu kỹ thuật. Trích xuất thông tin từ 'Biên bản bàn giao' "
+    "theo JSON schema được cung cấp."
+)
+
+HANDOVER_SCHEMA = handover_json_schema()
+
+PROMPT_TEMPLATE = """
+Hãy trích xuất thông tin từ Biên bản bàn giao và trả về JSON hợp lệ.
+
+**Cấu trúc JSON bắt buộc:**
+{
+  "shd": "Số định danh (số hợp đồng, PO, v.v.)",
+  "shd_type": "Loại: 'Hợp đồng', 'PO', 'Đề nghị', hoặc 'Khác'",
+  "cty": "Tên công ty bên giao",
+  "ds": [
+    {
+      "ttb": "Tên thiết bị",
+      "model": "Model (nếu có, không bao gồm số REF)",
+      "ref": "Số REF (Reference number, nếu có)",
+      "hang": "Hãng",
+      "nsx": "Nước sản xuất",
+      "dvt": "Đơn vị tính",
+      "sl": Số lượng (số nguyên),
+      "seri": ["danh sách số seri"] hoặc null,
+      "pk": ["danh sách phụ kiện"] hoặc null
+    }
+  ]
+}
+
+**Quy tắc quan trọng:**
+1. pk PHẢI là một ARRAY các chuỗi, ví dụ: ["Dây nguồn", "Cáp USB"]
+2. pk KHÔNG được gộp thành một chuỗi dài
+3. Nếu không có thông tin, trả về null
+4. KHÔNG có Markdown code block, chỉ trả về JSON thuần
+5. Đọc CHÍNH XÁC model/model number - cẩn thận với các số giống nhau (VD: 0/O, 1/I/l, 2/Z, 5/S, 6/G, 8/B)
+6. Nếu không chắc chắn, ghi lại như trong tài liệu
+7. Nhận diện chính xác số Seri và số REF (Reference number) của thiết bị nếu có.
+"""
+
+# Used in structured-output mode: the JSON shape comes from the schema,
+# so only the reading rules remain in the prompt.
+STRUCTURED_PROMPT_TEMPLATE = """
+Trích xuất thông tin từ Biên bản bàn giao.
+1. pk: mỗi phụ kiện là một phần tử, không gộp thành chuỗi dài.
+2. model không bao gồm số REF; ghi số REF vào trường ref.
+3. Đọc CHÍNH XÁC model và số seri - cẩn thận với các ký tự giống nhau (0/O, 1/I/l, 2/Z, 5/S, 6/G, 8/B). Nếu không chắc chắn, ghi lại như trong tài liệu.
+4. Thiếu thông tin: chuỗi rỗng; seri là danh sách rỗng; pk là null.
+"""
+
+USE_STRUCTURED_OUTPUT = get_bool('EXTRACTION', 'STRUCTURED_OUTPUT', True)
+
+# Local PDF table parses at or above this confidence skip the chat model.
+LOCAL_PARSE_MIN_CONFIDENCE = get_setting('LOCAL_PARSER', 'MIN_CONFIDENCE', 0.85, float)
+
+_flight = SingleFlight()
+
+
+def guess_mime_type(filename: str, data: Optional[bytes] = None) -> str:
+    """MIME type sent to OCR: from the content's magic bytes when given, else the file name."""
+    sniffed = sniff_mime_type(data) if data else None
+    if sniffed:
+        return sniffed
+    name = filename.lower()
+    if name.endswith('.pdf'):
+        return 'application/pdf'
+    return 'image/png' if name.endswith('.png') else 'image/jpeg'
+
 
 def extract_text_from_pdf(file_bytes: bytes) -> str:
     """Extract text from PDF using PyMuPDF (fitz) with fallback to pypdf."""
@@ -56,56 +142,203 @@ def extract_text_from_pdf(file_bytes: bytes) -> str:
     return ""
 
 
-def convert_pdf_to_images(file_bytes: bytes) -> list[bytes]:
-    """Convert PDF pages to a list of PNG image bytes using PyMuPDF."""
-    import fitz
-    images = []
+@profiled('extract', doc_id_from=lambda file_bytes, *args, **kwargs: content_key(file_bytes))
+def extract_from_image(
+    file_bytes: bytes,
+    mime_type: str,
+    prompt: str,
+    structured: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """Extract handover data, deduplicating concurrent requests for the same document.
+
+    Callers passing identical content (and options) while an extraction is
+    running wait for it and share its result instead of spending OCR/chat quota again.
+    API usage is attributed to the document's content hash (see core.usage).
+    """
+    doc_id = content_key(file_bytes)
+    option_key = hashlib.sha256(f"{mime_type}|{structured}|{prompt}".encode('utf-8')).hexdigest()[:16]
+    key = f"{doc_id}:{option_key}"
+    if USE_WORKERS:
+        # Worker processes share finished extractions through the job database
+        cached = job_queue.cached_result(key)
+        if cached is not None:
+            logger.info(f"Using cached extraction for {doc_id[:12]}")
+            return cached
+    with usage_scope(doc_id=doc_id):
+        data = _flight.do(key, lambda: _extract(file_bytes, mime_type, prompt, structured))
+    if USE_WORKERS and data:
+        job_queue.cache_result(key, data)
+    return data
+
+
+def extract_handover(file_bytes: bytes, mime_type: str) -> Optional[Dict[str, Any]]:
+    """Extract with the configured prompt mode (structured output or prompt-only JSON)."""
+    if USE_STRUCTURED_OUTPUT:
+        return extract_from_image(file_bytes, mime_type, STRUCTURED_PROMPT_TEMPLATE, structured=True)
+    return extract_from_image(file_bytes, mime_type, PROMPT_TEMPLATE)
+
+
+_KEY_ERROR_MARKERS = ("UNAUTHORIZED", "PERMISSION_DENIED", "API_KEY", "QUOTA", "RESOURCE_EXHAUSTED")
+
+
+def _is_key_error(error: Exception) -> bool:
+    """Auth or quota errors: the key itself is unusable, so retrying with it is pointless."""
+    if getattr(error, 'status_code', None) in (401, 402, 403):
+        return True
+    text = str(error).upper()
+    return any(marker in text for marker in _KEY_ERROR_MARKERS)
+
+
+def _chat(adapter: MistralAdapter, ocr_text: str, prompt: str, structured: bool, model: str):
+    """One chat call, parsed. Returns None for an empty reply; raises ValueError if unparsable."""
+    if structured:
+        text = adapter.chat_extract(
+            ocr_text, prompt, STRUCTURED_SYSTEM_INSTRUCTION,
+            response_schema=HANDOVER_SCHEMA, model=model,
+        )
+    else:
+        text = adapter.chat_extract(ocr_text, prompt, SYSTEM_INSTRUCTION, model=model)
+    if not text:
+        return None
+    return json.loads(text) if structured else _parse_json_response(text)
+
+
+def _ocr_pages(backend: OcrBackend, pdf_images, ocr_bytes: bytes, ocr_mime: str) -> List[str]:
+    """OCR a document with one backend: PDF page images one by one, or the single image."""
+    if not pdf_images:
+        return [backend.ocr(ocr_bytes, ocr_mime) or ""]
+    # OCR page by page; stop once the handover has ended (see core.pages)
+    pages = []
+    stopper = EarlyStop()
+    for i in range(len(pdf_images)):
+        logger.info(f"Running {backend.name} OCR on PDF page {i+1}/{len(pdf_images)}")
+        page_text = backend.ocr(pdf_images[i], 'image/png')
+        if not page_text:
+            raise ValueError(f"OCR returned empty content for page {i+1}")
+        keep, more = stopper.feed(page_text)
+        if keep:
+            pages.append(page_text)
+        if not more:
+            if i + 1 < len(pdf_images):
+                logger.info(f"Early stop after page {i+1}/{len(pdf_images)}: {stopper.reason}")
+            break
+    return pages
+
+
+def _budgeted(api_keys) -> List[str]:
+    """Keys with usage budget left, for the OCR router."""
+    return [k for k in api_keys if usage_ledger.key_has_budget(k)]
+
+
+def _local_ocr(pdf_images, ocr_bytes: bytes, ocr_mime: str) -> Optional[List[str]]:
+    """Pages read by the local engine, or None if it failed."""
     try:
-        doc = fitz.open(stream=file_bytes, filetype="pdf")
-        for page in doc:
-            pix = page.get_pixmap(dpi=150)
-            img_data = pix.tobytes("png")
-            images.append(img_data)
-        logger.info(f"Successfully converted PDF to {len(images)} images.")
+        pages = _ocr_pages(ocr_router.local, pdf_images, ocr_bytes, ocr_mime)
     except Exception as e:
-        logger.error(f"Error converting PDF to images: {e}")
-    return images
+        logger.warning(f"Local OCR failed: {type(e).__name__}: {e}")
+        return None
+    return pages if any(pages) else None
 
 
-def extract_from_image(
+def _extract(
     file_bytes: bytes,
     mime_type: str,
     prompt: str,
+    structured: bool = False,
 ) -> Optional[Dict[str, Any]]:
     """Two-step extraction: PDF text extraction (or PDF page-by-page image OCR) -> chat model JSON parsing.
 
+    With `structured=True` the chat step runs in JSON-schema mode (see HANDOVER_SCHEMA)
+    and the reply is parsed directly, without markdown fence stripping.
     Tries multiple API keys on quota errors.
     Returns parsed JSON dict or None.
     """
+    # Rendered page images keep the PDF open; close it however the extraction ends
+    with ExitStack() as resources:
+        return _extract_document(file_bytes, mime_type, prompt, structured, resources)
+
+
+def _extract_document(
+    file_bytes: bytes,
+    mime_type: str,
+    prompt: str,
+    structured: bool,
+    resources: ExitStack,
+) -> Optional[Dict[str, Any]]:
+    """Body of `_extract`; documents opened for page rendering are registered on `resources`."""
     last_error = None
 
     # Step 0: Try direct PDF text extraction if it's a PDF
     ocr_text = ""
     pdf_images = []
+    source_tables = []
     if mime_type == 'application/pdf':
+        if EARLY_STOP:
+            # Annex pages after the signature block never reach table parsing, OCR or chat
+            try:
+                file_bytes = drop_annex_pages(file_bytes)
+            except Exception as e:
+                logger.warning(f"Annex page detection failed: {type(e).__name__}: {e}")
         try:
             ocr_text = extract_text_from_pdf(file_bytes)
         except Exception as e:
             logger.warning(f"Direct PDF text extraction failed: {e}")
 
-        # If no direct text was found, convert PDF to images for page-by-page OCR
+        # Digital PDF: try the deterministic table parser before any API call
+        if ocr_text:
+            try:
+                source_tables = find_pdf_tables(file_bytes)
+            except Exception as e:
+                logger.warning(f"PDF table detection failed: {type(e).__name__}: {e}")
+            local = extract_table_from_pdf(file_bytes, ocr_text, source_tables)
+            if local and local.confidence >= LOCAL_PARSE_MIN_CONFIDENCE:
+                logger.info(f"Using local PDF table parse (confidence={local.confidence}), skipping LLM")
+                return local.data
+            if local:
+                logger.info(f"Local parse confidence {local.confidence} below "
+                            f"{LOCAL_PARSE_MIN_CONFIDENCE}, trying supplier profile")
+            profile_result = profile_store.parse(ocr_text, source_tables)
+            if profile_result:
+                logger.info(f"Using {profile_result.source} parse "
+                            f"(confidence={profile_result.confidence}), skipping LLM")
+                return profile_result.data
+
+        # If no direct text was found, OCR page images; each page is rendered when first needed
         if not ocr_text:
             try:
-                pdf_images = convert_pdf_to_images(file_bytes)
+                pdf_images = resources.enter_context(closing(PdfPageImages(file_bytes)))
             except Exception as e:
-                logger.warning(f"Failed to convert PDF to images: {e}")
+                logger.warning(f"Failed to open PDF for rendering: {e}")
+
+    # Photos: downscale/crop/re-encode once, before any OCR attempt
+    ocr_bytes, ocr_mime = file_bytes, mime_type
+    if mime_type != 'application/pdf':
+        ocr_bytes, ocr_mime = prepare_for_ocr(file_bytes, mime_type)
+
+    # Scans and photos: Mistral or the local engine, by key availability, latency and scan quality
+    needs_ocr = not ocr_text and (bool(pdf_images) or mime_type != 'application/pdf')
+    quality, local_pages = None, None
+    if needs_ocr:
+        quality = ocr_router.scan_quality(pdf_images[0] if pdf_images else ocr_bytes)
+        route = ocr_router.choose(quality, _budgeted(pool.keys))
+        logger.info(f"OCR backend: {route.backend} ({route.reason}, scan quality={quality})")
+        if route.local:
+            local_pages = _local_ocr(pdf_images, ocr_bytes, ocr_mime)
 
     for attempt in range(pool.size):
         api_key = pool.get_current()
         if not api_key:
             break
+        if not pool.is_healthy(api_key):
+            pool.rotate()
+            continue
+        if not usage_ledger.key_has_budget(api_key):
+            logger.warning(f"Key index {pool._index} is over its usage budget, rotating...")
+            last_error = last_error or "usage budget exhausted"
+            pool.rotate()
+            continue
 
-        adapter = MistralAdapter(api_key)
+        adapter = MistralAdapter(api_key, on_usage=usage_ledger.record)
         if not adapter.is_available:
             pool.rotate()
             continue
@@ -113,36 +346,79 @@ def extract_from_image(
         try:
             # Step 1: Get text (either already extracted, via page-by-page OCR, or single image OCR)
             current_ocr_text = ocr_text
+            ocr_pages = [ocr_text]
             if not current_ocr_text:
-                if mime_type == 'application/pdf' and pdf_images:
-                    # Run OCR on each page image and combine
-                    ocr_parts = []
-                    for i, img_bytes in enumerate(pdf_images):
-                        logger.info(f"Running OCR on PDF page {i+1}/{len(pdf_images)}")
-                        page_text = adapter.ocr_document(img_bytes, 'image/png')
-                        if page_text:
-                            ocr_parts.append(page_text)
-                        else:
-                            raise ValueError(f"OCR returned empty content for page {i+1}")
-                    current_ocr_text = "\n\n".join(ocr_parts)
-                else:
-                    # Normal single image OCR
-                    current_ocr_text = adapter.ocr_document(file_bytes, mime_type)
+                if local_pages is None:
+                    try:
+                        ocr_pages = _ocr_pages(MistralOcrBackend(adapter), pdf_images, ocr_bytes, ocr_mime)
+                    except Exception as e:
+                        # Every key throttled or the network failing: a clean scan is read locally
+                        others = _budgeted(k for k in pool.keys if k != api_key)
+                        if not (is_transient(e) and ocr_router.can_fall_back(quality)
+                                and not ocr_router.keys_ready(others)):
+                            raise
+                        logger.warning(f"Mistral OCR failed ({type(e).__name__}), falling back to local OCR")
+                        local_pages = _local_ocr(pdf_images, ocr_bytes, ocr_mime)
+                        if local_pages is None:
+                            raise
+                if local_pages is not None:
+                    ocr_pages = local_pages
+                current_ocr_text = "\n\n".join(ocr_pages)
 
             if not current_ocr_text:
                 pool.rotate()
                 continue
 
-            # Step 2: Chat extraction
-            text = adapter.chat_extract(current_ocr_text, prompt, SYSTEM_INSTRUCTION)
-            if not text:
-                pool.rotate()
-                continue
+            # OCR markdown: a known supplier layout may parse without the chat model
+            tables = source_tables if ocr_text else parse_markdown_tables(current_ocr_text)
+            if not ocr_text:
+                profile_result = profile_store.parse(current_ocr_text, tables)
+                if profile_result:
+                    logger.info(f"Using {profile_result.source} parse "
+                                f"(confidence={profile_result.confidence}), skipping LLM")
+                    return profile_result.data
+
+            # Chat input without repeated headers/footers and boilerplate (see core.compress)
+            chat_text = compress_for_chat(ocr_pages, current_doc())
+
+            # Step 2: Chat extraction, on the small tier first when the document is easy
+            decision = choose_tier(chat_text, tables)
+            started = time.perf_counter()
+            data, escalated, issues = None, False, None
+            if decision.tier is SMALL:
+                try:
+                    data = _chat(adapter, chat_text, prompt, structured, SMALL.model)
+                    issues = validate_data(data)
+                    rejected = needs_escalation(issues, len(data.get('ds') or []) if isinstance(data, dict) else 0)
+                except ValueError as e:  # includes JSONDecodeError
+                    issues, rejected = None, True
+                    logger.info(f"Small tier reply unparsable: {e}")
+                except Exception as e:
+                    # Rate limit, timeout or unavailable small model: the large tier may still work
+                    # with this key; only key-level errors go on to rotation
+                    if _is_key_error(e):
+                        raise
+                    issues, rejected = None, True
+                    logger.warning(f"Small tier call failed: {type(e).__name__}: {e}")
+                profile_store.record_tier(decision.supplier, not rejected)
+                if rejected:
+                    logger.info(f"Small tier reply rejected ({'; '.join(i.message for i in (issues or [])[:3])}), "
+                                f"escalating")
+                    decision, escalated = RouteDecision(LARGE, "small tier failed validation", decision.supplier), True
+                    issues = None
+            if decision.tier is LARGE:
+                data = _chat(adapter, chat_text, prompt, structured, LARGE.model)
+            log_tier(current_doc(), decision, started, escalated)
+
+            if isinstance(data, dict) and data.get('ds'):
+                # Targeted follow-ups for failing devices instead of a full retry
+                data = repair(adapter, data, current_ocr_text, structured, issues)
 
-            data = _parse_json_response(text)
             if data:
                 logger.info(f"Successfully extracted data with key index {pool._index}")
+                profile_store.learn(data, tables)
                 return data
+            pool.rotate()
 
         except Exception as e:
             last_error = str(e)
@@ -161,6 +437,19 @@ def extract_from_image(
             pool.rotate()
             continue
 
+    # No key got through: a locally read scan can still match a known supplier layout
+    if needs_ocr and ocr_router.can_fall_back(quality):
+        if local_pages is None:
+            local_pages = _local_ocr(pdf_images, ocr_bytes, ocr_mime)
+        if local_pages:
+            local_text = "\n\n".join(local_pages)
+            profile_result = profile_store.parse(local_text, parse_markdown_tables(local_text))
+            if profile_result:
+                logger.info(f"Using {profile_result.source} parse of local OCR "
+                            f"(confidence={profile_result.confidence})")
+                return profile_result.data
+            logger.warning("Local OCR text matched no supplier profile and no key is left for the chat step")
+
     if last_error:
         logger.error(f"All keys failed: {last_error}")
     return None
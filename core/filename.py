@@ -3,6 +3,7 @@
 import re
 from typing import List, Dict, Any
 from core.models import GroupedDevice
+from utils.profiling import profiled
 from utils.text import clean_filename, shorten_company_name
 
 MAX_DEVICES_IN_FILENAME = 2
@@ -36,6 +37,7 @@ def _build_shd_part(shd_value: str) -> str:
     return clean_filename(main_part) if main_part else "SoDinhDanh"
 
 
+@profiled('generate_filename')
 def generate_filename(data: Dict[str, Any], grouped_devices: List[GroupedDevice]) -> str:
     """Generate a descriptive filename like: 01_MayQuetTayCongNghe_ABC_12345.docx"""
     if not grouped_devices:
@@ -0,0 +1,202 @@
+"""OCR-aware fuzzy grouping — merges devices whose model differs only by OCR noise.
+
+Two passes, both close to linear in the number of devices:
+1. Exact grouping on canonical keys, where confusable characters
+   (O/0, I/l/1, S/5, B/8, Z/2, G/6) and separators are folded.
+2. Near-duplicate merging between the canonical groups: candidates come from
+   a character n-gram index on the canonical model (frequent grams are
+   skipped), and only candidate pairs are scored with difflib.
+"""
+
+import difflib
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import List, Dict, Tuple
+from config.settings import get_bool, get_setting
+from core.group import _format_seri, _make_pk_key, group_devices
+from core.models import Device, GroupedDevice
+from utils.text import standardize_string
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.fuzzy_group')
+
+FUZZY_GROUPING = get_bool('GROUPING', 'FUZZY', False)
+SIMILARITY_THRESHOLD = get_setting('GROUPING', 'SIMILARITY', 0.88, float)
+NGRAM_SIZE = 3
+MIN_FUZZY_MODEL_LEN = 5    # shorter models are too ambiguous to merge by similarity
+MAX_POSTING_LIST = 200     # grams shared by more groups than this carry no signal
+MIN_SHARED_GRAM_RATIO = 0.5
+
+_CONFUSABLES = str.maketrans({
+    'O': '0',
+    'I': '1', 'L': '1',
+    'S': '5', 'B': '8', 'Z': '2', 'G': '6',
+})
+_SEPARATORS = str.maketrans('', '', ' -_./\\')
+
+
+def canonicalize(value: str) -> str:
+    """Fold separators and OCR-confusable characters, e.g. 'hem-7I2O' -> 'HEM7120'."""
+    return str(value or '').upper().translate(_SEPARATORS).translate(_CONFUSABLES)
+
+
+@dataclass
+class GroupMerge:
+    """One merge performed by fuzzy grouping, for review."""
+    kept: str
+    merged: List[str]
+    reason: str          # 'confusable' (canonical keys equal) or 'similar'
+    similarity: float
+
+    def describe(self) -> str:
+        return f"Gộp model {', '.join(self.merged)} vào {self.kept} ({self.reason}, {self.similarity:.2f})"
+
+
+def _canonical_key(device: Device) -> tuple:
+    return (
+        standardize_string(device.ttb),
+        canonicalize(device.model),
+        canonicalize(device.ref),
+        canonicalize(device.hang),
+        standardize_string(device.nsx),
+        standardize_string(device.dvt),
+        _make_pk_key(device.pk),
+    )
+
+
+def _ngrams(text: str) -> set:
+    padded = f"^{text}$"
+    return {padded[i:i + NGRAM_SIZE] for i in range(max(1, len(padded) - NGRAM_SIZE + 1))}
+
+
+def _compatible(a: tuple, b: tuple) -> bool:
+    """Same ttb/nsx/dvt/pk; ref and hang equal or missing on one side."""
+    (ttb_a, _, ref_a, hang_a, nsx_a, dvt_a, pk_a) = a
+    (ttb_b, _, ref_b, hang_b, nsx_b, dvt_b, pk_b) = b
+    return (
+        ttb_a == ttb_b and nsx_a == nsx_b and dvt_a == dvt_b and pk_a == pk_b
+        and (not ref_a or not ref_b or ref_a == ref_b)
+        and (not hang_a or not hang_b or hang_a == hang_b)
+    )
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def _is_affix_variant(matcher: difflib.SequenceMatcher) -> bool:
+    """True when the models differ by an added/removed prefix or suffix.
+
+    'HEM-7120' vs 'HEM-7120A' is usually a different model variant, not OCR noise.
+    """
+    ops = [op for op in matcher.get_opcodes() if op[0] != 'equal']
+    len_a, len_b = len(matcher.a), len(matcher.b)
+    for tag, i1, i2, j1, j2 in ops:
+        if tag in ('insert', 'delete') and (i1 == 0 and j1 == 0 or i2 == len_a and j2 == len_b):
+            return True
+    return False
+
+
+def _similar_pairs(keys: List[tuple], threshold: float) -> List[Tuple[int, int, float]]:
+    """Candidate pairs scored with difflib.
+
+    Keys are blocked by (ttb, nsx, dvt, pk), which must match anyway; within
+    a block, candidates come from an n-gram index on the canonical model.
+    """
+    blocks: Dict[tuple, List[int]] = defaultdict(list)
+    for i, key in enumerate(keys):
+        if len(key[1]) >= MIN_FUZZY_MODEL_LEN:
+            blocks[(key[0], key[4], key[5], key[6])].append(i)
+
+    pairs = []
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        grams = {i: _ngrams(keys[i][1]) for i in members}
+        index: Dict[str, List[int]] = defaultdict(list)
+        for i in members:
+            for gram in grams[i]:
+                index[gram].append(i)
+
+        for i in members:
+            shared = Counter()
+            for gram in grams[i]:
+                posting = index[gram]
+                if len(posting) <= MAX_POSTING_LIST:
+                    shared.update(j for j in posting if j > i)
+            for j, count in shared.items():
+                if count < MIN_SHARED_GRAM_RATIO * min(len(grams[i]), len(grams[j])):
+                    continue
+                if not _compatible(keys[i], keys[j]):
+                    continue
+                matcher = difflib.SequenceMatcher(None, keys[i][1], keys[j][1])
+                ratio = matcher.ratio()
+                if ratio >= threshold and not _is_affix_variant(matcher):
+                    pairs.append((i, j, ratio))
+    return pairs
+
+
+def group_devices_fuzzy(
+    devices: List[Device],
+    threshold: float = SIMILARITY_THRESHOLD,
+) -> Tuple[List[GroupedDevice], List[GroupMerge]]:
+    """Group devices tolerating OCR confusions. Returns (groups, merges performed).
+
+    Each group shows the most frequent original spelling of its attributes.
+    """
+    clusters: Dict[tuple, List[Device]] = {}
+    for device in devices:
+        clusters.setdefault(_canonical_key(device), []).append(device)
+
+    keys = list(clusters)
+    uf = _UnionFind(len(keys))
+    pairs = _similar_pairs(keys, threshold)
+    for i, j, _ in pairs:
+        uf.union(i, j)
+    lowest_ratio: Dict[int, float] = {}
+    for i, _, ratio in pairs:
+        root = uf.find(i)
+        lowest_ratio[root] = min(lowest_ratio.get(root, 1.0), ratio)
+
+    merged: Dict[int, List[Device]] = {}
+    for i, key in enumerate(keys):
+        merged.setdefault(uf.find(i), []).extend(clusters[key])
+
+    groups, merges = [], []
+    for root, members in merged.items():
+        spellings = Counter((d.ttb, d.model, d.ref, d.hang, d.nsx, d.dvt) for d in members)
+        ttb, model, ref, hang, nsx, dvt = spellings.most_common(1)[0][0]
+        seri = set()
+        for d in members:
+            seri.update(d.seri)
+        groups.append(GroupedDevice(
+            ttb=ttb, model=model, ref=ref, hang=hang, nsx=nsx, dvt=dvt,
+            sl=sum(d.sl for d in members), pk=members[0].pk, seri_text=_format_seri(seri),
+        ))
+        variants = sorted({d.model for d in members} - {model})
+        if variants:
+            reason = 'similar' if root in lowest_ratio else 'confusable'
+            merges.append(GroupMerge(model, variants, reason, lowest_ratio.get(root, 1.0)))
+
+    for m in merges:
+        logger.info(m.describe())
+    return groups, merges
+
+
+def group_for_output(devices: List[Device]) -> Tuple[List[GroupedDevice], List[GroupMerge]]:
+    """Group with the configured mode ([GROUPING] fuzzy); exact grouping reports no merges."""
+    if FUZZY_GROUPING:
+        return group_devices_fuzzy(devices)
+    return group_devices(devices), []
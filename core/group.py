@@ -3,6 +3,7 @@
 import json
 from typing import List, Dict, Any
 from core.models import Device, GroupedDevice
+from utils.profiling import profiled
 from utils.text import standardize_string
 
 MAX_SERI_DISPLAY = 100
@@ -16,7 +17,7 @@ def _make_pk_key(pk: Any) -> str:
     """
     if pk is None:
         return "None"
-    if isinstance(pk, list):
+    if isinstance(pk, (list, tuple)):
         if not pk:
             return "[]"
         try:
@@ -42,40 +43,60 @@ def _make_group_key(device: Device) -> tuple:
     )
 
 
+class DeviceGrouper:
+    """Incremental grouping: feed device lists as they arrive, read groups at any time.
+
+    Quantities are summed and serials merged as sets, so feeding several
+    documents gives the same groups as grouping their concatenated lists.
+    Not thread-safe; feed it from one consumer thread.
+    """
+
+    def __init__(self):
+        self._groups: Dict[tuple, Dict[str, Any]] = {}
+
+    def add(self, devices: List[Device]) -> 'DeviceGrouper':
+        for device in devices:
+            group_key = _make_group_key(device)
+            group = self._groups.get(group_key)
+            if group is None:
+                self._groups[group_key] = {
+                    'ttb': device.ttb,
+                    'model': device.model,
+                    'ref': device.ref,
+                    'hang': device.hang,
+                    'nsx': device.nsx,
+                    'dvt': device.dvt,
+                    'pk_raw': device.pk,
+                    'total_sl': device.sl,
+                    'seri': set(device.seri),
+                }
+            else:
+                group['total_sl'] += device.sl
+                group['seri'].update(device.seri)
+        return self
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def result(self, factory=GroupedDevice) -> List[GroupedDevice]:
+        """Groups as `factory` instances (GroupedDevice, or CompactGroupedDevice to keep in memory)."""
+        return [
+            factory(
+                ttb=gd['ttb'], model=gd['model'], ref=gd['ref'], hang=gd['hang'],
+                nsx=gd['nsx'], dvt=gd['dvt'], sl=gd['total_sl'],
+                pk=gd['pk_raw'], seri_text=_format_seri(gd['seri']),
+            )
+            for gd in self._groups.values()
+        ]
+
+
+@profiled('group_devices')
 def group_devices(devices: List[Device]) -> List[GroupedDevice]:
     """Group identical devices by (ttb, model, ref, hang, nsx, dvt, pk).
 
     Merges quantities and collects unique serial numbers.
     """
-    grouped: Dict[tuple, Dict[str, Any]] = {}
-
-    for device in devices:
-        group_key = _make_group_key(device)
-
-        if group_key not in grouped:
-            grouped[group_key] = {
-                'ttb': device.ttb,
-                'model': device.model,
-                'ref': device.ref,
-                'hang': device.hang,
-                'nsx': device.nsx,
-                'dvt': device.dvt,
-                'pk_raw': device.pk,
-                'total_sl': device.sl,
-                'seri': set(device.seri),
-            }
-        else:
-            grouped[group_key]['total_sl'] += device.sl
-            grouped[group_key]['seri'].update(device.seri)
-
-    return [
-        GroupedDevice(
-            ttb=gd['ttb'], model=gd['model'], ref=gd['ref'], hang=gd['hang'],
-            nsx=gd['nsx'], dvt=gd['dvt'], sl=gd['total_sl'],
-            pk=gd['pk_raw'], seri_text=_format_seri(gd['seri']),
-        )
-        for gd in grouped.values()
-    ]
+    return DeviceGrouper().add(devices).result()
 
 
 def _format_seri(seri_set: set) -> str:
@@ -0,0 +1,241 @@
+"""Job queue — extraction jobs shared between the UI and worker processes.
+
+The UI submits uploads as jobs and polls for their results; worker
+processes (worker.py) claim queued jobs, extract, group and render them,
+and store the outputs. Finished extractions are also kept in a result cache
+keyed by content hash, so the same document is never extracted twice by
+any process. Everything lives in one SQLite database in WAL mode.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from config.settings import JOBS_DB_PATH, USE_WORKERS, get_setting  # noqa: F401
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.jobs')
+
+# A running job not finished within this many seconds is assumed lost and requeued
+JOB_TIMEOUT = get_setting('WORKERS', 'JOB_TIMEOUT', 600.0, float)
+MAX_ATTEMPTS = get_setting('WORKERS', 'MAX_ATTEMPTS', 2, int)
+# Cached extraction results older than this many seconds are ignored and deleted
+RESULT_CACHE_TTL = get_setting('WORKERS', 'CACHE_TTL', 7 * 86400.0, float)
+BUSY_TIMEOUT = 30.0
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+PRIORITY_UI = 0
+PRIORITY_BATCH = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    doc_id TEXT,
+    filename TEXT,
+    mime TEXT,
+    formats TEXT,
+    priority INTEGER DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER DEFAULT 0,
+    payload BLOB,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    created_at REAL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, priority, created_at);
+CREATE TABLE IF NOT EXISTS job_outputs (
+    job_id TEXT NOT NULL,
+    format TEXT NOT NULL,
+    filename TEXT,
+    mime TEXT,
+    content BLOB,
+    PRIMARY KEY (job_id, format)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS result_cache (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created_at REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_result_cache_age ON result_cache (created_at);
+"""
+
+
+@dataclass
+class JobOutput:
+    format: str
+    filename: str
+    mime: str
+    content: bytes
+
+
+@dataclass
+class Job:
+    """One queued document. `result` is the JSON written by the worker."""
+    id: str
+    doc_id: str
+    filename: str
+    mime: str
+    formats: List[str]
+    priority: int
+    status: str
+    attempts: int = 0
+    payload: Optional[bytes] = None
+    result: Optional[Dict[str, Any]] = None
+    error: str = ""
+    outputs: List[JobOutput] = field(default_factory=list)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (STATUS_DONE, STATUS_FAILED)
+
+
+class JobQueue:
+    """SQLite-backed queue. One connection per process, opened on first use, shared under a lock."""
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self._path = path
+        self._lock = threading.RLock()
+        self._db = None
+        self._pid = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Connections must not cross fork(): reopen in a child process
+        if self._db is None or self._pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self._path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+            self._pid = os.getpid()
+        return self._db
+
+    def submit(self, filename: str, data: bytes, mime: str, doc_id: str,
+               formats: List[str], priority: int = PRIORITY_UI) -> str:
+        """Queue a document; returns the job id."""
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, doc_id, filename, mime, formats, priority, status, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, doc_id, filename, mime, json.dumps(list(formats)), priority,
+                 STATUS_QUEUED, sqlite3.Binary(data), time.time()),
+            )
+        logger.info(f"Queued job {job_id[:8]} ({filename})")
+        return job_id
+
+    def claim(self, worker: str) -> Optional[Job]:
+        """Atomically take the most urgent queued job (or a timed-out running one).
+
+        Timed-out running jobs that have used up MAX_ATTEMPTS are marked failed
+        in the same transaction, so a document that keeps killing its worker
+        does not stay "running" forever; cached results past RESULT_CACHE_TTL
+        are deleted.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            abandoned = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, payload = NULL, finished_at = ? "
+                "WHERE status = ? AND started_at < ? AND attempts >= ?",
+                (STATUS_FAILED, f"timed out after {MAX_ATTEMPTS} attempts", now,
+                 STATUS_RUNNING, now - JOB_TIMEOUT, MAX_ATTEMPTS),
+            ).rowcount
+            if abandoned:
+                logger.warning(f"Failed {abandoned} job(s) that timed out {MAX_ATTEMPTS} times")
+            self._conn.execute("DELETE FROM result_cache WHERE created_at < ?", (now - RESULT_CACHE_TTL,))
+            row = self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, started_at = ?, attempts = attempts + 1 "
+                "WHERE id = (SELECT id FROM jobs WHERE status = ? "
+                "   OR (status = ? AND started_at < ? AND attempts < ?) "
+                "   ORDER BY priority, created_at LIMIT 1) "
+                "RETURNING id, doc_id, filename, mime, formats, priority, status, attempts, payload",
+                (STATUS_RUNNING, worker, now, STATUS_QUEUED,
+                 STATUS_RUNNING, now - JOB_TIMEOUT, MAX_ATTEMPTS),
+            ).fetchone()
+        if row is None:
+            return None
+        return Job(row[0], row[1], row[2], row[3], json.loads(row[4] or '[]'), row[5], row[6], row[7], row[8])
+
+    def complete(self, job_id: str, result: Dict[str, Any], outputs: List[JobOutput]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO job_outputs (job_id, format, filename, mime, content) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, o.format, o.filename, o.mime, sqlite3.Binary(o.content)) for o in outputs],
+            )
+            # The upload is no longer needed once the job has finished
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, payload = NULL, finished_at = ? WHERE id = ?",
+                (STATUS_DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, payload = NULL, finished_at = ? WHERE id = ?",
+                (STATUS_FAILED, error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Job status, with result and outputs once it has finished."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, doc_id, filename, mime, formats, priority, status, attempts, result, error "
+                "FROM jobs WHERE id = ?", (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            job = Job(row[0], row[1], row[2], row[3], json.loads(row[4] or '[]'), row[5], row[6], row[7],
+                      result=json.loads(row[8]) if row[8] else None, error=row[9] or "")
+            if job.status == STATUS_DONE:
+                job.outputs = [
+                    JobOutput(*r) for r in self._conn.execute(
+                        "SELECT format, filename, mime, content FROM job_outputs WHERE job_id = ?", (job_id,),
+                    )
+                ]
+        return job
+
+    def wait(self, job_id: str, timeout: float, poll_interval: float = 0.5) -> Optional[Job]:
+        """Poll until the job finishes or `timeout` seconds pass; returns the last state seen."""
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        while job is not None and not job.finished and time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            job = self.get(job_id)
+        return job
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (STATUS_QUEUED, STATUS_RUNNING),
+            ).fetchone()[0]
+
+    def cached_result(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM result_cache WHERE key = ? AND created_at >= ?",
+                (key, time.time() - RESULT_CACHE_TTL),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def cache_result(self, key: str, result: Dict[str, Any]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_cache (key, result, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(result, ensure_ascii=False), time.time()),
+            )
+
+
+job_queue = JobQueue()
@@ -0,0 +1,140 @@
+"""Batch merge — consolidate several delivery notes into one handover."""
+
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+from core.extractor import extract_handover, guess_mime_type
+from core.fuzzy_group import FUZZY_GROUPING, GroupMerge, group_devices_fuzzy
+from core.group import DeviceGrouper
+from core.models import CompactGroupedDevice, CompactHandover, GroupedDevice, parse_handover
+from core.profiles import supplier_key
+from core.serial_index import serial_index
+from core.singleflight import content_key
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.merge')
+
+DEFAULT_MERGE_WORKERS = 4
+
+
+@dataclass
+class MergeResult:
+    """Consolidated handover built from several source documents."""
+    data: Dict[str, Any]
+    grouped: List[GroupedDevice]
+    sources: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    conflicts: List[str] = field(default_factory=list)
+    duplicates: List[str] = field(default_factory=list)
+    merges: List[GroupMerge] = field(default_factory=list)
+
+
+def _shd_key(shd: str) -> str:
+    return ''.join(shd.split()).upper()
+
+
+def _find_conflicts(handovers: List[Tuple[str, CompactHandover]]) -> List[str]:
+    """Describe documents whose shd or cty differs from the others."""
+    conflicts = []
+    for label, key_fn, attr in (('shd', _shd_key, 'shd'), ('cty', supplier_key, 'cty')):
+        by_value: Dict[str, List[str]] = {}
+        for name, h in handovers:
+            value = getattr(h, attr)
+            if value:
+                by_value.setdefault(key_fn(value), []).append(f"{name} ({value})")
+        if len(by_value) > 1:
+            listing = "; ".join(", ".join(names) for names in by_value.values())
+            conflicts.append(f"Khác {label}: {listing}")
+    return conflicts
+
+
+def _most_common(values: List[str]) -> str:
+    values = [v for v in values if v]
+    return Counter(values).most_common(1)[0][0] if values else ""
+
+
+def merge_handovers(
+    files: List[Tuple[str, bytes]],
+    max_workers: int = DEFAULT_MERGE_WORKERS,
+) -> Optional[MergeResult]:
+    """Extract (name, bytes) documents concurrently and merge their devices.
+
+    Results are consumed in `files` order (a document is added once it and
+    every document before it have finished), so row order and tie-breaks do
+    not depend on which extraction finishes first. Devices are grouped
+    incrementally; with fuzzy grouping enabled they are grouped once at the
+    end instead. The consolidated shd/cty are the most common values;
+    disagreements are reported in `conflicts`. Returns None if no document
+    could be extracted.
+    """
+    grouper = None if FUZZY_GROUPING else DeviceGrouper()
+    handovers: List[Tuple[str, CompactHandover]] = []
+    failed = []
+    duplicates = []
+
+    def add(name: str, doc_id: str, data: Optional[Dict[str, Any]]) -> None:
+        if not data or 'ds' not in data:
+            failed.append(name)
+            return
+        handover = parse_handover(data)
+        handovers.append((name, handover))
+        duplicates.extend(f"{name}: {d.describe()}" for d in serial_index.check_and_record(doc_id, handover))
+        if grouper is None:
+            logger.info(f"Merged {name}: {len(handover.ds)} devices")
+            return
+        grouper.add(handover.ds)
+        logger.info(f"Merged {name}: {len(handover.ds)} devices, {len(grouper)} groups so far")
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files)))) as executor:
+        # Each task runs in a copy of the caller's context, so usage priority carries over
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run, extract_handover, data, guess_mime_type(name, data)
+            ): index
+            for index, (name, data) in enumerate(files)
+        }
+        finished: Dict[int, Optional[Dict[str, Any]]] = {}
+        next_index = 0
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                finished[index] = future.result()
+            except Exception as e:
+                logger.error(f"Extraction of {files[index][0]} failed: {type(e).__name__}: {e}")
+                finished[index] = None
+            while next_index in finished:
+                name, content = files[next_index]
+                add(name, content_key(content), finished.pop(next_index))
+                next_index += 1
+
+    if not handovers:
+        return None
+
+    shd = _most_common([h.shd for _, h in handovers])
+    shd_type = next((h.shd_type for _, h in handovers if h.shd == shd), 'Khác')
+    merged = {
+        'shd': shd,
+        'shd_type': shd_type,
+        'cty': _most_common([h.cty for _, h in handovers]),
+        'ds': [d.to_dict() for _, h in handovers for d in h.ds],
+    }
+    conflicts = _find_conflicts(handovers)
+    for c in conflicts:
+        logger.warning(f"Merge conflict: {c}")
+
+    if grouper is None:
+        grouped, merges = group_devices_fuzzy([d for _, h in handovers for d in h.ds])
+    else:
+        grouped, merges = grouper.result(CompactGroupedDevice), []
+
+    return MergeResult(
+        data=merged,
+        grouped=grouped,
+        sources=sorted(name for name, _ in handovers),
+        failed=sorted(failed),
+        conflicts=conflicts,
+        duplicates=duplicates,
+        merges=merges,
+    )
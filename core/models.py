@@ -1,7 +1,17 @@
-"""Data models for handover document processing."""
+"""Data models for handover document processing.
 
-from dataclasses import dataclass, field
-from typing import List, Optional, Any, Dict
+`Device`, `HandoverData` and `GroupedDevice` are the mutable working
+models. `CompactDevice`, `CompactHandover` and `CompactGroupedDevice` are
+frozen, slotted variants for handovers kept in memory in bulk (batch
+merging, archiving). `parse_handover` builds them from the raw extraction
+JSON in one pass, with the None -> "" conversion folded in, so neither a
+converted copy of the JSON nor a mutable model is allocated on the way.
+"""
+
+import typing
+from dataclasses import dataclass, field, fields
+from typing import List, Optional, Any, Dict, Tuple
+from utils.text import convert_none_to_empty_string
 
 
 @dataclass
@@ -90,3 +100,181 @@ class GroupedDevice:
             'nsx': self.nsx, 'dvt': self.dvt, 'sl': self.sl,
             'pk': self.pk, 'seri_text': self.seri_text,
         }
+
+
+@dataclass(frozen=True, slots=True)
+class CompactDevice:
+    """Immutable Device without a per-instance __dict__; serials and accessories are tuples."""
+    ttb: str
+    model: str
+    ref: str
+    hang: str
+    nsx: str
+    dvt: str
+    sl: float
+    seri: Tuple[str, ...]
+    pk: Any
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'ttb': self.ttb, 'model': self.model, 'ref': self.ref, 'hang': self.hang,
+            'nsx': self.nsx, 'dvt': self.dvt, 'sl': self.sl,
+            'seri': list(self.seri), 'pk': list(self.pk) if isinstance(self.pk, tuple) else self.pk,
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class CompactHandover:
+    """Immutable HandoverData holding CompactDevice entries."""
+    shd: str
+    shd_type: str
+    cty: str
+    ds: Tuple[CompactDevice, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class CompactGroupedDevice:
+    """Immutable GroupedDevice without a per-instance __dict__."""
+    ttb: str
+    model: str
+    ref: str
+    hang: str
+    nsx: str
+    dvt: str
+    sl: float
+    pk: Any
+    seri_text: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'ttb': self.ttb, 'model': self.model, 'ref': self.ref, 'hang': self.hang,
+            'nsx': self.nsx, 'dvt': self.dvt, 'sl': self.sl,
+            'pk': list(self.pk) if isinstance(self.pk, tuple) else self.pk, 'seri_text': self.seri_text,
+        }
+
+
+def _text(value: Any) -> str:
+    """str(value).strip(), with None as "" (inside containers too, like convert_none_to_empty_string)."""
+    if value is None:
+        return ""
+    if type(value) is str:
+        return value.strip()
+    if isinstance(value, (dict, list)):
+        value = convert_none_to_empty_string(value)
+    return str(value).strip()
+
+
+def _quantity(value: Any) -> float:
+    if type(value) in (int, float):
+        return float(value)
+    if value is None:
+        return 0
+    try:
+        return float(str(value).strip())
+    except (ValueError, TypeError):
+        return 0
+
+
+def _serials(value: Any) -> Tuple[str, ...]:
+    if not value:
+        return ()
+    if isinstance(value, str):
+        return (value,)
+    if isinstance(value, list):
+        return tuple(t for t in (_text(s) for s in value if s) if t)
+    return ()
+
+
+def _accessories(value: Any) -> Any:
+    if isinstance(value, list):
+        return tuple(convert_none_to_empty_string(x) for x in value)
+    return convert_none_to_empty_string(value)
+
+
+def parse_device(data: Dict[str, Any]) -> CompactDevice:
+    """One raw device dict -> CompactDevice."""
+    get = data.get
+    return CompactDevice(
+        _text(get('ttb')), _text(get('model')), _text(get('ref')), _text(get('hang')),
+        _text(get('nsx')), _text(get('dvt')), _quantity(get('sl', 0)),
+        _serials(get('seri')), _accessories(data['pk']) if 'pk' in data else None,
+    )
+
+
+def parse_handover(data: Dict[str, Any]) -> CompactHandover:
+    """Raw extraction JSON -> CompactHandover in one pass.
+
+    Same values as HandoverData.from_dict(convert_none_to_empty_string(data)),
+    with serial and accessory lists as tuples; `data` is neither copied nor modified.
+    """
+    ds = data.get('ds')
+    devices = tuple(parse_device(d) for d in ds if isinstance(d, dict)) if isinstance(ds, list) else ()
+    return CompactHandover(
+        _text(data.get('shd')), _text(data.get('shd_type', 'Khác')), _text(data.get('cty')), devices,
+    )
+
+
+# Field descriptions for the structured-output schema sent to the chat model.
+_FIELD_DESCRIPTIONS = {
+    'ttb': "Tên thiết bị",
+    'model': "Model, không bao gồm số REF",
+    'ref': "Số REF (Reference number)",
+    'hang': "Hãng",
+    'nsx': "Nước sản xuất",
+    'dvt': "Đơn vị tính",
+    'sl': "Số lượng",
+    'seri': "Danh sách số seri",
+    'pk': "Danh sách phụ kiện, mỗi phụ kiện một phần tử",
+    'shd': "Số định danh (số hợp đồng, PO, v.v.)",
+    'shd_type': "Loại số định danh",
+    'cty': "Tên công ty bên giao",
+    'ds': "Danh sách thiết bị",
+}
+
+SHD_TYPES = ['Hợp đồng', 'PO', 'Đề nghị', 'Khác']
+
+
+def _type_schema(tp: Any) -> Dict[str, Any]:
+    """Map a dataclass field annotation to a JSON schema fragment."""
+    origin = typing.get_origin(tp)
+    args = typing.get_args(tp)
+    if origin is typing.Union and type(None) in args:
+        inner = _type_schema(next(a for a in args if a is not type(None)))
+        return {'anyOf': [inner, {'type': 'null'}]}
+    if origin in (list, List):
+        return {'type': 'array', 'items': _type_schema(args[0] if args else str)}
+    if tp is str:
+        return {'type': 'string'}
+    if tp in (int, float):
+        return {'type': 'number'}
+    if isinstance(tp, type) and hasattr(tp, '__dataclass_fields__'):
+        return _object_schema(tp)
+    return {}
+
+
+def _object_schema(cls: type) -> Dict[str, Any]:
+    hints = typing.get_type_hints(cls)
+    properties = {}
+    for f in fields(cls):
+        prop = _type_schema(hints[f.name])
+        if f.name in _FIELD_DESCRIPTIONS:
+            prop['description'] = _FIELD_DESCRIPTIONS[f.name]
+        properties[f.name] = prop
+    if 'shd_type' in properties:
+        properties['shd_type']['enum'] = SHD_TYPES
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': list(properties),
+        'additionalProperties': False,
+    }
+
+
+def handover_json_schema() -> Dict[str, Any]:
+    """JSON schema for HandoverData (with nested Device), derived from the dataclasses."""
+    return _object_schema(HandoverData)
+
+
+def device_json_schema() -> Dict[str, Any]:
+    """JSON schema for a single Device (targeted follow-up calls)."""
+    return _object_schema(Device)
@@ -0,0 +1,164 @@
+"""Page selection — user page ranges and early stop before annex pages.
+
+Delivery packets often continue after the handover table with CO/CQ
+certificates, manuals and declarations. `EarlyStop` classifies each page
+from its text (text layer or OCR output) with cheap keyword heuristics:
+a page carrying the signature block ends the handover (kept, nothing after
+it is read), a page titled like a certificate or manual is an annex
+(dropped, nothing after it is read). An end page that refers to an attached
+device list ("phụ lục", "danh sách kèm theo") does not stop reading.
+"""
+
+import re
+from typing import List, Optional, Sequence, Tuple
+from config.settings import get_bool
+from utils.text import strip_accents
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.pages')
+
+EARLY_STOP = get_bool('PAGES', 'EARLY_STOP', True)
+RENDER_DPI = 150
+TITLE_CHARS = 400          # annex titles are looked for at the top of the page
+
+# Matched on strip_accents() text
+END_MARKERS = (
+    'ky, ghi ro ho ten', 'ky ghi ro ho ten', 'ky va ghi ro ho ten',
+    'bien ban duoc lap thanh', 'bien ban nay duoc lap thanh',
+)
+SIGNATURE_PAIR = ('dai dien ben giao', 'dai dien ben nhan')
+ATTACHMENT_MARKERS = ('phu luc', 'danh sach kem theo', 'danh sach dinh kem', 'chi tiet kem theo', 'xem trang sau')
+ANNEX_MARKERS = (
+    'certificate of origin', 'certificate of quality', 'certificate of analysis', 'certificate of conformity',
+    'declaration of conformity', 'ec declaration', 'giay chung nhan', 'chung nhan xuat xu',
+    'chung nhan chat luong', 'user manual', 'operation manual', 'operator manual', 'service manual',
+    'instructions for use', 'instruction manual', 'huong dan su dung', 'iso 13485', 'free sale',
+)
+
+PAGE_CONTENT = 'content'
+PAGE_END = 'end'
+PAGE_ANNEX = 'annex'
+
+
+def page_kind(text: str) -> str:
+    """Classify one page: PAGE_END (signature block), PAGE_ANNEX or PAGE_CONTENT."""
+    norm = ' '.join(strip_accents(text).split())
+    if any(m in norm[:TITLE_CHARS] for m in ANNEX_MARKERS):
+        return PAGE_ANNEX
+    # Both representatives named in the last third of the page: the signature row, not the header
+    tail = norm[-max(TITLE_CHARS, len(norm) // 3):] if len(norm) > 2 * TITLE_CHARS else ''
+    signed = any(m in norm for m in END_MARKERS) or all(m in tail for m in SIGNATURE_PAIR)
+    if signed and not any(m in norm for m in ATTACHMENT_MARKERS):
+        return PAGE_END
+    return PAGE_CONTENT
+
+
+class EarlyStop:
+    """Feed pages in order; `feed` says whether to keep the page and whether to read on."""
+
+    def __init__(self, enabled: bool = EARLY_STOP):
+        self.enabled = enabled
+        self.pages = 0
+        self.reason = ""
+
+    def feed(self, text: str) -> Tuple[bool, bool]:
+        """Returns (keep this page, read the next page)."""
+        self.pages += 1
+        if not self.enabled:
+            return True, True
+        kind = page_kind(text)
+        if kind == PAGE_ANNEX and self.pages > 1:
+            self.reason = f"page {self.pages} is an annex"
+            return False, False
+        if kind == PAGE_END:
+            self.reason = f"page {self.pages} has the signature block"
+            return True, False
+        return True, True
+
+
+def parse_page_range(spec: str, page_count: Optional[int] = None) -> List[int]:
+    """'1-3, 5' -> [0, 1, 2, 4] (0-based, sorted, unique). Raises ValueError on bad input.
+
+    An open range '4-' runs to `page_count`.
+    """
+    pages = set()
+    for part in filter(None, (p.strip() for p in spec.replace(';', ',').split(','))):
+        match = re.fullmatch(r'(\d+)\s*(?:-\s*(\d*))?', part)
+        if not match:
+            raise ValueError(f"Khoảng trang không hợp lệ: {part!r}")
+        start = int(match.group(1))
+        if match.group(2) is None:
+            end = start
+        elif match.group(2):
+            end = int(match.group(2))
+        elif page_count:
+            end = page_count
+        else:
+            raise ValueError(f"Khoảng trang mở {part!r} cần biết số trang")
+        if start < 1 or end < start:
+            raise ValueError(f"Khoảng trang không hợp lệ: {part!r}")
+        if page_count:
+            end = min(end, page_count)
+        pages.update(range(start - 1, end))
+    if not pages:
+        raise ValueError("Không có trang nào được chọn")
+    return sorted(pages)
+
+
+def select_pages(pdf_bytes: bytes, spec: str) -> bytes:
+    """A PDF with only the pages in `spec` (see parse_page_range)."""
+    import fitz
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        indices = [i for i in parse_page_range(spec, len(doc)) if i < len(doc)]
+        if not indices:
+            raise ValueError(f"Tài liệu chỉ có {len(doc)} trang")
+        if len(indices) == len(doc):
+            return pdf_bytes
+        doc.select(indices)
+        return doc.tobytes(garbage=3, deflate=True)
+
+
+def drop_annex_pages(pdf_bytes: bytes) -> bytes:
+    """Cut a PDF after the handover ends, judging pages by their text layer.
+
+    Pages without text (scans) never stop reading here; OCR output is
+    checked page by page in the extractor instead.
+    """
+    import fitz
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        stopper = EarlyStop()
+        keep = len(doc)
+        for page in doc:
+            text = page.get_text()
+            if not text.strip():
+                return pdf_bytes
+            kept, more = stopper.feed(text)
+            if not more:
+                keep = page.number + (1 if kept else 0)
+                break
+        if keep >= len(doc):
+            return pdf_bytes
+        logger.info(f"Early stop: keeping {keep}/{len(doc)} pages ({stopper.reason})")
+        doc.select(list(range(keep)))
+        return doc.tobytes(garbage=3, deflate=True)
+
+
+class PdfPageImages(Sequence):
+    """Page images of a PDF, rendered on first access and kept for retries with other keys."""
+
+    def __init__(self, pdf_bytes: bytes, dpi: int = RENDER_DPI):
+        import fitz
+        self._doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        self._dpi = dpi
+        self._images = {}
+
+    def __len__(self) -> int:
+        return len(self._doc)
+
+    def __getitem__(self, index: int) -> bytes:
+        if index not in self._images:
+            self._images[index] = self._doc[index].get_pixmap(dpi=self._dpi).tobytes("png")
+        return self._images[index]
+
+    def close(self) -> None:
+        self._doc.close()
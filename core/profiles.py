@@ -0,0 +1,427 @@
+"""Supplier layout profiles — learned column mappings for fast local parsing.
+
+Each supplier (identified by the shortened `cty` name) keeps the header
+keywords, column layout and model/serial shapes seen in past successful
+LLM extractions. Before a chat call, the matching profile is applied to the
+OCR markdown or PDF tables; a confident parse skips the LLM.
+
+Profiles decide which requests are sent (a profile hit skips the chat call,
+the small-tier history picks the chat model), so when recording or
+replaying API responses the store is frozen: it is loaded from a snapshot
+kept with the recordings (<replay path>/profiles.json, copied from
+profiles.json by the first recording run) and nothing is learned, counted
+towards tier history or saved.
+"""
+
+import os
+import re
+import json
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict, replace
+from typing import List, Dict, Any, Optional
+from config.settings import get_setting
+from core.table_parser import (
+    HEADER_KEYWORDS, MIN_HEADER_FIELDS, LocalExtraction, find_header, map_header,
+    normalize_header, parse_quantity, rows_to_devices, score_extraction,
+    extract_header_fields, tables_to_extraction,
+)
+from sdk.replay import MODE_OFF, MODE_RECORD, RECORDINGS_PATH, REPLAY_MODE
+from utils.text import shorten_company_name, strip_accents
+from utils.logging_setup import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only, saves are not locked
+    fcntl = None
+
+logger = get_logger('core.profiles')
+
+PROFILES_FILE = get_setting('PROFILES', 'PATH', 'profiles.json')
+PROFILE_MIN_CONFIDENCE = get_setting('PROFILES', 'MIN_CONFIDENCE', 0.85, float)
+MIN_SUPPLIER_KEY_LEN = 3
+MAX_PATTERN_SHAPES = 8
+HEADER_ZONE_LINES = 20   # the company name fallback only looks above the device table, within this many lines
+LEARNABLE_FIELDS = ['ttb', 'model', 'ref', 'hang', 'nsx', 'dvt', 'sl', 'seri']
+COUNTER_FIELDS = ('learned', 'hits', 'misses', 'small_ok', 'small_failed')
+
+
+def supplier_key(cty: str) -> str:
+    """Normalized supplier identifier: shortened company name without accents."""
+    if not cty:
+        return ''
+    return normalize_header(shorten_company_name(str(cty)))
+
+
+def value_shape(value: str) -> str:
+    """Regex shape of a value: letter runs -> [A-Za-z]+, digit runs -> \\d+, rest literal."""
+    parts = []
+    for token in re.findall(r'[A-Za-z]+|\d+|.', value):
+        if token.isalpha() and token.isascii():
+            parts.append('[A-Za-z]+')
+        elif token.isdigit():
+            parts.append(r'\d+')
+        else:
+            parts.append(re.escape(token))
+    return ''.join(parts)
+
+
+def header_zone(text: str) -> str:
+    """Document text above the first markdown table row, at most HEADER_ZONE_LINES lines."""
+    lines = []
+    for line in text.splitlines():
+        if line.lstrip().startswith('|') or len(lines) >= HEADER_ZONE_LINES:
+            break
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _norm_value(value: Any) -> str:
+    return re.sub(r'\s+', '', strip_accents(str(value or '')))
+
+
+@dataclass
+class SupplierProfile:
+    """Learned layout for one supplier."""
+    supplier: str
+    cty: str = ""
+    header_keywords: Dict[str, List[str]] = field(default_factory=dict)
+    column_fields: List[str] = field(default_factory=list)   # field per column, '' if unused
+    model_shapes: List[str] = field(default_factory=list)
+    serial_shapes: List[str] = field(default_factory=list)
+    learned: int = 0
+    hits: int = 0
+    misses: int = 0
+    small_ok: int = 0        # small chat tier replies that passed validation
+    small_failed: int = 0
+
+    def keywords(self) -> Dict[str, List[str]]:
+        merged = {k: list(v) for k, v in HEADER_KEYWORDS.items()}
+        for fld, words in self.header_keywords.items():
+            merged.setdefault(fld, []).extend(w for w in words if w not in merged[fld])
+        return merged
+
+    def shape_agreement(self, devices: List[Dict[str, Any]]) -> float:
+        """Fraction of models/serials that match the learned shapes (1.0 if none learned)."""
+        checks = []
+        if self.model_shapes:
+            model_re = re.compile('(?:' + '|'.join(self.model_shapes) + ')')
+            checks += [bool(model_re.fullmatch(d['model'])) for d in devices if d['model']]
+        if self.serial_shapes:
+            serial_re = re.compile('(?:' + '|'.join(self.serial_shapes) + ')')
+            checks += [bool(serial_re.fullmatch(s)) for d in devices for s in d['seri']]
+        return sum(checks) / len(checks) if checks else 1.0
+
+
+def _merge_shapes(existing: List[str], values: List[str]) -> List[str]:
+    shapes = list(existing)
+    for v in values:
+        shape = value_shape(v)
+        if v and shape not in shapes:
+            shapes.append(shape)
+    return shapes[-MAX_PATTERN_SHAPES:]
+
+
+def _learn_columns(table: List[List[Any]], devices: List[Dict[str, Any]]) -> Dict[int, str]:
+    """Assign fields to columns by matching cell values against the LLM result."""
+    expected = {
+        fld: {_norm_value(d.get(fld)) for d in devices if d.get(fld) not in (None, '', [])}
+        for fld in LEARNABLE_FIELDS if fld not in ('sl', 'seri')
+    }
+    serials = {_norm_value(s) for d in devices for s in (d.get('seri') or [])}
+    quantities = {float(d['sl']) for d in devices if isinstance(d.get('sl'), (int, float))}
+
+    width = max(len(r) for r in table)
+    scores = []
+    for col in range(width):
+        cells = [r[col] for r in table if col < len(r) and r[col]]
+        for fld, values in expected.items():
+            score = sum(_norm_value(c) in values for c in cells)
+            if score:
+                scores.append((score, col, fld))
+        seri_score = sum(any(s and s in _norm_value(c) for s in serials) for c in cells)
+        if seri_score:
+            scores.append((seri_score, col, 'seri'))
+        sl_score = sum(parse_quantity(c) in quantities for c in cells)
+        if sl_score:
+            # Numeric columns also match STT, so quantity ranks below text fields
+            scores.append((sl_score - 0.5, col, 'sl'))
+
+    min_score = max(1, len(devices) // 2)
+    mapping: Dict[int, str] = {}
+    for score, col, fld in sorted(scores, reverse=True):
+        if score >= min_score and col not in mapping and fld not in mapping.values():
+            mapping[col] = fld
+    return mapping
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock on `<path>.lock`, held across processes (a no-op without fcntl)."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class ProfileStore:
+    """JSON-backed store of supplier profiles with hit-rate statistics. Thread-safe.
+
+    The file is written only by `learn`; hit and small-tier counters updated
+    by lookups are saved along with it. Worker processes share the file: a
+    save re-reads it under a file lock and merges this process's changes
+    (learned layouts replace the stored ones, counters are added), so no
+    process drops profiles learned by another. A frozen store (record/replay)
+    never learns, records tier results or saves.
+    """
+
+    def __init__(self, path: str = PROFILES_FILE, frozen: bool = False):
+        self._path = path
+        self._frozen = frozen
+        self._lock = threading.Lock()
+        self._profiles: Dict[str, SupplierProfile] = {}
+        self._pending: Dict[str, Counter] = {}   # counter increments not saved yet, per supplier
+        self._relearned = set()                   # suppliers whose layout was learned since the last save
+        self._lookups = 0
+        self._unmatched = 0
+        self._hits = 0
+        self._misses = 0
+        self._load()
+
+    def _read(self) -> Dict[str, SupplierProfile]:
+        if not os.path.exists(self._path):
+            return {}
+        try:
+            with open(self._path, encoding='utf-8') as f:
+                raw = json.load(f)
+            return {k: SupplierProfile(**v) for k, v in raw.items()}
+        except Exception as e:
+            logger.warning(f"Failed to load supplier profiles: {e}")
+            return {}
+
+    def _load(self):
+        self._profiles = self._read()
+        if self._profiles:
+            logger.info(f"Loaded {len(self._profiles)} supplier profiles")
+
+    def _count(self, profile: SupplierProfile, name: str) -> None:
+        setattr(profile, name, getattr(profile, name) + 1)
+        self._pending.setdefault(profile.supplier, Counter())[name] += 1
+
+    def _merged(self, stored: Dict[str, SupplierProfile]) -> Dict[str, SupplierProfile]:
+        """The file's profiles with this process's learned layouts and counter increments applied."""
+        merged = dict(stored)
+        for key, profile in self._profiles.items():
+            current = merged.get(key)
+            if current is None:
+                merged[key] = profile
+                continue
+            if key in self._relearned:
+                current = replace(profile, **{name: getattr(current, name) for name in COUNTER_FIELDS})
+            else:
+                current = replace(current)
+            for name, n in self._pending.get(key, {}).items():
+                setattr(current, name, getattr(current, name) + n)
+            merged[key] = current
+        return merged
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self._path))
+        try:
+            with _file_lock(self._path):
+                merged = self._merged(self._read())
+                # Write-then-rename through a unique temp file: readers never see a half-written file
+                fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                        json.dump({k: asdict(v) for k, v in merged.items()}, f, ensure_ascii=False, indent=1)
+                    os.replace(tmp, self._path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+        except OSError as e:
+            logger.warning(f"Failed to save supplier profiles: {e}")
+            return
+        # Adopt what the other processes learned; their counters are now included too
+        self._profiles = merged
+        self._pending.clear()
+        self._relearned.clear()
+
+    def identify(self, text: str) -> Optional[SupplierProfile]:
+        """Find the supplier profile for a document.
+
+        Uses the company name found in the text; otherwise the profile whose
+        name words all occur in the header zone above the device table (most
+        words first), so a brand in the device rows does not pick its profile.
+        """
+        key = supplier_key(extract_header_fields(text)['cty'])
+        if key in self._profiles:
+            return self._profiles[key]
+        words = set(normalize_header(header_zone(text)).split())
+        for key in sorted(self._profiles, key=lambda k: len(k.split()), reverse=True):
+            if set(key.split()) <= words:
+                return self._profiles[key]
+        return None
+
+    def parse(self, text: str, tables: List[List[List[Any]]]) -> Optional[LocalExtraction]:
+        """Apply the matching supplier profile. Returns a result only if confident."""
+        with self._lock:
+            self._lookups += 1
+            profile = self.identify(text)
+            if profile is None:
+                self._unmatched += 1
+                return None
+
+        keywords = profile.keywords()
+        result = tables_to_extraction(tables, text, f"profile:{profile.supplier}", keywords)
+        if result is None and profile.column_fields:
+            result = self._parse_positional(profile, tables, text, keywords)
+
+        confidence = 0.0
+        if result is not None:
+            if not result.data.get('cty'):
+                result.data['cty'] = profile.cty
+            confidence = round(0.8 * result.confidence + 0.2 * profile.shape_agreement(result.data['ds']), 3)
+            result.confidence = confidence
+
+        with self._lock:
+            if confidence >= PROFILE_MIN_CONFIDENCE:
+                self._count(profile, 'hits')
+                self._hits += 1
+            else:
+                self._count(profile, 'misses')
+                self._misses += 1
+        logger.info(f"Supplier profile '{profile.supplier}': confidence={confidence}")
+        return result if confidence >= PROFILE_MIN_CONFIDENCE else None
+
+    def _parse_positional(
+        self,
+        profile: SupplierProfile,
+        tables: List[List[List[Any]]],
+        text: str,
+        keywords: Dict[str, List[str]],
+    ) -> Optional[LocalExtraction]:
+        """Header-less tables: use the learned column positions when the width matches."""
+        column_map = {i: f for i, f in enumerate(profile.column_fields) if f}
+        devices = []
+        for rows in tables:
+            if not rows or len(rows[0]) != len(profile.column_fields):
+                continue
+            data_rows = [r for r in rows if len(map_header(r, keywords)) < MIN_HEADER_FIELDS]
+            devices.extend(rows_to_devices(data_rows, column_map))
+        if not devices:
+            return None
+        for d in devices:
+            if d['sl'] is None:
+                d['sl'] = len(d['seri']) or 0
+        meta = extract_header_fields(text)
+        confidence = score_extraction(devices, column_map, meta)
+        return LocalExtraction(
+            data=dict(meta, ds=devices), confidence=confidence,
+            source=f"profile:{profile.supplier}", notes=["positional columns"],
+        )
+
+    def learn(self, data: Dict[str, Any], tables: List[List[List[Any]]]):
+        """Update the supplier's profile from a successful LLM extraction."""
+        if self._frozen:
+            return
+        key = supplier_key(data.get('cty', ''))
+        devices = [d for d in data.get('ds') or [] if isinstance(d, dict)]
+        if len(key) < MIN_SUPPLIER_KEY_LEN or not devices:
+            return
+
+        best_table, best_map = None, {}
+        for table in tables:
+            if len(table) < 2:
+                continue
+            mapping = _learn_columns(table, devices)
+            if len(mapping) > len(best_map):
+                best_table, best_map = table, mapping
+        if len(best_map) < MIN_HEADER_FIELDS or 'ttb' not in best_map.values():
+            return
+
+        header_idx, _ = find_header(best_table)
+        header = best_table[max(header_idx, 0)]
+
+        with self._lock:
+            profile = self._profiles.setdefault(key, SupplierProfile(supplier=key))
+            profile.cty = str(data.get('cty') or profile.cty)
+            profile.column_fields = [best_map.get(i, '') for i in range(len(header))]
+            for col, fld in best_map.items():
+                word = normalize_header(header[col]) if col < len(header) else ''
+                if word and word not in profile.header_keywords.setdefault(fld, []):
+                    profile.header_keywords[fld].append(word)
+            profile.model_shapes = _merge_shapes(
+                profile.model_shapes, [str(d.get('model') or '') for d in devices])
+            profile.serial_shapes = _merge_shapes(
+                profile.serial_shapes, [str(s) for d in devices for s in (d.get('seri') or [])])
+            self._count(profile, 'learned')
+            self._relearned.add(key)
+            self._save()
+        logger.info(f"Learned supplier profile '{key}' ({len(best_map)} columns)")
+
+    def _profile_for(self, cty: str) -> Optional[SupplierProfile]:
+        return self._profiles.get(supplier_key(cty)) if cty else None
+
+    def tier_history(self, cty: str) -> tuple:
+        """(passed, failed) small-tier chat replies for the supplier; (0, 0) if unknown."""
+        with self._lock:
+            profile = self._profile_for(cty)
+            return (profile.small_ok, profile.small_failed) if profile else (0, 0)
+
+    def record_tier(self, cty: str, ok: bool):
+        """Record whether a small-tier reply passed validation (known suppliers only)."""
+        if self._frozen:
+            return
+        with self._lock:
+            profile = self._profile_for(cty)
+            if profile is None:
+                return
+            self._count(profile, 'small_ok' if ok else 'small_failed')
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate summary: how many chat calls the profiles avoided.
+
+        Top-level counters cover this process; `by_supplier` holds the
+        all-time totals, persisted with the next learned profile.
+        """
+        with self._lock:
+            return {
+                'profiles': len(self._profiles),
+                'lookups': self._lookups,
+                'unmatched': self._unmatched,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / self._lookups, 3) if self._lookups else 0.0,
+                'llm_calls_avoided': self._hits,
+                'by_supplier': {
+                    k: {'hits': p.hits, 'misses': p.misses, 'learned': p.learned}
+                    for k, p in self._profiles.items()
+                },
+            }
+
+
+def _open_store() -> ProfileStore:
+    """The live store, or in record/replay mode a frozen one read from the recordings' snapshot."""
+    if REPLAY_MODE == MODE_OFF:
+        return ProfileStore()
+    snapshot = os.path.join(RECORDINGS_PATH, 'profiles.json')
+    if REPLAY_MODE == MODE_RECORD and not os.path.exists(snapshot) and os.path.exists(PROFILES_FILE):
+        try:
+            os.makedirs(RECORDINGS_PATH, exist_ok=True)
+            shutil.copyfile(PROFILES_FILE, snapshot)
+        except OSError as e:
+            logger.warning(f"Failed to snapshot supplier profiles for recording: {e}")
+    logger.info(f"Replay mode {REPLAY_MODE}: supplier profiles frozen from {snapshot}")
+    return ProfileStore(snapshot, frozen=True)
+
+
+profile_store = _open_store()
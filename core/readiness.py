@@ -0,0 +1,180 @@
+"""Warm-up and readiness — pay the first document's setup costs at startup.
+
+`warm_up` runs once per process (Streamlit start, each worker, batch runs):
+it creates the pooled Mistral client of every key, reads and indexes the
+Word template, imports PyMuPDF and loads the text normalization, page and
+compression patterns, and probes the local OCR engine. With [WARMUP]
+ping_keys = true it also sends one model-list request per key, in parallel.
+That sets up TLS on the pooled connection. Keys rejected with 401/403 are
+marked invalid in the pool and skipped by extraction.
+
+`python -m core.readiness [--ping]` prints the report and exits 1 when not
+ready, for use as a container readiness probe.
+"""
+
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from config.api_keys import key_fingerprint, pool
+from config.settings import get_bool
+from sdk.replay import MODE_OFF, REPLAY_MODE
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.readiness')
+
+WARMUP_ENABLED = get_bool('WARMUP', 'ENABLED', True)
+PING_KEYS = get_bool('WARMUP', 'PING_KEYS', False)
+PING_WORKERS = 4
+
+KEY_OK = 'ok'
+KEY_INVALID = 'invalid'          # rejected by the API; skipped by extraction
+KEY_UNREACHABLE = 'unreachable'  # network error or timeout; still used
+KEY_UNCHECKED = 'unchecked'
+
+
+@dataclass
+class KeyStatus:
+    """Health of one API key after warm-up."""
+    fingerprint: str
+    state: str = KEY_UNCHECKED
+    latency_ms: Optional[float] = None
+    detail: str = ""
+
+
+@dataclass
+class Readiness:
+    """Outcome of warm-up: failed steps, step timings and key health."""
+    errors: Dict[str, str] = field(default_factory=dict)
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+    keys: List[KeyStatus] = field(default_factory=list)
+    local_ocr: bool = False
+
+    @property
+    def usable_keys(self) -> int:
+        return sum(1 for k in self.keys if k.state != KEY_INVALID)
+
+    @property
+    def ready(self) -> bool:
+        return not self.errors and self.usable_keys > 0
+
+    def describe(self) -> str:
+        lines = [f"{'Sẵn sàng' if self.ready else 'Chưa sẵn sàng'}: "
+                 f"{self.usable_keys}/{len(self.keys)} key dùng được, "
+                 f"OCR cục bộ {'có' if self.local_ocr else 'không có'}"]
+        lines += [f"  {step}: {ms:.0f} ms" + (f" — LỖI: {self.errors[step]}" if step in self.errors else "")
+                  for step, ms in self.timings_ms.items()]
+        lines += [f"  key {k.fingerprint}: {k.state}"
+                  + (f" ({k.latency_ms:.0f} ms)" if k.latency_ms is not None else "")
+                  + (f" — {k.detail}" if k.detail else "")
+                  for k in self.keys]
+        return '\n'.join(lines)
+
+
+def _step(report: Readiness, name: str, fn: Callable[[], object]) -> None:
+    started = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        report.errors[name] = f"{type(e).__name__}: {e}"
+        logger.error(f"Warm-up step {name} failed: {report.errors[name]}")
+    report.timings_ms[name] = (time.perf_counter() - started) * 1000
+
+
+def _warm_template() -> None:
+    from template.filler import load_template
+    load_template()
+
+
+def _warm_pdf() -> None:
+    import fitz
+    fitz.open().close()
+
+
+def _warm_text() -> None:
+    # Importing these modules compiles their patterns
+    import core.compress, core.pages  # noqa: F401
+    from utils.text import shorten_company_name, standardize_string, strip_accents
+    shorten_company_name("CÔNG TY TNHH THƯƠNG MẠI VÀ DỊCH VỤ Y TẾ")
+    standardize_string(strip_accents("Máy đo huyết áp"))
+
+
+def _warm_clients() -> None:
+    from sdk.adapter import client_for
+    for api_key in pool.keys:
+        client_for(api_key)
+
+
+def _ping(api_key: str) -> KeyStatus:
+    from sdk.adapter import ping
+    status = KeyStatus(key_fingerprint(api_key))
+    try:
+        status.latency_ms = ping(api_key)
+        status.state = KEY_OK
+    except Exception as e:
+        code = getattr(e, 'status_code', None)
+        status.state = KEY_INVALID if code in (401, 403) else KEY_UNREACHABLE
+        status.detail = f"{type(e).__name__}: {e}"[:200]
+    return status
+
+
+def warm_up(ping: bool = PING_KEYS) -> Readiness:
+    """Run every warm-up step; the report is also kept for `readiness()`."""
+    global _last
+    started = time.perf_counter()
+    report = Readiness()
+    _step(report, 'template', _warm_template)
+    _step(report, 'pymupdf', _warm_pdf)
+    _step(report, 'text', _warm_text)
+    _step(report, 'clients', _warm_clients)
+
+    def probe_local_ocr():
+        from sdk.ocr import ocr_router
+        report.local_ocr = ocr_router.local_enabled
+    _step(report, 'local_ocr', probe_local_ocr)
+
+    if ping and REPLAY_MODE == MODE_OFF and pool.keys:
+        def ping_keys():
+            with ThreadPoolExecutor(max_workers=min(PING_WORKERS, pool.size)) as executor:
+                report.keys = list(executor.map(_ping, pool.keys))
+        _step(report, 'ping', ping_keys)
+        for api_key, status in zip(pool.keys, report.keys):
+            if status.state == KEY_OK:
+                pool.mark_healthy(api_key)
+            elif status.state == KEY_INVALID:
+                pool.mark_invalid(api_key)
+                logger.warning(f"Key {status.fingerprint} rejected by the API, skipping it: {status.detail}")
+    if not report.keys:
+        report.keys = [KeyStatus(key_fingerprint(k)) for k in pool.keys]
+    if not pool.keys:
+        report.errors['keys'] = "no MISTRAL_API_KEY configured"
+
+    logger.info(f"Warm-up done in {(time.perf_counter() - started) * 1000:.0f} ms: "
+                f"ready={report.ready}, {report.usable_keys}/{len(report.keys)} keys usable"
+                + (f", failed: {', '.join(report.errors)}" if report.errors else ""))
+    _last = report
+    return report
+
+
+_last: Optional[Readiness] = None
+
+
+def readiness() -> Readiness:
+    """The last warm-up report, running warm-up first if this process has not yet."""
+    return _last if _last is not None else warm_up()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Khởi động trước và kiểm tra trạng thái sẵn sàng")
+    parser.add_argument('--ping', action='store_true', default=PING_KEYS,
+                        help="gửi một yêu cầu nhỏ cho mỗi key để kiểm tra key")
+    args = parser.parse_args(argv)
+    report = warm_up(ping=args.ping)
+    print(report.describe())
+    return 0 if report.ready else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
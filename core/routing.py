@@ -0,0 +1,70 @@
+"""Model tiering — send easy documents to a smaller, faster chat model.
+
+A document goes to the small tier when its OCR text is short, its tables
+have few rows, and the small model has not been failing for its supplier.
+A small-tier reply that fails validation badly (see
+core.validation.needs_escalation) is retried once on the large tier; the
+outcome is fed back into the supplier's profile.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Any, List
+from config.settings import LARGE_MODEL, SMALL_MODEL, get_bool, get_setting
+from core.profiles import profile_store
+from core.table_parser import extract_header_fields
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.routing')
+
+ROUTING_ENABLED = get_bool('ROUTING', 'ENABLED', True)
+SMALL_MAX_CHARS = get_setting('ROUTING', 'SMALL_MAX_CHARS', 6000, int)
+SMALL_MAX_ROWS = get_setting('ROUTING', 'SMALL_MAX_ROWS', 25, int)
+# Below this small-tier success rate a supplier always goes to the large tier
+MIN_SUPPLIER_SUCCESS = get_setting('ROUTING', 'MIN_SUPPLIER_SUCCESS', 0.8, float)
+MIN_SUPPLIER_ATTEMPTS = 3
+
+
+@dataclass(frozen=True)
+class Tier:
+    name: str
+    model: str
+
+
+SMALL = Tier('small', SMALL_MODEL)
+LARGE = Tier('large', LARGE_MODEL)
+
+
+@dataclass
+class RouteDecision:
+    tier: Tier
+    reason: str
+    supplier: str = ""
+
+
+def _table_rows(tables: List[List[List[Any]]]) -> int:
+    return sum(max(0, len(t) - 1) for t in tables)  # minus the header row
+
+
+def choose_tier(ocr_text: str, tables: List[List[List[Any]]]) -> RouteDecision:
+    """Pick the chat tier for a document from its size and its supplier's history."""
+    if not ROUTING_ENABLED:
+        return RouteDecision(LARGE, "routing disabled")
+    supplier = extract_header_fields(ocr_text).get('cty', '')
+    if len(ocr_text) > SMALL_MAX_CHARS:
+        return RouteDecision(LARGE, f"{len(ocr_text)} chars > {SMALL_MAX_CHARS}", supplier)
+    rows = _table_rows(tables)
+    if rows > SMALL_MAX_ROWS:
+        return RouteDecision(LARGE, f"{rows} rows > {SMALL_MAX_ROWS}", supplier)
+    ok, failed = profile_store.tier_history(supplier)
+    if ok + failed >= MIN_SUPPLIER_ATTEMPTS and ok / (ok + failed) < MIN_SUPPLIER_SUCCESS:
+        return RouteDecision(LARGE, f"small tier succeeded {ok}/{ok + failed} for supplier", supplier)
+    return RouteDecision(SMALL, f"{len(ocr_text)} chars, {rows} rows", supplier)
+
+
+def log_tier(doc_id: str, decision: RouteDecision, started: float, escalated: bool = False) -> None:
+    logger.info(
+        f"Chat tier: doc={doc_id[:12]} tier={decision.tier.name} model={decision.tier.model} "
+        f"escalated={escalated} reason=\"{decision.reason}\" "
+        f"latency_ms={(time.perf_counter() - started) * 1000:.0f}"
+    )
@@ -0,0 +1,141 @@
+"""Persistent serial-number index — detects serials handed over more than once.
+
+Every extracted serial is stored in SQLite with the document it came from
+(the content hash), so a serial seen again in a different document, or
+twice in the same one, can be reported before the handover is issued.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, List, Tuple, Union
+from config.settings import get_setting
+from core.models import CompactHandover, HandoverData
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.serial_index')
+
+SERIAL_INDEX_PATH = get_setting('SERIAL_INDEX', 'PATH', 'serials.db')
+LOOKUP_CHUNK = 500  # stays under SQLite's bound-parameter limit
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS serials (
+    serial TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    shd TEXT,
+    cty TEXT,
+    model TEXT,
+    created_at REAL,
+    PRIMARY KEY (serial, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_serials_doc ON serials (doc_id);
+"""
+
+
+def normalize_serial(serial: str) -> str:
+    """Uppercase, whitespace-free serial used as the index key."""
+    return re.sub(r'\s+', '', str(serial)).upper()
+
+
+@dataclass
+class SerialDuplicate:
+    """A serial that already appears in another document (or twice in this one)."""
+    serial: str
+    doc_id: str
+    shd: str = ""
+    cty: str = ""
+    model: str = ""
+    created_at: float = 0.0
+
+    def describe(self) -> str:
+        if not self.created_at:
+            return f"Seri {self.serial} xuất hiện nhiều lần trong cùng tài liệu"
+        when = time.strftime('%d/%m/%Y', time.localtime(self.created_at))
+        return f"Seri {self.serial} đã bàn giao ngày {when} (số {self.shd or '?'}, {self.cty or '?'})"
+
+
+class SerialIndex:
+    """SQLite-backed serial index. One connection, opened on first use, shared under a lock."""
+
+    def __init__(self, path: str = SERIAL_INDEX_PATH):
+        self._path = path
+        self._lock = threading.RLock()
+        self._db = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self._path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def lookup(self, serials: Iterable[str], exclude_doc: str = "") -> List[SerialDuplicate]:
+        """Existing records for the given serials (primary-key lookups, chunked)."""
+        keys = sorted({normalize_serial(s) for s in serials if s})
+        found = []
+        with self._lock:
+            for i in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[i:i + LOOKUP_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT serial, doc_id, shd, cty, model, created_at FROM serials "
+                    f"WHERE serial IN ({','.join('?' * len(chunk))}) AND doc_id != ?",
+                    (*chunk, exclude_doc),
+                ).fetchall()
+                found.extend(SerialDuplicate(*row) for row in rows)
+        return found
+
+    def bulk_insert(self, rows: Iterable[Tuple[str, str, str, str, str]]) -> int:
+        """Insert (serial, doc_id, shd, cty, model) rows in one transaction.
+
+        Existing (serial, doc_id) pairs are ignored, so re-running a batch is safe.
+        """
+        now = time.time()
+        records = [(normalize_serial(r[0]), r[1], r[2], r[3], r[4], now) for r in rows if r[0]]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO serials (serial, doc_id, shd, cty, model, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                records,
+            )
+        return len(records)
+
+    def check_and_record(self, doc_id: str, handover: Union[HandoverData, CompactHandover]) -> List[SerialDuplicate]:
+        """Report duplicate serials for a document, then add its serials to the index.
+
+        Check and insert happen under one lock and one write transaction, so
+        two documents sharing a serial that are processed concurrently (by
+        threads or by worker processes) still see each other.
+        """
+        rows = [
+            (serial, doc_id, handover.shd, handover.cty, device.model)
+            for device in handover.ds for serial in device.seri
+        ]
+        counts = Counter(normalize_serial(r[0]) for r in rows if r[0])
+        duplicates = [SerialDuplicate(serial, doc_id) for serial, n in counts.items() if n > 1]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                duplicates += self.lookup(counts, exclude_doc=doc_id)
+            except Exception:
+                self._conn.rollback()
+                raise
+            self.bulk_insert(rows)
+        if duplicates:
+            logger.warning(f"Document {doc_id[:12]}: {len(duplicates)} duplicate serials")
+        return duplicates
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM serials").fetchone()[0]
+
+
+serial_index = SerialIndex()
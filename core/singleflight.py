@@ -0,0 +1,59 @@
+"""Single-flight request deduplication — concurrent identical calls share one execution."""
+
+import copy
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.singleflight')
+
+
+def content_key(data: bytes) -> str:
+    """Stable document identifier: SHA-256 of the file content."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one in-flight execution.
+
+    The first caller runs `fn`; callers arriving while it runs wait on the same
+    future and receive a deep copy of its result (or its exception), so one
+    caller mutating the result cannot affect another. Nothing is cached once
+    the call completes. Thread-safe, so it works for Streamlit sessions and
+    thread-pool batch runs alike.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            logger.info(f"Joining in-flight extraction {key[:12]}")
+            return copy.deepcopy(future.result())
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    @property
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
@@ -0,0 +1,323 @@
+"""Local table parsing — maps delivery-note device tables to fields without the LLM."""
+
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+from utils.text import strip_accents
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.table_parser')
+
+# Header keywords per field, compared against accent-stripped header cells.
+# The longest matching keyword wins, so 'ten hang' maps to ttb, not hang.
+HEADER_KEYWORDS: Dict[str, List[str]] = {
+    'stt': ['stt', 'tt', 'so tt'],
+    'ttb': ['ten thiet bi', 'ten hang', 'ten hang hoa', 'ten vat tu', 'ten san pham',
+            'hang hoa', 'mo ta', 'description', 'thiet bi'],
+    'model': ['model', 'ma hang', 'ky ma hieu', 'ky hieu', 'chung loai', 'ma san pham'],
+    'ref': ['ref', 'so ref', 'ma ref', 'cat no'],
+    'hang': ['hang', 'hang sx', 'hang san xuat', 'nha san xuat', 'manufacturer', 'brand'],
+    'nsx': ['nsx', 'nuoc sx', 'nuoc san xuat', 'xuat xu', 'origin'],
+    'dvt': ['dvt', 'don vi', 'don vi tinh', 'unit'],
+    'sl': ['sl', 'so luong', 'qty', 'quantity'],
+    'seri': ['seri', 'so seri', 'serial', 'so serial', 's/n', 'sn'],
+}
+
+REQUIRED_FIELDS = ['ttb', 'dvt', 'sl']
+MIN_HEADER_FIELDS = 3
+HEADER_SEARCH_ROWS = 15
+
+_TOTAL_ROW_RE = re.compile(r'^(tong|cong|total)\b')
+_INDEX_CELL_RE = re.compile(r'^\(?\d{1,2}\)?$')
+_REF_IN_MODEL_RE = re.compile(r'\bREF\s*[:.]?\s*([\w\-./]+)', re.IGNORECASE)
+_SERI_PREFIX_RE = re.compile(r'^(?:s/?n|seri(?:al)?|s[ốo]\s+seri)(?:\s*[:.]\s*|\s+)', re.IGNORECASE)
+_SERI_SPLIT_RE = re.compile(r'[,;\n]+')
+
+_SHD_PATTERNS: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r'h[ợo]p\s*đ[ồo]ng\s*(?:s[ốo])?\s*[:.]?\s*([\w][\w\-/.]*\d[\w\-/.]*)', re.IGNORECASE), 'Hợp đồng'),
+    (re.compile(r'\bHĐ\s*(?:s[ốo])?\s*[:.]?\s*([\w][\w\-/.]*\d[\w\-/.]*)'), 'Hợp đồng'),
+    (re.compile(r'\bP\.?O\b\s*(?:s[ốo]|no\.?)?\s*[:.]?\s*([\w][\w\-/.]*\d[\w\-/.]*)', re.IGNORECASE), 'PO'),
+    (re.compile(r'đ[ềe]\s*ngh[ịi]\s*(?:s[ốo])?\s*[:.]?\s*([\w][\w\-/.]*\d[\w\-/.]*)', re.IGNORECASE), 'Đề nghị'),
+]
+_CTY_RE = re.compile(r'(C[ÔO]NG\s+TY\b[^\n:]*)', re.IGNORECASE)
+_BEN_GIAO_RE = re.compile(r'b[êe]n\s+giao', re.IGNORECASE)
+
+
+@dataclass
+class LocalExtraction:
+    """Result of a local (non-LLM) parse, in the same dict shape as the chat JSON."""
+    data: Dict[str, Any]
+    confidence: float
+    source: str
+    notes: List[str] = field(default_factory=list)
+
+
+def normalize_header(cell: Any) -> str:
+    """Accent-stripped, lowercased header text with punctuation collapsed to spaces."""
+    text = strip_accents(str(cell or ''))
+    return re.sub(r'[^a-z0-9/]+', ' ', text).strip()
+
+
+def match_header_cell(cell: Any, keywords: Optional[Dict[str, List[str]]] = None) -> Optional[str]:
+    """Return the device field a header cell refers to, or None."""
+    norm = f" {normalize_header(cell)} "
+    if not norm.strip():
+        return None
+    best, best_len = None, 0
+    for fld, words in (keywords or HEADER_KEYWORDS).items():
+        for word in words:
+            if f" {word} " in norm and len(word) > best_len:
+                best, best_len = fld, len(word)
+    return best
+
+
+def map_header(
+    row: List[Any],
+    keywords: Optional[Dict[str, List[str]]] = None,
+) -> Dict[int, str]:
+    """Map column index -> field for a header row; first column wins on duplicates."""
+    mapping: Dict[int, str] = {}
+    for i, cell in enumerate(row):
+        fld = match_header_cell(cell, keywords)
+        if fld and fld not in mapping.values():
+            mapping[i] = fld
+    return mapping
+
+
+def find_header(
+    rows: List[List[Any]],
+    keywords: Optional[Dict[str, List[str]]] = None,
+) -> Tuple[int, Dict[int, str]]:
+    """Locate the header row among the first rows. Returns (row index, column map) or (-1, {})."""
+    best_idx, best_map = -1, {}
+    for idx, row in enumerate(rows[:HEADER_SEARCH_ROWS]):
+        mapping = map_header(row, keywords)
+        if len(mapping) > len(best_map) and 'ttb' in mapping.values():
+            best_idx, best_map = idx, mapping
+    if len(best_map) < MIN_HEADER_FIELDS:
+        return -1, {}
+    return best_idx, best_map
+
+
+def parse_quantity(value: Any) -> Optional[float]:
+    """Parse '2', '2,00', '1.000' style quantities. Returns None if not numeric."""
+    text = str(value or '').strip()
+    if not text:
+        return None
+    text = re.sub(r'[^\d,.]', '', text)
+    if not text:
+        return None
+    if ',' in text and '.' in text:
+        text = text.replace('.', '').replace(',', '.')
+    elif ',' in text:
+        text = text.replace(',', '.') if len(text.split(',')[-1]) != 3 else text.replace(',', '')
+    elif text.count('.') == 1 and len(text.split('.')[-1]) == 3:
+        text = text.replace('.', '')
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def split_serials(value: Any) -> List[str]:
+    """Split a serial cell into individual serial numbers."""
+    serials = []
+    for part in _SERI_SPLIT_RE.split(str(value or '')):
+        part = _SERI_PREFIX_RE.sub('', part.strip()).strip(' .')
+        if part and part not in ('-', '/'):
+            serials.append(part)
+    return serials
+
+
+def _clean_cell(value: Any) -> str:
+    return re.sub(r'\s+', ' ', str(value or '')).strip()
+
+
+def _is_skip_row(cells: List[str]) -> bool:
+    """Blank rows, '(1) (2) (3)' numbering rows and total rows."""
+    non_empty = [c for c in cells if c]
+    if not non_empty:
+        return True
+    if all(_INDEX_CELL_RE.match(c) for c in non_empty) and len(non_empty) > 2:
+        return True
+    return bool(_TOTAL_ROW_RE.match(normalize_header(non_empty[0])))
+
+
+def rows_to_devices(rows: List[List[Any]], column_map: Dict[int, str]) -> List[Dict[str, Any]]:
+    """Convert data rows to device dicts using a column map.
+
+    Rows with no device name but with serials continue the previous device
+    (serial lists that wrap onto a new table row).
+    """
+    devices: List[Dict[str, Any]] = []
+    for row in rows:
+        cells = [_clean_cell(c) for c in row]
+        if _is_skip_row(cells):
+            continue
+        values = {fld: (row[i] if i < len(row) else '') for i, fld in column_map.items()}
+        ttb = _clean_cell(values.get('ttb'))
+        serials = split_serials(values.get('seri'))
+
+        if not ttb and devices and serials:
+            devices[-1]['seri'].extend(serials)
+            continue
+
+        model = _clean_cell(values.get('model'))
+        ref = _clean_cell(values.get('ref'))
+        if not ref:
+            ref_match = _REF_IN_MODEL_RE.search(model)
+            if ref_match:
+                ref = ref_match.group(1)
+                model = _REF_IN_MODEL_RE.sub('', model).strip(' ,;-')
+
+        devices.append({
+            'ttb': ttb,
+            'model': model,
+            'ref': ref,
+            'hang': _clean_cell(values.get('hang')),
+            'nsx': _clean_cell(values.get('nsx')),
+            'dvt': _clean_cell(values.get('dvt')),
+            'sl': parse_quantity(values.get('sl')),
+            'seri': serials,
+            'pk': None,
+        })
+    return devices
+
+
+def extract_header_fields(text: str) -> Dict[str, str]:
+    """Find shd/shd_type/cty in free document text."""
+    result = {'shd': '', 'shd_type': 'Khác', 'cty': ''}
+    for pattern, shd_type in _SHD_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            result['shd'] = match.group(1).strip(' .')
+            result['shd_type'] = shd_type
+            break
+
+    ben_giao = _BEN_GIAO_RE.search(text)
+    cty_match = _CTY_RE.search(text, ben_giao.start() if ben_giao else 0) or _CTY_RE.search(text)
+    if cty_match:
+        result['cty'] = re.sub(r'\s+', ' ', cty_match.group(1)).strip(' ,.-')
+    return result
+
+
+def score_extraction(devices: List[Dict[str, Any]], column_map: Dict[int, str], meta: Dict[str, str]) -> float:
+    """Confidence in [0, 1] that a local parse matches what the LLM would return."""
+    if not devices:
+        return 0.0
+    mapped = set(column_map.values())
+    header_score = sum(f in mapped for f in REQUIRED_FIELDS) / len(REQUIRED_FIELDS)
+    if 'model' not in mapped:
+        header_score *= 0.8
+
+    valid_rows = sum(1 for d in devices if d['ttb'] and d['sl'] is not None and d['sl'] > 0)
+    row_score = valid_rows / len(devices)
+
+    with_seri = [d for d in devices if d['seri']]
+    seri_score = (
+        sum(1 for d in with_seri if d['sl'] == len(d['seri'])) / len(with_seri)
+        if with_seri else 1.0
+    )
+    meta_score = (bool(meta.get('shd')) + bool(meta.get('cty'))) / 2
+
+    return round(0.4 * header_score + 0.4 * row_score + 0.1 * seri_score + 0.1 * meta_score, 3)
+
+
+def tables_to_extraction(
+    tables: List[List[List[Any]]],
+    text: str,
+    source: str,
+    keywords: Optional[Dict[str, List[str]]] = None,
+) -> Optional[LocalExtraction]:
+    """Turn raw tables (rows of cells) plus document text into a scored extraction.
+
+    A table without a header that has the same width as the previous device
+    table is treated as its continuation on the next page.
+    """
+    devices: List[Dict[str, Any]] = []
+    column_map: Dict[int, str] = {}
+    width = 0
+    notes = []
+
+    for rows in tables:
+        if not rows:
+            continue
+        header_idx, mapping = find_header(rows, keywords)
+        if header_idx >= 0:
+            column_map, width = mapping, len(rows[header_idx])
+            devices.extend(rows_to_devices(rows[header_idx + 1:], column_map))
+        elif column_map and len(rows[0]) == width:
+            notes.append("continuation table")
+            devices.extend(rows_to_devices(rows, column_map))
+
+    if not column_map:
+        return None
+
+    meta = extract_header_fields(text)
+    for d in devices:
+        if d['sl'] is None:
+            d['sl'] = len(d['seri']) or 0
+    confidence = score_extraction(devices, column_map, meta)
+    data = dict(meta, ds=devices)
+    return LocalExtraction(data=data, confidence=confidence, source=source, notes=notes)
+
+
+def parse_markdown_tables(text: str) -> List[List[List[str]]]:
+    """Split markdown tables (as returned by OCR) into rows of cells."""
+    tables: List[List[List[str]]] = []
+    current: List[List[str]] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('|'):
+            cells = [c.strip() for c in line.strip('|').split('|')]
+            if all(re.fullmatch(r':?-{2,}:?', c) for c in cells if c):
+                continue
+            current.append([c.replace('<br>', '\n') for c in cells])
+        elif current:
+            tables.append(current)
+            current = []
+    if current:
+        tables.append(current)
+    return tables
+
+
+def find_pdf_tables(file_bytes: bytes) -> List[List[List[Any]]]:
+    """Extract tables from a digital PDF with PyMuPDF's table finder.
+
+    Uses ruling lines first and falls back to word-position ('text') detection
+    for pages whose tables have no borders.
+    """
+    import fitz
+    tables = []
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        for page in doc:
+            found = page.find_tables()
+            if not found.tables:
+                found = page.find_tables(strategy="text")
+            for table in found.tables:
+                tables.append(table.extract())
+    return tables
+
+
+def extract_table_from_pdf(
+    file_bytes: bytes,
+    text: str,
+    tables: Optional[List[List[List[Any]]]] = None,
+) -> Optional[LocalExtraction]:
+    """Deterministic device-table extraction for PDFs with a text layer.
+
+    Pass `tables` when they were already detected to avoid a second scan.
+    """
+    if tables is None:
+        try:
+            tables = find_pdf_tables(file_bytes)
+        except Exception as e:
+            logger.warning(f"PDF table detection failed: {type(e).__name__}: {e}")
+            return None
+    result = tables_to_extraction(tables, text, source='pdf_table')
+    if result:
+        logger.info(
+            f"Local PDF table parse: {len(result.data['ds'])} devices, "
+            f"confidence={result.confidence}"
+        )
+    return result
@@ -0,0 +1,228 @@
+"""Usage accounting — OCR pages and chat tokens per document, key and stage.
+
+Every API call made by the adapter is recorded in SQLite with the document
+it was made for (a context variable set around each extraction), a
+fingerprint of the key (never the key itself) and the stage ('ocr' or
+'chat'). Per-key and per-day budgets are checked against these records so
+work can skip a key, or defer low-priority batch documents, before the
+provider's quota is hit.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from config.api_keys import key_fingerprint
+from config.settings import get_setting
+from utils.context import current_doc, doc_var
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.usage')
+
+USAGE_DB_PATH = get_setting('USAGE', 'PATH', 'usage.db')
+# 0 disables a budget
+KEY_DAILY_TOKENS = get_setting('USAGE', 'KEY_DAILY_TOKENS', 0, int)
+KEY_DAILY_PAGES = get_setting('USAGE', 'KEY_DAILY_PAGES', 0, int)
+DAILY_TOKENS = get_setting('USAGE', 'DAILY_TOKENS', 0, int)
+DAILY_PAGES = get_setting('USAGE', 'DAILY_PAGES', 0, int)
+# Low-priority work stops once this share of a budget is used, leaving the rest for the UI
+LOW_PRIORITY_SHARE = get_setting('USAGE', 'LOW_PRIORITY_SHARE', 0.8, float)
+
+PRIORITY_NORMAL = 'normal'
+PRIORITY_LOW = 'low'
+
+_current_priority: contextvars.ContextVar[str] = contextvars.ContextVar('usage_priority', default=PRIORITY_NORMAL)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    doc_id TEXT,
+    key_id TEXT,
+    stage TEXT,
+    model TEXT,
+    pages INTEGER DEFAULT 0,
+    prompt_tokens INTEGER DEFAULT 0,
+    completion_tokens INTEGER DEFAULT 0,
+    bytes_sent INTEGER DEFAULT 0,
+    latency_ms REAL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_usage_day_key ON usage (day, key_id);
+CREATE INDEX IF NOT EXISTS idx_usage_doc ON usage (doc_id);
+"""
+
+
+class BudgetExceeded(Exception):
+    """Raised when work is deferred because a usage budget is (nearly) spent."""
+
+
+def _today() -> str:
+    return time.strftime('%Y-%m-%d')
+
+
+@contextmanager
+def usage_scope(doc_id: Optional[str] = None, priority: Optional[str] = None):
+    """Attribute API calls in this context to `doc_id`, at `priority`.
+
+    Either argument left as None keeps the enclosing scope's value.
+    """
+    tokens = []
+    if doc_id is not None:
+        tokens.append((doc_var, doc_var.set(doc_id)))
+    if priority is not None:
+        tokens.append((_current_priority, _current_priority.set(priority)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+@dataclass
+class UsageTotals:
+    """Summed usage for one grouping (document, key, stage or day)."""
+    calls: int = 0
+    pages: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    bytes_sent: int = 0
+    latency_ms: float = 0.0
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+@dataclass
+class UsageSummary:
+    """Usage for one day, broken down by key and by stage."""
+    day: str
+    total: UsageTotals = field(default_factory=UsageTotals)
+    by_key: Dict[str, UsageTotals] = field(default_factory=dict)
+    by_stage: Dict[str, UsageTotals] = field(default_factory=dict)
+    documents: int = 0
+
+    def describe(self) -> str:
+        t = self.total
+        return (f"{self.day}: {t.calls} lượt gọi, {self.documents} tài liệu, {t.pages} trang OCR, "
+                f"{t.prompt_tokens}+{t.completion_tokens} token, {t.bytes_sent / 1e6:.1f} MB tải lên")
+
+
+class UsageLedger:
+    """SQLite-backed usage records. One connection, opened on first use, shared under a lock."""
+
+    def __init__(self, path: str = USAGE_DB_PATH):
+        self._path = path
+        self._lock = threading.RLock()
+        self._db = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self._path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def record(
+        self,
+        api_key: str,
+        stage: str,
+        model: str = '',
+        pages: int = 0,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        bytes_sent: int = 0,
+        latency_ms: float = 0.0,
+    ) -> None:
+        """Store one API call, attributed to the current document scope.
+
+        Accounting must never break an extraction, so storage errors are only logged.
+        """
+        row = (
+            time.time(), _today(), current_doc(), key_fingerprint(api_key), stage, model,
+            int(pages or 0), int(prompt_tokens or 0), int(completion_tokens or 0),
+            int(bytes_sent or 0), float(latency_ms or 0.0),
+        )
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT INTO usage (ts, day, doc_id, key_id, stage, model, pages, prompt_tokens, "
+                    "completion_tokens, bytes_sent, latency_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to record usage: {e}")
+
+    def _totals(self, where: str, params: tuple, group_by: str = '') -> Dict[str, UsageTotals]:
+        select_key = f"{group_by}," if group_by else "'',"
+        sql = (
+            f"SELECT {select_key} COUNT(*), SUM(pages), SUM(prompt_tokens), SUM(completion_tokens), "
+            f"SUM(bytes_sent), SUM(latency_ms) FROM usage WHERE {where}"
+        )
+        if group_by:
+            sql += f" GROUP BY {group_by}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return {
+            row[0]: UsageTotals(row[1], row[2] or 0, row[3] or 0, row[4] or 0, row[5] or 0, row[6] or 0.0)
+            for row in rows if row[1]
+        }
+
+    def for_document(self, doc_id: str) -> Dict[str, UsageTotals]:
+        """Usage of one document, by stage."""
+        return self._totals("doc_id = ?", (doc_id,), group_by='stage')
+
+    def summary(self, day: Optional[str] = None) -> UsageSummary:
+        """Usage for `day` (YYYY-MM-DD, default today), by key and by stage."""
+        day = day or _today()
+        summary = UsageSummary(day=day)
+        summary.total = self._totals("day = ?", (day,)).get('', UsageTotals())
+        summary.by_key = self._totals("day = ?", (day,), group_by='key_id')
+        summary.by_stage = self._totals("day = ?", (day,), group_by='stage')
+        with self._lock:
+            summary.documents = self._conn.execute(
+                "SELECT COUNT(DISTINCT doc_id) FROM usage WHERE day = ? AND doc_id != ''", (day,)
+            ).fetchone()[0]
+        return summary
+
+    def key_has_budget(self, api_key: str, priority: Optional[str] = None) -> bool:
+        """False once the key's daily token/page budget (or the global one) is spent.
+
+        Low-priority work gives up at LOW_PRIORITY_SHARE of each budget.
+        """
+        if not (KEY_DAILY_TOKENS or KEY_DAILY_PAGES or DAILY_TOKENS or DAILY_PAGES):
+            return True
+        share = LOW_PRIORITY_SHARE if (priority or current_priority()) == PRIORITY_LOW else 1.0
+        day = _today()
+        used = self._totals("day = ? AND key_id = ?", (day, key_fingerprint(api_key))).get('', UsageTotals())
+        if _over(used, KEY_DAILY_TOKENS, KEY_DAILY_PAGES, share):
+            return False
+        total = self._totals("day = ?", (day,)).get('', UsageTotals())
+        return not _over(total, DAILY_TOKENS, DAILY_PAGES, share)
+
+    def budget_available(self, api_keys: List[str], priority: Optional[str] = None) -> bool:
+        """True if at least one key can still take work at `priority`."""
+        return any(self.key_has_budget(k, priority) for k in api_keys)
+
+
+def _over(used: UsageTotals, token_budget: int, page_budget: int, share: float) -> bool:
+    return bool(
+        (token_budget and used.tokens >= token_budget * share)
+        or (page_budget and used.pages >= page_budget * share)
+    )
+
+
+usage_ledger = UsageLedger()
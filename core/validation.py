@@ -0,0 +1,215 @@
+"""Extraction validation — rule checks plus targeted follow-up chat calls.
+
+Rules run on the raw extraction dict in microseconds. Problems that can be
+fixed locally (an off-vocabulary shd_type, duplicated serials) are fixed in
+place. Device-level problems (no name, quantity not matching the serial
+count) get one focused chat call on only the OCR lines around that device,
+instead of repeating OCR and the full extraction.
+"""
+
+import re
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from config.settings import get_setting
+from core.models import SHD_TYPES, Device, device_json_schema
+from core.routing import SMALL_MODEL
+from sdk.adapter import _parse_json_response
+from utils.text import convert_none_to_empty_string, strip_accents
+from utils.logging_setup import get_logger
+
+logger = get_logger('core.validation')
+
+FOLLOWUP_MODEL = get_setting('VALIDATION', 'FOLLOWUP_MODEL', SMALL_MODEL)
+MAX_FOLLOWUPS = get_setting('VALIDATION', 'MAX_FOLLOWUPS', 5, int)
+CONTEXT_LINES = 3          # lines kept above/below each anchor line
+MAX_SNIPPET_CHARS = 4000
+
+FOLLOWUP_SYSTEM_INSTRUCTION = (
+    "Bạn là một nhà phân tích tài liệu kỹ thuật. Đọc lại đoạn trích từ 'Biên bản bàn giao' "
+    "và trả về JSON của đúng một thiết bị."
+)
+
+FOLLOWUP_PROMPTS = {
+    'missing_ttb': "Thiết bị dưới đây thiếu tên thiết bị (ttb). Đọc đoạn trích và điền ttb.",
+    'serial_count': ("Số lượng (sl) của thiết bị dưới đây không khớp với số lượng số seri. "
+                     "Đọc kỹ khối số seri trong đoạn trích, liệt kê đầy đủ từng seri và số lượng đúng."),
+    'bad_quantity': "Số lượng (sl) của thiết bị dưới đây không hợp lệ. Đọc đoạn trích và điền sl đúng.",
+}
+
+FOLLOWUP_JSON_RULE = (
+    "Chỉ trả về JSON thuần (không Markdown) của thiết bị với các trường "
+    "ttb, model, ref, hang, nsx, dvt, sl (số), seri (danh sách), pk (danh sách hoặc null)."
+)
+
+_SHD_TYPE_ALIASES = {strip_accents(t): t for t in SHD_TYPES}
+_SHD_TYPE_ALIASES.update({'hd': 'Hợp đồng', 'hdmb': 'Hợp đồng', 'purchase order': 'PO', 'dn': 'Đề nghị'})
+
+
+@dataclass
+class Issue:
+    """One validation finding. `device` is the index in ds, or None for the document."""
+    code: str
+    message: str
+    device: Optional[int] = None
+    fatal: bool = False       # the extraction is unusable as a whole
+
+
+def normalize_shd_type(value: Any) -> str:
+    """Map free-form shd_type text onto SHD_TYPES ('Khác' if unknown)."""
+    key = strip_accents(str(value or '')).strip().rstrip('.')
+    return _SHD_TYPE_ALIASES.get(key, 'Khác')
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def validate_data(data: Any) -> List[Issue]:
+    """Rule checks on a raw extraction dict (before None -> '' conversion)."""
+    if not isinstance(data, dict):
+        return [Issue('not_object', "reply is not a JSON object", fatal=True)]
+    devices = data.get('ds')
+    if not isinstance(devices, list) or not devices:
+        return [Issue('no_devices', "no devices", fatal=True)]
+
+    issues = []
+    if data.get('shd_type') not in SHD_TYPES:
+        issues.append(Issue('shd_type', f"shd_type {data.get('shd_type')!r} is not one of {SHD_TYPES}"))
+    for i, d in enumerate(devices):
+        if not isinstance(d, dict):
+            issues.append(Issue('not_object', f"device {i + 1} is not an object", i, fatal=True))
+            continue
+        if not str(d.get('ttb') or '').strip():
+            issues.append(Issue('missing_ttb', f"device {i + 1}: missing name", i))
+        sl = _number(d.get('sl'))
+        seri = [str(s).strip() for s in (d.get('seri') or []) if str(s or '').strip()] \
+            if isinstance(d.get('seri'), list) else []
+        if len(set(seri)) < len(seri):
+            issues.append(Issue('duplicate_serial', f"device {i + 1}: duplicated serials", i))
+        if sl is None or sl <= 0:
+            issues.append(Issue('bad_quantity', f"device {i + 1}: quantity {d.get('sl')!r} is not positive", i))
+        elif seri and len(set(seri)) != sl:
+            issues.append(Issue('serial_count', f"device {i + 1}: quantity {sl:g} but {len(set(seri))} serials", i))
+    return issues
+
+
+def needs_escalation(issues: List[Issue], device_count: int) -> bool:
+    """Fatal problems, or problems on more than half of the devices: re-extract on a stronger model."""
+    if any(i.fatal for i in issues):
+        return True
+    affected = {i.device for i in issues if i.device is not None}
+    return device_count > 0 and len(affected) > device_count / 2
+
+
+def _fix_locally(data: Dict[str, Any], issues: List[Issue]) -> List[Issue]:
+    """Apply rule-only fixes in place; returns the issues that still need the OCR text."""
+    remaining = []
+    for issue in issues:
+        if issue.code == 'shd_type':
+            data['shd_type'] = normalize_shd_type(data.get('shd_type'))
+        elif issue.code == 'duplicate_serial':
+            d = data['ds'][issue.device]
+            # A count mismatch after de-duplication is reported separately as 'serial_count'
+            d['seri'] = list(dict.fromkeys(str(s).strip() for s in d['seri'] if str(s or '').strip()))
+        else:
+            remaining.append(issue)
+    return remaining
+
+
+def relevant_lines(ocr_text: str, device: Dict[str, Any], serial_block: bool = False) -> str:
+    """OCR lines around the device: lines mentioning its model, ref, name or serials,
+    plus CONTEXT_LINES on each side. With `serial_block`, the window also extends
+    over neighbouring lines that look like serial lists.
+    """
+    lines = ocr_text.splitlines()
+    anchors = [str(device.get(k) or '').strip() for k in ('model', 'ref', 'ttb')]
+    anchors += [str(s).strip() for s in (device.get('seri') or [])[:20]]
+    anchors = [a.lower() for a in anchors if len(a) >= 3]
+    hits = [i for i, line in enumerate(lines) if any(a in line.lower() for a in anchors)]
+    if not hits:
+        return ''
+
+    keep = set()
+    for i in hits:
+        keep.update(range(max(0, i - CONTEXT_LINES), min(len(lines), i + CONTEXT_LINES + 1)))
+    if serial_block:
+        serial_like = re.compile(r'\b(?:s/?n|seri|serial)\b|[A-Z0-9]{6,}', re.IGNORECASE)
+        for i in sorted(keep):
+            j = i + 1
+            while j < len(lines) and j not in keep and serial_like.search(lines[j]):
+                keep.add(j)
+                j += 1
+    snippet = '\n'.join(lines[i] for i in sorted(keep))
+    return snippet[:MAX_SNIPPET_CHARS]
+
+
+def _apply_followup(device: Dict[str, Any], reply: Dict[str, Any], code: str) -> bool:
+    """Merge the fields the follow-up was asked for; True if the device is now valid."""
+    if code == 'missing_ttb':
+        if str(reply.get('ttb') or '').strip():
+            device['ttb'] = str(reply['ttb']).strip()
+    else:
+        seri = [str(s).strip() for s in (reply.get('seri') or []) if str(s or '').strip()]
+        sl = _number(reply.get('sl'))
+        if seri and (sl is None or sl == len(set(seri))):
+            device['seri'], device['sl'] = list(dict.fromkeys(seri)), len(set(seri))
+        elif sl and sl > 0 and code == 'bad_quantity':
+            device['sl'] = sl
+    still_failing = [i for i in validate_data({'shd_type': SHD_TYPES[0], 'ds': [device]}) if i.code == code]
+    return not still_failing
+
+
+def repair(
+    adapter,
+    data: Dict[str, Any],
+    ocr_text: str,
+    structured: bool = False,
+    issues: Optional[List[Issue]] = None,
+) -> Dict[str, Any]:
+    """Fix what the rules can, then ask the chat model about each failing device
+    using only its OCR lines. Unfixable issues are logged and left as they are.
+    """
+    issues = _fix_locally(data, validate_data(data) if issues is None else issues)
+    followups = 0
+    for issue in issues:
+        if issue.device is None or issue.fatal:
+            continue
+        if followups >= MAX_FOLLOWUPS:
+            logger.info(f"Follow-up limit reached, leaving: {issue.message}")
+            continue
+        device = data['ds'][issue.device]
+        snippet = relevant_lines(ocr_text, device, serial_block=issue.code == 'serial_count')
+        if not snippet:
+            logger.info(f"No OCR lines found for {issue.message}")
+            continue
+        followups += 1
+        current = json.dumps(Device.from_dict(convert_none_to_empty_string(device)).to_dict(), ensure_ascii=False)
+        prompt = f"{FOLLOWUP_PROMPTS[issue.code]}\n\nThiết bị hiện tại: {current}"
+        if not structured:
+            prompt += f"\n\n{FOLLOWUP_JSON_RULE}"
+        try:
+            text = adapter.chat_extract(
+                snippet, prompt, FOLLOWUP_SYSTEM_INSTRUCTION,
+                response_schema=device_json_schema() if structured else None,
+                model=FOLLOWUP_MODEL,
+                schema_name="device",
+            )
+            if not text:
+                raise ValueError("empty reply")
+            reply = json.loads(text) if structured else _parse_json_response(text)
+        except ValueError as e:
+            logger.info(f"Follow-up for {issue.message} unparsable: {e}")
+            continue
+        except Exception as e:
+            # The main extraction already succeeded; never lose it over a follow-up
+            logger.warning(f"Follow-up calls stopped: {type(e).__name__}: {e}")
+            break
+        fixed = isinstance(reply, dict) and _apply_followup(device, reply, issue.code)
+        logger.info(f"Follow-up ({len(snippet)} chars) for {issue.message}: {'fixed' if fixed else 'not fixed'}")
+    return data
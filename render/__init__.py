@@ -0,0 +1 @@
+"""Output renderers (DOCX/XLSX/PDF) for extracted handovers."""
@@ -0,0 +1,44 @@
+"""Shared row building for the tabular renderers."""
+
+from typing import Any, Dict, List
+from core.models import GroupedDevice
+
+REGISTER_COLUMNS = [
+    'STT', 'Tên thiết bị', 'Model', 'REF', 'Hãng', 'Nước sản xuất',
+    'ĐVT', 'Số lượng', 'Số seri', 'Phụ kiện',
+]
+
+
+def accessories_text(pk: Any) -> str:
+    """Accessories as one '; '-separated string."""
+    if not pk:
+        return ""
+    if isinstance(pk, (list, tuple)):
+        return "; ".join(str(x).strip() for x in pk if x)
+    return str(pk).strip()
+
+
+def seri_list_text(seri_text: str) -> str:
+    """Drop the 'Số seri: ' label used in the Word cell."""
+    return seri_text.split(':', 1)[1].strip() if seri_text.startswith('Số seri:') else seri_text
+
+
+def register_rows(grouped_devices: List[GroupedDevice]) -> List[List[Any]]:
+    """One row per grouped device, in REGISTER_COLUMNS order."""
+    return [
+        [
+            count, item.ttb, item.model, item.ref, item.hang, item.nsx,
+            item.dvt, int(item.sl), seri_list_text(item.seri_text), accessories_text(item.pk),
+        ]
+        for count, item in enumerate(grouped_devices, 1)
+    ]
+
+
+def header_lines(data: Dict[str, Any]) -> List[str]:
+    """Document-level fields shown above the device table."""
+    lines = []
+    if data.get('cty'):
+        lines.append(f"Bên giao: {data['cty']}")
+    if data.get('shd'):
+        lines.append(f"{data.get('shd_type') or 'Số'}: {data['shd']}")
+    return lines
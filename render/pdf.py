@@ -0,0 +1,56 @@
+"""PDF copy renderer — lays out the handover as HTML with PyMuPDF's Story."""
+
+import html
+from io import BytesIO
+from typing import Any, Dict, List
+from core.models import GroupedDevice
+from render.common import REGISTER_COLUMNS, header_lines, register_rows
+from utils.logging_setup import get_logger
+
+logger = get_logger('render.pdf')
+
+PAGE_MARGIN = 36  # points
+
+PDF_CSS = """
+body { font-family: sans-serif; font-size: 9pt; }
+h1 { text-align: center; font-size: 14pt; }
+table { border-collapse: collapse; width: 100%; }
+th, td { border: 0.5pt solid black; padding: 2pt; vertical-align: top; }
+th { font-weight: bold; }
+"""
+
+
+def _esc(value: Any) -> str:
+    return html.escape(str(value)).replace('\n', '<br/>')
+
+
+def _build_html(data: Dict[str, Any], grouped_devices: List[GroupedDevice]) -> str:
+    parts = ["<h1>BIÊN BẢN BÀN GIAO</h1>"]
+    parts += [f"<p>{_esc(line)}</p>" for line in header_lines(data)]
+    parts.append("<table><tr>" + "".join(f"<th>{_esc(c)}</th>" for c in REGISTER_COLUMNS) + "</tr>")
+    for row in register_rows(grouped_devices):
+        parts.append("<tr>" + "".join(f"<td>{_esc(v)}</td>" for v in row) + "</tr>")
+    parts.append("</table>")
+    return "".join(parts)
+
+
+def render_pdf(data: Dict[str, Any], grouped_devices: List[GroupedDevice]) -> BytesIO:
+    """Render an A4 PDF, writing pages to the output as they are laid out."""
+    import fitz
+
+    byte_io = BytesIO()
+    story = fitz.Story(html=_build_html(data, grouped_devices), user_css=PDF_CSS)
+    writer = fitz.DocumentWriter(byte_io)
+    mediabox = fitz.paper_rect('a4')
+    where = mediabox + (PAGE_MARGIN, PAGE_MARGIN, -PAGE_MARGIN, -PAGE_MARGIN)
+
+    more = True
+    while more:
+        device = writer.begin_page(mediabox)
+        more, _ = story.place(where)
+        story.draw(device)
+        writer.end_page()
+    writer.close()
+
+    byte_io.seek(0)
+    return byte_io
@@ -0,0 +1,87 @@
+"""Multi-format output stage — renders every requested format from one extraction."""
+
+import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+from core.models import GroupedDevice
+from render.pdf import render_pdf
+from render.xlsx import render_xlsx
+from template.filler import fill_word_template
+from utils.logging_setup import get_logger
+
+logger = get_logger('render.pipeline')
+
+
+@dataclass
+class OutputFormat:
+    name: str
+    extension: str
+    mime: str
+    render: Callable[[Dict[str, Any], List[GroupedDevice]], BytesIO]
+
+
+FORMATS: Dict[str, OutputFormat] = {
+    'docx': OutputFormat(
+        'docx', '.docx',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        fill_word_template,
+    ),
+    'xlsx': OutputFormat(
+        'xlsx', '.xlsx',
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        render_xlsx,
+    ),
+    'pdf': OutputFormat('pdf', '.pdf', 'application/pdf', render_pdf),
+}
+
+
+@dataclass
+class RenderedOutput:
+    format: str
+    filename: str
+    mime: str
+    content: BytesIO
+    elapsed_ms: float
+
+
+def _render_one(fmt: OutputFormat, data, grouped_devices, base_name: str) -> RenderedOutput:
+    started = time.perf_counter()
+    content = fmt.render(data, grouped_devices)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Rendered {fmt.name} in {elapsed_ms:.0f} ms")
+    return RenderedOutput(fmt.name, base_name + fmt.extension, fmt.mime, content, elapsed_ms)
+
+
+def render_outputs(
+    data: Dict[str, Any],
+    grouped_devices: List[GroupedDevice],
+    formats: Sequence[str],
+    filename: str,
+) -> Iterator[RenderedOutput]:
+    """Render all requested formats in parallel, yielding them in the order requested.
+
+    `filename` is the .docx name from generate_filename; other formats reuse its stem.
+    A failing renderer is logged and skipped so the other formats still arrive.
+    """
+    base_name = os.path.splitext(filename)[0]
+    selected = [FORMATS[f] for f in formats if f in FORMATS]
+    if not selected:
+        return
+
+    with ThreadPoolExecutor(max_workers=len(selected)) as executor:
+        # Renderers see the caller's document scope (usage and profiling attribution)
+        futures = [
+            (fmt.name, executor.submit(contextvars.copy_context().run, _render_one, fmt, data, grouped_devices,
+                                       base_name))
+            for fmt in selected
+        ]
+        # Submission order: download buttons appear in the order the formats were selected
+        for name, future in futures:
+            try:
+                yield future.result()
+            except Exception as e:
+                logger.error(f"Rendering {name} failed: {type(e).__name__}: {e}")
@@ -0,0 +1,47 @@
+"""XLSX equipment register renderer (openpyxl, write-only/streaming mode)."""
+
+from io import BytesIO
+from typing import Any, Dict, List
+from core.models import GroupedDevice
+from render.common import REGISTER_COLUMNS, header_lines, register_rows
+from utils.logging_setup import get_logger
+
+logger = get_logger('render.xlsx')
+
+COLUMN_WIDTHS = [6, 40, 18, 16, 16, 16, 8, 10, 40, 40]
+
+
+def render_xlsx(data: Dict[str, Any], grouped_devices: List[GroupedDevice]) -> BytesIO:
+    """Render the equipment register as a single-sheet workbook."""
+    try:
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font
+    except ImportError:
+        logger.error("openpyxl is not installed; XLSX output unavailable")
+        raise
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Thiết bị")
+    for i, width in enumerate(COLUMN_WIDTHS):
+        ws.column_dimensions[chr(ord('A') + i)].width = width
+
+    for line in header_lines(data):
+        ws.append([line])
+    ws.append([])
+
+    bold = Font(bold=True)
+    header = []
+    for title in REGISTER_COLUMNS:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = bold
+        header.append(cell)
+    ws.append(header)
+
+    for row in register_rows(grouped_devices):
+        ws.append(row)
+
+    byte_io = BytesIO()
+    wb.save(byte_io)
+    byte_io.seek(0)
+    return byte_io
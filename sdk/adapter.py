@@ -1,15 +1,71 @@
 """Mistral SDK adapter — OCR + chat completion with key rotation."""
 
 import json
-import base64
 import time
-from typing import Optional, Dict, Any, List
+import binascii
+import threading
+from typing import Callable, Optional, Dict, Any, List
 from mistralai.client import Mistral
 from config.api_keys import pool
+from config.settings import LARGE_MODEL, OCR_MODEL
+from sdk.rate_limit import is_rate_limited, rate_limiter, retry_after
+from sdk.replay import MODE_RECORD, MODE_REPLAY, REPLAY_MODE, record_client, replay_client
 from utils.logging_setup import get_logger
 
 logger = get_logger('sdk.adapter')
 
+# Raw bytes per base64 chunk; a multiple of 3 so chunks encode without padding
+DATA_URL_CHUNK = 3 * 256 * 1024
+
+
+def build_data_url(data, mime_type: str) -> str:
+    """`data:<mime>;base64,...` URL for bytes or any buffer (e.g. a memoryview).
+
+    Encodes chunk by chunk into one preallocated buffer, so the only full-size
+    copies are that buffer and the returned string (no intermediate base64
+    bytes/str kept alive next to the URL).
+    """
+    view = memoryview(data).cast('B')
+    prefix = f"data:{mime_type};base64,".encode('ascii')
+    out = bytearray(len(prefix) + 4 * ((len(view) + 2) // 3))
+    out[:len(prefix)] = prefix
+    pos = len(prefix)
+    for i in range(0, len(view), DATA_URL_CHUNK):
+        encoded = binascii.b2a_base64(view[i:i + DATA_URL_CHUNK], newline=False)
+        out[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+    return out.decode('ascii')
+
+
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def client_for(api_key: str):
+    """The process-wide client for a key, created on first use.
+
+    Sharing one client per key keeps its HTTP connection pool, so TLS is set
+    up once per key instead of once per document.
+    """
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            if REPLAY_MODE == MODE_REPLAY:
+                client = replay_client()
+            else:
+                client = Mistral(api_key=api_key)
+                if REPLAY_MODE == MODE_RECORD:
+                    client = record_client(client)
+            _clients[api_key] = client
+        return client
+
+
+def ping(api_key: str) -> float:
+    """Cheap authenticated request (model list); returns its latency in ms, raises on failure."""
+    started = time.perf_counter()
+    client_for(api_key).models.list()
+    return (time.perf_counter() - started) * 1000
+
 
 def _parse_json_response(text: str) -> Optional[Dict[str, Any]]:
     """Strip markdown code fences and parse JSON."""
@@ -24,33 +80,63 @@ def _parse_json_response(text: str) -> Optional[Dict[str, Any]]:
 
 
 class MistralAdapter:
-    """Mistral OCR + Chat adapter with key rotation."""
+    """Mistral OCR + Chat adapter with key rotation.
+
+    [REPLAY] mode = record saves every response; mode = replay serves them
+    from disk without network access (see sdk.replay).
 
-    def __init__(self, api_key: str):
+    `on_usage(api_key, stage, model=, pages=, prompt_tokens=, completion_tokens=,
+    bytes_sent=, latency_ms=)` is called after each successful API call; callers
+    in core pass their usage ledger.
+    """
+
+    def __init__(self, api_key: str, on_usage: Optional[Callable[..., None]] = None):
         self._api_key = api_key
-        self._client = Mistral(api_key=api_key)
+        self._client = client_for(api_key)
+        self._on_usage = on_usage
+        # Nothing to protect from bursts when answering from recordings
+        self._rate_limited = REPLAY_MODE != MODE_REPLAY
 
     @property
     def is_available(self) -> bool:
         return self._client is not None
 
+    def _report_usage(self, stage: str, **usage) -> None:
+        if self._on_usage is None:
+            return
+        try:
+            self._on_usage(self._api_key, stage, **usage)
+        except Exception as e:  # accounting must never fail a call that succeeded
+            logger.warning(f"Usage hook failed: {type(e).__name__}: {e}")
+
     def ocr_document(self, file_bytes: bytes, mime_type: str) -> Optional[str]:
         """OCR a document/image using Mistral OCR. Returns markdown text."""
         try:
-            b64_data = base64.b64encode(file_bytes).decode('utf-8')
-            data_url = f"data:{mime_type};base64,{b64_data}"
+            data_url = build_data_url(file_bytes, mime_type)
 
             if mime_type == 'application/pdf':
                 doc = {"type": "document_url", "document_url": data_url}
             else:
                 doc = {"type": "image_url", "image_url": data_url}
 
+            if self._rate_limited:
+                rate_limiter.acquire(self._api_key, 'ocr')
+            started = time.perf_counter()
             ocr_response = self._client.ocr.process(
-                model="mistral-ocr-latest",
+                model=OCR_MODEL,
                 document=doc,
             )
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            rate_limiter.on_success(self._api_key, 'ocr')
 
             pages = ocr_response.pages if ocr_response.pages else []
+            usage_info = getattr(ocr_response, 'usage_info', None)
+            self._report_usage(
+                'ocr', model=OCR_MODEL,
+                pages=getattr(usage_info, 'pages_processed', None) or len(pages),
+                bytes_sent=len(data_url),
+                latency_ms=elapsed_ms,
+            )
             parts = [p.markdown for p in pages if p.markdown]
             result = "\n\n".join(parts)
 
@@ -61,6 +147,8 @@ class MistralAdapter:
             return None
 
         except Exception as e:
+            if is_rate_limited(e):
+                rate_limiter.on_rate_limited(self._api_key, 'ocr', retry_after(e))
             logger.error(f"OCR failed: {type(e).__name__}: {e}")
             raise
 
@@ -69,18 +157,59 @@ class MistralAdapter:
         ocr_text: str,
         prompt: str,
         system_instruction: str,
+        response_schema: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+        schema_name: str = "handover",
     ) -> Optional[str]:
-        """Send OCR text to Mistral chat for structured extraction."""
+        """Send OCR text to Mistral chat for structured extraction.
+
+        With `response_schema`, the model is constrained to JSON matching the schema
+        (structured output, named `schema_name`), so the reply needs no fence
+        stripping. `model` defaults to the large tier ([MODELS] large).
+        """
+        model = model or LARGE_MODEL
+        kwargs = {}
+        if response_schema is not None:
+            kwargs['response_format'] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": schema_name,
+                    "schema_definition": response_schema,
+                    "strict": True,
+                },
+            }
         try:
+            if self._rate_limited:
+                rate_limiter.acquire(self._api_key, 'chat')
+            started = time.perf_counter()
             response = self._client.chat.complete(
-                model="mistral-large-latest",
+                model=model,
                 messages=[
                     {"role": "system", "content": system_instruction},
                     {"role": "user", "content": f"{prompt}\n\n---\nNội dung OCR:\n{ocr_text}"},
                 ],
+                **kwargs,
+            )
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            rate_limiter.on_success(self._api_key, 'chat')
+            usage = getattr(response, 'usage', None)
+            logger.info(
+                f"Chat usage: model={model} mode={'schema' if response_schema is not None else 'prompt'} "
+                f"prompt_tokens={getattr(usage, 'prompt_tokens', None)} "
+                f"completion_tokens={getattr(usage, 'completion_tokens', None)} "
+                f"latency_ms={elapsed_ms:.0f}"
+            )
+            self._report_usage(
+                'chat', model=model,
+                prompt_tokens=getattr(usage, 'prompt_tokens', 0),
+                completion_tokens=getattr(usage, 'completion_tokens', 0),
+                bytes_sent=len(ocr_text.encode('utf-8')) + len(prompt.encode('utf-8')),
+                latency_ms=elapsed_ms,
             )
             return response.choices[0].message.content.strip()
         except Exception as e:
+            if is_rate_limited(e):
+                rate_limiter.on_rate_limited(self._api_key, 'chat', retry_after(e))
             logger.error(f"Chat extraction failed: {type(e).__name__}: {e}")
             raise
 
@@ -0,0 +1,278 @@
+"""OCR backends — Mistral OCR or a local Tesseract engine, picked per document.
+
+`OcrBackend` turns one page image (or photo) into text. `MistralOcrBackend`
+wraps the adapter; `TesseractOcrBackend` runs on the CPU without network
+or API keys and rebuilds table rows from word positions, so its output
+goes through the same markdown table and supplier profile parsers as
+Mistral's. pytesseract and the tesseract binary (with the `vie` language
+data) are optional: without them only Mistral is used.
+
+`OcrRouter` chooses per document ([OCR] backend = auto):
+
+- scans below local_min_quality (photos, shadows, low resolution) always
+  go to Mistral; a local engine misreads them;
+- clean scans go to the local engine when no key can take an OCR request
+  now (the caller passes only keys with usage budget left; their rate limit
+  buckets are paused beyond the acquire timeout), or when Mistral's recent latency per page is above slow_ms
+  and the local engine has been faster;
+- otherwise Mistral, falling back to the local engine when OCR fails on
+  rate limits or timeouts and no other key is ready (local_fallback).
+"""
+
+import io
+import time
+import functools
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from config.settings import get_bool, get_setting
+from sdk.rate_limit import ACQUIRE_TIMEOUT, RateLimitTimeout, is_rate_limited, rate_limiter
+from utils.image import scan_quality
+from utils.logging_setup import get_logger
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:  # optional: local OCR needs pytesseract and the tesseract binary
+    pytesseract = None
+
+logger = get_logger('sdk.ocr')
+
+BACKEND_AUTO = 'auto'
+BACKEND_MISTRAL = 'mistral'
+BACKEND_LOCAL = 'local'
+
+OCR_BACKEND = get_setting('OCR', 'BACKEND', BACKEND_AUTO, str.lower)
+LOCAL_FALLBACK = get_bool('OCR', 'LOCAL_FALLBACK', True)
+LOCAL_MIN_QUALITY = get_setting('OCR', 'LOCAL_MIN_QUALITY', 0.85, float)
+# Mistral OCR slower than this per page (recent average) sends clean scans to the local engine
+SLOW_MS = get_setting('OCR', 'SLOW_MS', 20000.0, float)
+TESSERACT_LANG = get_setting('OCR', 'TESSERACT_LANG', 'vie+eng')
+TESSERACT_CMD = get_setting('OCR', 'TESSERACT_CMD', '')
+TESSERACT_CONFIG = '--psm 6'        # one uniform block: a table row stays on one line
+LATENCY_ALPHA = 0.3                 # weight of the newest call in the moving average
+LATENCY_TTL = 300.0                 # seconds; older averages are forgotten so Mistral gets retried
+CELL_GAP_FACTOR = 1.5               # word gap, in line heights, that starts a new table cell
+TABLE_MIN_CELLS = 3
+
+if OCR_BACKEND not in (BACKEND_AUTO, BACKEND_MISTRAL, BACKEND_LOCAL):
+    logger.warning(f"Unknown OCR backend {OCR_BACKEND!r}, using {BACKEND_AUTO!r}")
+    OCR_BACKEND = BACKEND_AUTO
+
+
+class LatencyTracker:
+    """Moving average of OCR milliseconds per page, per backend."""
+
+    def __init__(self, alpha: float = LATENCY_ALPHA, ttl: float = LATENCY_TTL):
+        self._alpha = alpha
+        self._ttl = ttl
+        self._averages: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, backend: str, ms: float) -> None:
+        with self._lock:
+            average, updated = self._averages.get(backend, (None, 0.0))
+            if average is None or time.monotonic() - updated > self._ttl:
+                average = ms
+            else:
+                average = self._alpha * ms + (1 - self._alpha) * average
+            self._averages[backend] = (average, time.monotonic())
+
+    def get(self, backend: str) -> Optional[float]:
+        """Recent average, or None if the backend has not been used lately."""
+        with self._lock:
+            average, updated = self._averages.get(backend, (None, 0.0))
+        if average is None or time.monotonic() - updated > self._ttl:
+            return None
+        return average
+
+
+ocr_latency = LatencyTracker()
+
+
+class OcrBackend(ABC):
+    """One OCR engine: image bytes -> text (markdown tables where it can tell)."""
+
+    name = ''
+    local = False
+
+    @property
+    def is_available(self) -> bool:
+        return True
+
+    def ocr(self, file_bytes: bytes, mime_type: str) -> Optional[str]:
+        """OCR one image and record the call's latency."""
+        started = time.perf_counter()
+        text = self._ocr(file_bytes, mime_type)
+        ocr_latency.observe(self.name, (time.perf_counter() - started) * 1000)
+        return text
+
+    @abstractmethod
+    def _ocr(self, file_bytes: bytes, mime_type: str) -> Optional[str]:
+        """Engine-specific OCR of one image; None if it found no text."""
+
+
+class MistralOcrBackend(OcrBackend):
+    """Mistral OCR through one key's adapter (markdown output)."""
+
+    name = BACKEND_MISTRAL
+
+    def __init__(self, adapter):
+        self._adapter = adapter
+
+    def _ocr(self, file_bytes: bytes, mime_type: str) -> Optional[str]:
+        return self._adapter.ocr_document(file_bytes, mime_type)
+
+
+@functools.lru_cache(maxsize=1)
+def tesseract_lang() -> str:
+    """Configured languages that tesseract has data for ('' if tesseract is unusable)."""
+    if pytesseract is None:
+        return ''
+    if TESSERACT_CMD:
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    try:
+        version = pytesseract.get_tesseract_version()
+        installed = set(pytesseract.get_languages(config=''))
+    except Exception as e:  # TesseractNotFoundError, OSError
+        logger.info(f"Local OCR unavailable: {type(e).__name__}: {e}")
+        return ''
+    langs = [lang for lang in TESSERACT_LANG.split('+') if lang in installed]
+    if not langs:
+        logger.warning(f"Local OCR unavailable: tesseract {version} has none of {TESSERACT_LANG!r}")
+        return ''
+    logger.info(f"Local OCR: tesseract {version}, lang={'+'.join(langs)}")
+    return '+'.join(langs)
+
+
+def layout_to_text(data: Dict[str, List[Any]]) -> str:
+    """pytesseract.image_to_data output -> text lines, table rows as markdown.
+
+    Words on one line separated by more than CELL_GAP_FACTOR line heights
+    are different cells; a line with TABLE_MIN_CELLS or more cells becomes
+    a `| a | b | c |` row, and a separator row follows the first row of
+    each table so it reads like Mistral's markdown.
+    """
+    lines: Dict[tuple, list] = {}
+    for i, word in enumerate(data['text']):
+        word = (word or '').strip()
+        if not word or float(data['conf'][i]) < 0:
+            continue
+        key = (data['page_num'][i], data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append((data['left'][i], data['width'][i], data['height'][i], word))
+
+    out: List[str] = []
+    in_table = False
+    block = None
+    for key, words in lines.items():
+        if block is not None and key[:2] != block and not in_table:
+            out.append('')
+        block = key[:2]
+        words.sort()
+        height = sorted(w[2] for w in words)[len(words) // 2]
+        cells = [[words[0][3]]]
+        for prev, word in zip(words, words[1:]):
+            if word[0] - (prev[0] + prev[1]) > CELL_GAP_FACTOR * height:
+                cells.append([])
+            cells[-1].append(word[3])
+        if len(cells) >= TABLE_MIN_CELLS:
+            out.append('| ' + ' | '.join(' '.join(c) for c in cells) + ' |')
+            if not in_table:
+                out.append('|' + '---|' * len(cells))
+            in_table = True
+        else:
+            if in_table:
+                out.append('')
+            out.append(' '.join(w[3] for w in words))
+            in_table = False
+    return '\n'.join(out).strip()
+
+
+class TesseractOcrBackend(OcrBackend):
+    """Local CPU OCR with tesseract; reads images only (PDF pages are rendered first)."""
+
+    name = 'tesseract'
+    local = True
+
+    @property
+    def is_available(self) -> bool:
+        return bool(tesseract_lang())
+
+    def _ocr(self, file_bytes: bytes, mime_type: str) -> Optional[str]:
+        if not mime_type.startswith('image/'):
+            raise ValueError(f"Local OCR reads images only, got {mime_type}")
+        with Image.open(io.BytesIO(file_bytes)) as img:
+            data = pytesseract.image_to_data(
+                img, lang=tesseract_lang(), config=TESSERACT_CONFIG, output_type=pytesseract.Output.DICT,
+            )
+        text = layout_to_text(data)
+        if not text:
+            logger.warning("Local OCR returned empty content")
+            return None
+        logger.info(f"Local OCR succeeded: {len(text)} chars")
+        return text
+
+
+@dataclass
+class OcrRoute:
+    """Which backend OCRs a document, and why."""
+    backend: str
+    reason: str
+
+    @property
+    def local(self) -> bool:
+        return self.backend == BACKEND_LOCAL
+
+
+def is_transient(error: Exception) -> bool:
+    """Rate limits, timeouts and connection problems: errors another engine would not have."""
+    if isinstance(error, (RateLimitTimeout, TimeoutError, ConnectionError)) or is_rate_limited(error):
+        return True
+    name = type(error).__name__.lower()
+    return 'timeout' in name or 'connect' in name
+
+
+class OcrRouter:
+    """Chooses between Mistral OCR and the local engine (see the module docstring)."""
+
+    def __init__(self, local: Optional[OcrBackend] = None):
+        self.local = local or TesseractOcrBackend()
+
+    @property
+    def local_enabled(self) -> bool:
+        return OCR_BACKEND != BACKEND_MISTRAL and self.local.is_available
+
+    def scan_quality(self, image: bytes) -> Optional[float]:
+        """Quality estimate of a page image; None when the local engine would not be used anyway."""
+        return scan_quality(image) if self.local_enabled else None
+
+    def keys_ready(self, api_keys: List[str]) -> bool:
+        """True if any of `api_keys` can take an OCR request within the acquire timeout."""
+        return any(rate_limiter.wait_time(key, 'ocr') <= ACQUIRE_TIMEOUT for key in api_keys)
+
+    def _readable(self, quality: Optional[float]) -> bool:
+        return quality is not None and quality >= LOCAL_MIN_QUALITY
+
+    def choose(self, quality: Optional[float], api_keys: List[str]) -> OcrRoute:
+        if not self.local_enabled:
+            return OcrRoute(BACKEND_MISTRAL, "local OCR disabled or not installed")
+        if OCR_BACKEND == BACKEND_LOCAL:
+            return OcrRoute(BACKEND_LOCAL, "[OCR] backend = local")
+        if not self._readable(quality):
+            return OcrRoute(BACKEND_MISTRAL, f"scan quality below {LOCAL_MIN_QUALITY}")
+        if not self.keys_ready(api_keys):
+            return OcrRoute(BACKEND_LOCAL, "no key can take an OCR request now")
+        remote, local = ocr_latency.get(BACKEND_MISTRAL), ocr_latency.get(self.local.name)
+        if remote is not None and remote > SLOW_MS and (local is None or local < remote):
+            return OcrRoute(BACKEND_LOCAL, f"Mistral OCR slow ({remote:.0f} ms/page)")
+        return OcrRoute(BACKEND_MISTRAL, "default")
+
+    def can_fall_back(self, quality: Optional[float]) -> bool:
+        """Whether a document Mistral could not OCR may be read locally."""
+        if not self.local_enabled:
+            return False
+        return OCR_BACKEND == BACKEND_LOCAL or (LOCAL_FALLBACK and self._readable(quality))
+
+
+ocr_router = OcrRouter()
@@ -0,0 +1,286 @@
+"""Client-side rate limiting — one token bucket per (API key, endpoint).
+
+OCR and chat requests draw from separate buckets. A 429 halves the
+bucket's rate and pauses it (for Retry-After when the server sends one);
+each successful call then adds back a small step until the configured rate
+is reached again (additive increase, multiplicative decrease). The limiter
+is process-wide, so every session and worker thread shares the same view;
+in worker mode ([WORKERS] enabled) the buckets live in SQLite, in the jobs
+database, and are shared by all worker processes as well.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from config.api_keys import key_fingerprint
+from config.settings import JOBS_DB_PATH, USE_WORKERS, get_setting
+from utils.logging_setup import get_logger
+
+logger = get_logger('sdk.rate_limit')
+
+# Requests per minute per key; 0 disables limiting for that endpoint
+OCR_PER_MINUTE = get_setting('RATE_LIMIT', 'OCR_PER_MINUTE', 60.0, float)
+CHAT_PER_MINUTE = get_setting('RATE_LIMIT', 'CHAT_PER_MINUTE', 60.0, float)
+BURST = get_setting('RATE_LIMIT', 'BURST', 3, int)
+# How long a caller waits for a token before giving up on this key
+ACQUIRE_TIMEOUT = get_setting('RATE_LIMIT', 'ACQUIRE_TIMEOUT', 30.0, float)
+MIN_RATE_FRACTION = 0.1        # never back off below 10% of the configured rate
+RECOVERY_STEP_FRACTION = 0.05  # each success restores 5% of the configured rate
+DEFAULT_COOLDOWN = 2.0
+
+_LIMITS = {'ocr': OCR_PER_MINUTE, 'chat': CHAT_PER_MINUTE}
+
+
+class RateLimitTimeout(Exception):
+    """No request slot became available for this key within the timeout."""
+
+
+@dataclass
+class TokenBucket:
+    """Token bucket whose refill rate adapts to 429 responses."""
+    max_rate: float          # tokens per second, as configured
+    capacity: float
+    rate: float = 0.0
+    tokens: Optional[float] = None   # None: start full
+    updated: Optional[float] = None  # clock reading of the last refill; None: now
+    paused_until: float = 0.0
+
+    def __post_init__(self):
+        self.rate = self.rate or self.max_rate
+        if self.tokens is None:
+            self.tokens = self.capacity
+        if self.updated is None:
+            self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        start = max(self.updated, self.paused_until)
+        if now > start:
+            self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 if one can be taken now)."""
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now + max(0.0, 1.0 - self.tokens) / self.rate
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1.0
+
+    def decrease(self, now: float, cooldown: float) -> None:
+        self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, now + cooldown)
+
+    def increase(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP_FRACTION)
+
+
+class RateLimiter:
+    """Per-key, per-endpoint token buckets shared by all callers in the process."""
+
+    def __init__(self, limits: Dict[str, float] = None, burst: int = BURST):
+        self._limits = dict(limits if limits is not None else _LIMITS)
+        self._burst = max(1, burst)
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._cond = threading.Condition()
+
+    def _bucket(self, api_key: str, kind: str) -> Optional[TokenBucket]:
+        per_minute = self._limits.get(kind, 0)
+        if per_minute <= 0:
+            return None
+        key = (key_fingerprint(api_key), kind)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(max_rate=per_minute / 60.0, capacity=self._burst)
+        return bucket
+
+    def acquire(self, api_key: str, kind: str, timeout: float = ACQUIRE_TIMEOUT) -> None:
+        """Block until a `kind` request may be sent with `api_key`.
+
+        Raises RateLimitTimeout if that takes longer than `timeout`, so the
+        caller can move on to another key instead of queueing behind this one.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            bucket = self._bucket(api_key, kind)
+            if bucket is None:
+                return
+            while True:
+                now = time.monotonic()
+                wait = bucket.wait_time(now)
+                if wait <= 0:
+                    bucket.take()
+                    return
+                if now + wait > deadline:
+                    raise RateLimitTimeout(
+                        f"rate_limit: no {kind} slot for key {key_fingerprint(api_key)} within {timeout:.0f}s"
+                    )
+                self._cond.wait(wait)
+
+    def wait_time(self, api_key: str, kind: str) -> float:
+        """Seconds until a `kind` request could be sent with `api_key`, without taking the slot."""
+        with self._cond:
+            bucket = self._bucket(api_key, kind)
+            return bucket.wait_time(time.monotonic()) if bucket is not None else 0.0
+
+    def on_success(self, api_key: str, kind: str) -> None:
+        with self._cond:
+            bucket = self._bucket(api_key, kind)
+            if bucket is not None and bucket.rate < bucket.max_rate:
+                bucket.increase()
+
+    def on_rate_limited(self, api_key: str, kind: str, retry_after: Optional[float] = None) -> None:
+        """Back off after a 429: halve the rate and pause for `retry_after` seconds."""
+        with self._cond:
+            bucket = self._bucket(api_key, kind)
+            if bucket is None:
+                return
+            bucket.decrease(time.monotonic(), retry_after or DEFAULT_COOLDOWN)
+            logger.warning(
+                f"429 on {kind} for key {key_fingerprint(api_key)}: "
+                f"rate now {bucket.rate * 60:.1f}/min, paused {retry_after or DEFAULT_COOLDOWN:.1f}s"
+            )
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        """Current requests-per-minute of every bucket, keyed 'fingerprint:kind'."""
+        with self._cond:
+            return {f"{fp}:{kind}": round(b.rate * 60, 1) for (fp, kind), b in self._buckets.items()}
+
+
+_BUCKET_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    key_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    rate REAL,
+    tokens REAL,
+    updated REAL,
+    paused_until REAL,
+    PRIMARY KEY (key_id, kind)
+) WITHOUT ROWID;
+"""
+
+
+class SharedRateLimiter(RateLimiter):
+    """Token buckets stored in SQLite, shared by every process that opens the same file.
+
+    Each update is one short write transaction (BEGIN IMMEDIATE), so
+    processes never hand out the same token twice. A success only writes
+    while the bucket is recovering from a 429; at full rate it is one read. Uses wall-clock time,
+    since monotonic clocks are not comparable across processes.
+    """
+
+    def __init__(self, path: str, limits: Dict[str, float] = None, burst: int = BURST):
+        super().__init__(limits, burst)
+        self._path = path
+        self._db = None
+        self._pid = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self._path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_BUCKET_SCHEMA)
+            self._pid = os.getpid()
+        return self._db
+
+    def _with_bucket(self, api_key: str, kind: str, fn):
+        """Run fn(bucket, now) on the stored bucket and write it back; None if unlimited."""
+        per_minute = self._limits.get(kind, 0)
+        if per_minute <= 0:
+            return None
+        key_id = key_fingerprint(api_key)
+        with self._cond:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute(
+                    "SELECT rate, tokens, updated, paused_until FROM rate_buckets WHERE key_id = ? AND kind = ?",
+                    (key_id, kind),
+                ).fetchone()
+                bucket = TokenBucket(per_minute / 60.0, self._burst, *(row or (0.0, None, now, 0.0)))
+                result = fn(bucket, now)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (key_id, kind, rate, tokens, updated, paused_until) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key_id, kind, bucket.rate, bucket.tokens, bucket.updated, bucket.paused_until),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def acquire(self, api_key: str, kind: str, timeout: float = ACQUIRE_TIMEOUT) -> None:
+        def take(bucket: TokenBucket, now: float) -> float:
+            wait = bucket.wait_time(now)
+            if wait <= 0:
+                bucket.take()
+            return wait
+
+        deadline = time.time() + timeout
+        while True:
+            wait = self._with_bucket(api_key, kind, take)
+            if wait is None or wait <= 0:
+                return
+            if time.time() + wait > deadline:
+                raise RateLimitTimeout(
+                    f"rate_limit: no {kind} slot for key {key_fingerprint(api_key)} within {timeout:.0f}s"
+                )
+            time.sleep(wait)
+
+    def wait_time(self, api_key: str, kind: str) -> float:
+        return self._with_bucket(api_key, kind, lambda bucket, now: bucket.wait_time(now)) or 0.0
+
+    def on_success(self, api_key: str, kind: str) -> None:
+        per_minute = self._limits.get(kind, 0)
+        if per_minute <= 0:
+            return
+        with self._cond:
+            row = self._conn.execute(
+                "SELECT rate FROM rate_buckets WHERE key_id = ? AND kind = ?", (key_fingerprint(api_key), kind),
+            ).fetchone()
+        if row is None or row[0] >= per_minute / 60.0:
+            return
+        self._with_bucket(api_key, kind, lambda bucket, now: bucket.increase())
+
+    def on_rate_limited(self, api_key: str, kind: str, retry_after: Optional[float] = None) -> None:
+        cooldown = retry_after or DEFAULT_COOLDOWN
+        self._with_bucket(api_key, kind, lambda bucket, now: bucket.decrease(now, cooldown))
+        logger.warning(f"429 on {kind} for key {key_fingerprint(api_key)}: paused {cooldown:.1f}s (shared)")
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            rows = self._conn.execute("SELECT key_id, kind, rate FROM rate_buckets").fetchall()
+        return {f"{key_id}:{kind}": round(rate * 60, 1) for key_id, kind, rate in rows}
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """True for HTTP 429 responses from the SDK."""
+    if getattr(error, 'status_code', None) == 429:
+        return True
+    text = str(error)
+    return '429' in text or 'rate limit' in text.lower()
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Retry-After seconds from the error's HTTP response, if present."""
+    response = getattr(error, 'raw_response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        return float(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+rate_limiter = SharedRateLimiter(JOBS_DB_PATH) if USE_WORKERS else RateLimiter()
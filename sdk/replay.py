@@ -0,0 +1,150 @@
+"""Record/replay — run the pipeline offline against saved API responses.
+
+In record mode the real Mistral client is wrapped: every `ocr.process` and
+`chat.complete` call is fingerprinted (SHA-256 of the endpoint and its
+request arguments, API key excluded) and the response is saved as
+<path>/<endpoint>/<fingerprint>.json together with its latency. In replay
+mode no client is created; the same requests are answered from those files,
+immediately or after the recorded latency times LATENCY_SCALE. A request
+that was never recorded raises RecordingMissing.
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional
+from config.settings import (  # noqa: F401 (modes re-exported for callers)
+    MODE_OFF, MODE_RECORD, MODE_REPLAY, PLACEHOLDER_KEY, REPLAY_MODE, get_setting,
+)
+from utils.logging_setup import get_logger
+
+logger = get_logger('sdk.replay')
+
+RECORDINGS_PATH = get_setting('REPLAY', 'PATH', 'recordings')
+# 0 replays at full speed; 1 sleeps for the recorded API latency
+LATENCY_SCALE = get_setting('REPLAY', 'LATENCY_SCALE', 0.0, float)
+
+
+class RecordingMissing(LookupError):
+    """Replay mode got a request that has no recorded response."""
+
+
+def request_fingerprint(endpoint: str, kwargs: Dict[str, Any]) -> str:
+    """Stable hash of one API request (endpoint + arguments)."""
+    payload = json.dumps({'endpoint': endpoint, **kwargs}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _to_plain(value: Any) -> Any:
+    """SDK response (pydantic model or plain object) -> JSON-serializable data."""
+    if hasattr(value, 'model_dump'):
+        return value.model_dump(mode='json')
+    if isinstance(value, dict):
+        return {k: _to_plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_plain(v) for v in value]
+    if hasattr(value, '__dict__'):
+        return {k: _to_plain(v) for k, v in vars(value).items() if not k.startswith('_')}
+    return value
+
+
+def _to_object(value: Any) -> Any:
+    """JSON -> attribute access, the way the adapter reads SDK responses."""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _to_object(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_to_object(v) for v in value]
+    return value
+
+
+class Cassette:
+    """Directory of recorded responses, one JSON file per request fingerprint."""
+
+    def __init__(self, path: str = RECORDINGS_PATH):
+        self._path = path
+
+    def _file(self, endpoint: str, fingerprint: str) -> str:
+        return os.path.join(self._path, endpoint, f"{fingerprint}.json")
+
+    def load(self, endpoint: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._file(endpoint, fingerprint), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, endpoint: str, fingerprint: str, record: Dict[str, Any]) -> None:
+        text = json.dumps(record, ensure_ascii=False, indent=1)
+        path = self._file(endpoint, fingerprint)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename: parallel workers never see a half-written recording
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+class _Recorder:
+    """Calls the real endpoint and saves its response."""
+
+    def __init__(self, cassette: Cassette, endpoint: str, call: Callable[..., Any]):
+        self._cassette = cassette
+        self._endpoint = endpoint
+        self._call = call
+
+    def __call__(self, **kwargs):
+        fingerprint = request_fingerprint(self._endpoint, kwargs)
+        started = time.perf_counter()
+        response = self._call(**kwargs)
+        latency_ms = (time.perf_counter() - started) * 1000
+        try:
+            self._cassette.save(self._endpoint, fingerprint, {
+                'endpoint': self._endpoint,
+                'model': kwargs.get('model'),
+                'latency_ms': latency_ms,
+                'recorded_at': time.time(),
+                'response': _to_plain(response),
+            })
+            logger.info(f"Recorded {self._endpoint} response {fingerprint[:12]} ({latency_ms:.0f} ms)")
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to record {self._endpoint} response: {e}")
+        return response
+
+
+class _Player:
+    """Answers an endpoint from the cassette."""
+
+    def __init__(self, cassette: Cassette, endpoint: str):
+        self._cassette = cassette
+        self._endpoint = endpoint
+
+    def __call__(self, **kwargs):
+        fingerprint = request_fingerprint(self._endpoint, kwargs)
+        record = self._cassette.load(self._endpoint, fingerprint)
+        if record is None:
+            raise RecordingMissing(f"No recorded {self._endpoint} response for request {fingerprint[:12]}")
+        if LATENCY_SCALE > 0:
+            time.sleep(record.get('latency_ms', 0) / 1000 * LATENCY_SCALE)
+        logger.info(f"Replayed {self._endpoint} response {fingerprint[:12]}")
+        return _to_object(record['response'])
+
+
+def record_client(client, cassette: Optional[Cassette] = None):
+    """Wrap a Mistral client so OCR and chat responses are saved."""
+    cassette = cassette or Cassette()
+    return SimpleNamespace(
+        ocr=SimpleNamespace(process=_Recorder(cassette, 'ocr', client.ocr.process)),
+        chat=SimpleNamespace(complete=_Recorder(cassette, 'chat', client.chat.complete)),
+    )
+
+
+def replay_client(cassette: Optional[Cassette] = None):
+    """Client stand-in answering OCR and chat calls from recordings."""
+    cassette = cassette or Cassette()
+    return SimpleNamespace(
+        ocr=SimpleNamespace(process=_Player(cassette, 'ocr')),
+        chat=SimpleNamespace(complete=_Player(cassette, 'chat')),
+    )
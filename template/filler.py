@@ -1,20 +1,72 @@
 """Word template filling — populates bbbg.docx with extracted data."""
 
+import os
 import re
+import threading
+from copy import deepcopy
+from dataclasses import dataclass
 from io import BytesIO
 from datetime import datetime
 from typing import Dict, Any, List
 from docx import Document
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
 from docx.shared import Pt
 from core.models import GroupedDevice
+from template.placeholders import PlaceholderIndex
 from utils.logging_setup import get_logger
+from utils.profiling import profiled
 
 logger = get_logger('template.filler')
 
 TEMPLATE_FILE = 'bbbg.docx'
 DEFAULT_FONT_NAME = 'Times New Roman'
 DEFAULT_FONT_SIZE = 12
+CENTERED_COLUMNS = (0, 2, 3)  # STT, ĐVT, SL
+
+
+@dataclass
+class CachedTemplate:
+    """Template bytes plus its placeholder index, reused across fills."""
+    path: str
+    mtime: float
+    data: bytes
+    placeholders: PlaceholderIndex
+
+    def open(self):
+        return Document(BytesIO(self.data))
+
+
+_template_lock = threading.Lock()
+_template_cache: Dict[str, CachedTemplate] = {}
+
+
+def load_template(path: str = TEMPLATE_FILE) -> CachedTemplate:
+    """Read and index the template once; reloaded only when the file changes."""
+    mtime = os.path.getmtime(path)
+    with _template_lock:
+        cached = _template_cache.get(path)
+        if cached is None or cached.mtime != mtime:
+            with open(path, 'rb') as f:
+                data = f.read()
+            placeholders = PlaceholderIndex(Document(BytesIO(data)))
+            cached = CachedTemplate(path, mtime, data, placeholders)
+            _template_cache[path] = cached
+            logger.info(f"Loaded template {path}: {len(placeholders)} placeholders indexed")
+        return cached
+
+
+def _shd_replacement(data: Dict[str, Any]) -> str:
+    shd_value = str(data.get('shd', '')).strip()
+    shd_type = str(data.get('shd_type', 'Khác')).strip()
+    if not shd_value:
+        return ""
+    shd_type_lower = shd_type.lower().replace(' ', '')
+    if 'hopdong' in shd_type_lower or 'hd' in shd_type_lower:
+        return f"Dựa theo HĐ số: {shd_value}"
+    if 'po' in shd_type_lower or 'de nghi' in shd_type_lower:
+        return f"Dựa theo PO: {shd_value}"
+    return f"Dựa theo số: {shd_value}"
 
 
 def format_accessories_list(pk_raw: Any) -> str:
@@ -23,7 +75,7 @@ def format_accessories_list(pk_raw: Any) -> str:
         return ""
 
     pk_lines = []
-    if isinstance(pk_raw, list):
+    if isinstance(pk_raw, (list, tuple)):
         pk_lines = [str(x).strip() for x in pk_raw if x]
     elif isinstance(pk_raw, str) and pk_raw:
         clean_str = re.sub(
@@ -41,88 +93,126 @@ def format_accessories_list(pk_raw: Any) -> str:
     return "\n- Phụ kiện:\n" + "\n".join(formatted) if formatted else ""
 
 
+def _build_row_values(count: int, item: GroupedDevice) -> List[str]:
+    """Cell texts for one device row: STT, device info, ĐVT, SL, serials."""
+    pk_text = format_accessories_list(item.pk)
+    info_parts = [item.ttb.strip()]
+    if item.model.strip():
+        info_parts.append(f"- Model: {item.model.strip()}")
+    if item.ref.strip():
+        info_parts.append(f"- REF: {item.ref.strip()}")
+    if item.hang.strip():
+        info_parts.append(f"- Hãng: {item.hang.strip()}")
+    if item.nsx.strip():
+        info_parts.append(f"- NSX: {item.nsx.strip()}")
+    if pk_text:
+        # Add accessories block
+        info_parts.append(pk_text.strip())
+
+    device_info = "\n".join(info_parts)
+    return [
+        str(count),
+        device_info,
+        item.dvt.strip(),
+        str(int(item.sl)),
+        str(item.seri_text),
+    ]
+
+
+def _format_row_cells(cells) -> None:
+    for i, cell in enumerate(cells):
+        alignment = WD_ALIGN_PARAGRAPH.CENTER if i in CENTERED_COLUMNS else WD_ALIGN_PARAGRAPH.LEFT
+        for para in cell.paragraphs:
+            para.alignment = alignment
+            for run in para.runs:
+                run.font.name = DEFAULT_FONT_NAME
+                run.font.size = Pt(DEFAULT_FONT_SIZE)
+
+
+def _remove_body_rows(table) -> None:
+    """Drop every row after the header in one pass."""
+    tbl = table._tbl
+    for tr in tbl.tr_lst[1:]:
+        tbl.remove(tr)
+
+
+def _write_rows_python_docx(table, rows: List[List[str]]) -> None:
+    """Reference row writer using the python-docx object API cell by cell."""
+    for i in range(len(table.rows) - 1, 0, -1):
+        table.rows[i]._element.getparent().remove(table.rows[i]._element)
+
+    for row_data in rows:
+        new_row = table.add_row()
+        for i, cell_text in enumerate(row_data):
+            new_row.cells[i].text = str(cell_text)
+        _format_row_cells(new_row.cells)
+
+
+def _write_rows_fast(table, rows: List[List[str]]) -> None:
+    """Bulk row writer: clone one pre-formatted row's XML and fill its runs.
+
+    The prototype row is built once through python-docx (same cell widths,
+    alignment and fonts as the reference writer); each device row is then a
+    deep copy of it with the run text set directly, which produces identical XML.
+    """
+    _remove_body_rows(table)
+    if not rows:
+        return
+
+    prototype = table.add_row()
+    for cell in prototype.cells:
+        cell.text = ""
+    _format_row_cells(prototype.cells)
+    proto_tr = prototype._tr
+    tbl = proto_tr.getparent()
+    tbl.remove(proto_tr)
+
+    r_tag = qn('w:r')
+    for row_data in rows:
+        tr = deepcopy(proto_tr)
+        for r, cell_text in zip(tr.iter(r_tag), row_data):
+            r.text = cell_text
+        tbl.append(tr)
+
+
+@profiled('fill_word_template')
 def fill_word_template(
     data: Dict[str, Any],
     grouped_devices: List[GroupedDevice],
+    fast_rows: bool = True,
 ) -> BytesIO:
-    """Fill the Word template with handover data and grouped devices."""
+    """Fill the Word template with handover data and grouped devices.
+
+    `fast_rows=False` uses the slower python-docx cell API for the device table
+    (kept as the reference implementation; output is identical).
+    """
     try:
-        document = Document(TEMPLATE_FILE)
+        template = load_template()
+        document = template.open()
     except Exception as e:
         logger.error(f"Failed to open template: {e}")
         raise
 
+    # Placeholders first: the index refers to the unmodified template layout
+    now = datetime.now()
+    template.placeholders.apply(document, {
+        'day': str(now.day),
+        'month': str(now.month),
+        'year': str(now.year),
+        'shd': _shd_replacement(data),
+    })
+
     try:
         table = document.tables[0]
-        for i in range(len(table.rows) - 1, 0, -1):
-            table.rows[i]._element.getparent().remove(table.rows[i]._element)
-
-        for count, item in enumerate(grouped_devices, 1):
-            pk_text = format_accessories_list(item.pk)
-            info_parts = [item.ttb.strip()]
-            if item.model.strip():
-                info_parts.append(f"- Model: {item.model.strip()}")
-            if item.ref.strip():
-                info_parts.append(f"- REF: {item.ref.strip()}")
-            if item.hang.strip():
-                info_parts.append(f"- Hãng: {item.hang.strip()}")
-            if item.nsx.strip():
-                info_parts.append(f"- NSX: {item.nsx.strip()}")
-            if pk_text:
-                # Add accessories block
-                info_parts.append(pk_text.strip())
-
-            device_info = "\n".join(info_parts)
-
-            new_row = table.add_row()
-            row_data = [
-                str(count),
-                device_info,
-                item.dvt.strip(),
-                str(int(item.sl)),
-                item.seri_text,
-            ]
-
-            for i, cell_text in enumerate(row_data):
-                cell = new_row.cells[i]
-                cell.text = str(cell_text)
-                alignment = WD_ALIGN_PARAGRAPH.CENTER if i in (0, 2, 3) else WD_ALIGN_PARAGRAPH.LEFT
-                for para in cell.paragraphs:
-                    para.alignment = alignment
-                    for run in para.runs:
-                        run.font.name = DEFAULT_FONT_NAME
-                        run.font.size = Pt(DEFAULT_FONT_SIZE)
-
     except IndexError:
         logger.error("Template file has no table")
         raise
 
-    now = datetime.now()
-    shd_value = str(data.get('shd', '')).strip()
-    shd_type = str(data.get('shd_type', 'Khác')).strip()
-
-    shd_replacement = ""
-    if shd_value:
-        shd_type_lower = shd_type.lower().replace(' ', '')
-        if 'hopdong' in shd_type_lower or 'hd' in shd_type_lower:
-            shd_replacement = f"Dựa theo HĐ số: {shd_value}"
-        elif 'po' in shd_type_lower or 'de nghi' in shd_type_lower:
-            shd_replacement = f"Dựa theo PO: {shd_value}"
-        else:
-            shd_replacement = f"Dựa theo số: {shd_value}"
-
-    shd_pattern = re.compile(re.escape("shd"), re.IGNORECASE)
-
-    for para in document.paragraphs:
-        for run in para.runs:
-            if "day" in run.text:
-                run.text = run.text.replace("day", str(now.day))
-            if "month" in run.text:
-                run.text = run.text.replace("month", str(now.month))
-            if "year" in run.text:
-                run.text = run.text.replace("year", str(now.year))
-            if shd_pattern.search(run.text):
-                run.text = shd_pattern.sub(shd_replacement, run.text)
+    rows = [_build_row_values(count, item) for count, item in enumerate(grouped_devices, 1)]
+    if fast_rows:
+        _write_rows_fast(table, rows)
+    else:
+        _write_rows_python_docx(table, rows)
 
     byte_io = BytesIO()
     document.save(byte_io)
@@ -0,0 +1,122 @@
+"""Placeholder index — locate template placeholders once, substitute in one pass.
+
+Word often splits a placeholder such as 'shd' across several runs
+('s' + 'hd'), so placeholders are matched on the joined paragraph text and
+mapped back to run offsets. The index covers the body (including tables),
+headers and footers, and is built once per template load.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+
+# Placeholder name -> pattern. Date parts are case-sensitive; 'shd' is not.
+PLACEHOLDER_PATTERN = re.compile(
+    r'(?P<day>\bday\b)|(?P<month>\bmonth\b)|(?P<year>\byear\b)|(?P<shd>(?i:\bshd\b))'
+)
+
+_P_TAG = qn('w:p')
+_R_TAG = qn('w:r')
+
+
+@dataclass(frozen=True)
+class PlaceholderMatch:
+    """One placeholder occurrence inside a paragraph, as run/offset positions."""
+    name: str
+    start_run: int
+    start_offset: int
+    end_run: int
+    end_offset: int
+
+
+def _stories(document) -> List[Tuple[str, object]]:
+    """Body plus every header/footer part, keyed by a name stable across re-opens."""
+    stories = [('body', document.element.body)]
+    for rel in document.part.rels.values():
+        if rel.reltype in (RT.HEADER, RT.FOOTER):
+            stories.append((str(rel.target_part.partname), rel.target_part.element))
+    return stories
+
+
+def _paragraph_matches(runs) -> List[PlaceholderMatch]:
+    texts = [r.text for r in runs]
+    joined = ''.join(texts)
+    if not joined:
+        return []
+
+    # Map each character offset of the joined text back to (run index, offset)
+    starts, pos = [], 0
+    for t in texts:
+        starts.append(pos)
+        pos += len(t)
+
+    def locate(offset: int, end: bool) -> Tuple[int, int]:
+        # A start falls inside [start, start + len); an end inside (start, start + len]
+        for i, t in enumerate(texts):
+            lo, hi = starts[i], starts[i] + len(t)
+            if (lo < offset <= hi) if end else (lo <= offset < hi):
+                return i, offset - lo
+        return len(texts) - 1, len(texts[-1])
+
+    matches = []
+    for m in PLACEHOLDER_PATTERN.finditer(joined):
+        start_run, start_offset = locate(m.start(), end=False)
+        end_run, end_offset = locate(m.end(), end=True)
+        matches.append(PlaceholderMatch(m.lastgroup, start_run, start_offset, end_run, end_offset))
+    return matches
+
+
+class PlaceholderIndex:
+    """Locations of all placeholders in a template, by story and paragraph ordinal."""
+
+    def __init__(self, document):
+        self._entries: Dict[str, Dict[int, List[PlaceholderMatch]]] = {}
+        for key, element in _stories(document):
+            for ordinal, p in enumerate(element.iter(_P_TAG)):
+                matches = _paragraph_matches(p.findall(_R_TAG))
+                if matches:
+                    self._entries.setdefault(key, {})[ordinal] = matches
+
+    def __len__(self) -> int:
+        return sum(len(m) for story in self._entries.values() for m in story.values())
+
+    def apply(self, document, values: Dict[str, str]) -> int:
+        """Substitute `values` at the indexed locations of a freshly opened copy
+        of the same template. Must run before the document is modified.
+        Returns the number of placeholders replaced.
+        """
+        replaced = 0
+        for key, element in _stories(document):
+            entries = self._entries.get(key)
+            if not entries:
+                continue
+            last = max(entries)
+            for ordinal, p in enumerate(element.iter(_P_TAG)):
+                matches = entries.get(ordinal)
+                if matches:
+                    _substitute(p.findall(_R_TAG), matches, values)
+                    replaced += len(matches)
+                if ordinal >= last:
+                    break
+        return replaced
+
+
+def _substitute(runs, matches: List[PlaceholderMatch], values: Dict[str, str]) -> None:
+    originals = [r.text for r in runs]
+    texts = list(originals)
+    # Right to left, so earlier offsets in the same runs stay valid
+    for m in reversed(matches):
+        value = values.get(m.name, '')
+        if m.start_run == m.end_run:
+            t = texts[m.start_run]
+            texts[m.start_run] = t[:m.start_offset] + value + t[m.end_offset:]
+            continue
+        texts[m.start_run] = texts[m.start_run][:m.start_offset] + value
+        for i in range(m.start_run + 1, m.end_run):
+            texts[i] = ''
+        texts[m.end_run] = texts[m.end_run][m.end_offset:]
+    for r, old, new in zip(runs, originals, texts):
+        if old != new:
+            r.text = new
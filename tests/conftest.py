@@ -0,0 +1,17 @@
+"""Shared pytest setup: import the application modules from the repository root."""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def repo_root(monkeypatch):
+    """Run the test from the repository root, where bbbg.docx lives."""
+    monkeypatch.chdir(ROOT)
+    return ROOT
@@ -0,0 +1,135 @@
+"""Handover archive: the user_version 1 migration, dedupe by doc_id and search."""
+
+import json
+import sqlite3
+
+import pytest
+
+from core.archive import SCHEMA_VERSION, HandoverArchive
+from core.models import GroupedDevice
+
+# Layout written before user_version existed: doc_id not unique, đ indexed as is
+_V0_SCHEMA = """
+CREATE TABLE handovers (
+    id INTEGER PRIMARY KEY,
+    doc_id TEXT,
+    filename TEXT,
+    shd TEXT,
+    shd_key TEXT,
+    shd_type TEXT,
+    cty TEXT,
+    cty_key TEXT,
+    device_count INTEGER,
+    created_at REAL,
+    data TEXT,
+    grouped TEXT,
+    docx_name TEXT,
+    docx BLOB
+);
+CREATE INDEX idx_handovers_shd ON handovers (shd_key);
+CREATE INDEX idx_handovers_cty ON handovers (cty_key, created_at);
+CREATE INDEX idx_handovers_doc ON handovers (doc_id);
+CREATE TABLE archive_models (
+    model_key TEXT NOT NULL,
+    handover_id INTEGER NOT NULL,
+    PRIMARY KEY (model_key, handover_id)
+) WITHOUT ROWID;
+CREATE TABLE archive_serials (
+    serial_key TEXT NOT NULL,
+    handover_id INTEGER NOT NULL,
+    PRIMARY KEY (serial_key, handover_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE handover_fts USING fts5(
+    shd, cty, devices, serials,
+    content='', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+DATA = {
+    'shd': 'HĐ 123', 'shd_type': 'Hợp đồng', 'cty': 'Công ty Thiết bị Y tế Đông Á',
+    'ds': [{'ttb': 'Máy đo huyết áp', 'model': 'HEM-7120', 'ref': '', 'hang': 'Omron', 'nsx': 'Nhật Bản',
+            'dvt': 'Cái', 'sl': 1, 'seri': ['SN001'], 'pk': []}],
+}
+OTHER = dict(DATA, shd='PO-77', ds=[])
+
+
+def insert_v0(db, doc_id, data, created_at):
+    cur = db.execute(
+        "INSERT INTO handovers (doc_id, filename, shd, shd_key, shd_type, cty, cty_key, device_count, "
+        "created_at, data, grouped) VALUES (?, 'a.pdf', ?, ?, ?, ?, '', ?, ?, ?, '[]')",
+        (doc_id, data['shd'], ''.join(data['shd'].split()).upper(), data['shd_type'], data['cty'],
+         len(data['ds']), created_at, json.dumps(data, ensure_ascii=False)),
+    )
+    devices = ' '.join(f"{d['ttb']} {d['model']}" for d in data['ds'])
+    db.execute("INSERT INTO handover_fts (rowid, shd, cty, devices, serials) VALUES (?, ?, ?, ?, '')",
+               (cur.lastrowid, data['shd'], data['cty'], devices))
+    db.execute("INSERT INTO archive_serials (serial_key, handover_id) VALUES ('SN001', ?)", (cur.lastrowid,))
+    return cur.lastrowid
+
+
+@pytest.fixture
+def v0_path(tmp_path):
+    path = str(tmp_path / 'archive.db')
+    db = sqlite3.connect(path)
+    db.executescript(_V0_SCHEMA)
+    insert_v0(db, 'doc-a', DATA, 1.0)
+    insert_v0(db, 'doc-a', DATA, 2.0)
+    newest = insert_v0(db, 'doc-a', DATA, 3.0)
+    insert_v0(db, 'doc-b', OTHER, 4.0)
+    db.commit()
+    db.close()
+    return path, newest
+
+
+def test_migration_keeps_newest_record_per_doc(v0_path):
+    path, newest = v0_path
+    archive = HandoverArchive(path)
+    assert archive.count() == 2
+    assert archive._conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    ids = [r[0] for r in archive._conn.execute("SELECT id FROM handovers WHERE doc_id = 'doc-a'")]
+    assert ids == [newest]
+    serials = archive._conn.execute("SELECT handover_id FROM archive_serials").fetchall()
+    assert sorted(r[0] for r in serials) == [newest, newest + 1]
+
+
+def test_migration_reindexes_accents(v0_path):
+    path, newest = v0_path
+    archive = HandoverArchive(path)
+    assert [e.id for e in archive.by_shd('hd 123')] == [newest]
+    assert [e.id for e in archive.search('may đo')] == [newest]
+    assert {e.id for e in archive.search('dong a')} == {newest, newest + 1}
+
+
+def test_migration_makes_doc_id_unique(v0_path):
+    path, _ = v0_path
+    archive = HandoverArchive(path)
+    with pytest.raises(sqlite3.IntegrityError):
+        with archive._conn:
+            archive._conn.execute("INSERT INTO handovers (doc_id) VALUES ('doc-a')")
+    # Records without a doc_id are not deduplicated
+    with archive._conn:
+        archive._conn.execute("INSERT INTO handovers (doc_id) VALUES ('')")
+        archive._conn.execute("INSERT INTO handovers (doc_id) VALUES ('')")
+
+
+def test_migration_runs_once(v0_path):
+    path, _ = v0_path
+    HandoverArchive(path).count()
+    archive = HandoverArchive(path)
+    archive.store('doc-c', 'c.pdf', OTHER, [])
+    assert HandoverArchive(path).count() == 3
+
+
+def test_store_returns_existing_record_and_attaches_docx(tmp_path):
+    archive = HandoverArchive(str(tmp_path / 'archive.db'))
+    grouped = [GroupedDevice('Máy đo huyết áp', 'HEM-7120', '', 'Omron', 'Nhật Bản', 'Cái', 1, [], 'SN001')]
+    first = archive.store('doc-a', 'a.pdf', DATA, grouped)
+    assert archive.load_docx(first) is None
+    assert archive.store('doc-a', 'a.pdf', DATA, grouped, 'a.docx', b'docx') == first
+    assert archive.store('doc-a', 'a.pdf', DATA, grouped, 'b.docx', b'other') == first
+    assert archive.count() == 1
+    entry = archive.get(first)
+    assert (entry.docx_name, entry.docx) == ('a.docx', b'docx')
+    assert entry.grouped[0]['model'] == 'HEM-7120'
+    assert [e.id for e in archive.search('SN001')] == [first]
+    assert [e.id for e in archive.search('HEM 7120')] == [first]
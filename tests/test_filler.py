@@ -0,0 +1,126 @@
+"""Word filling: the cached template, placeholder index and cloned rows must
+produce the same document as the original cell-by-cell implementation."""
+
+import re
+import zipfile
+from datetime import datetime
+from io import BytesIO
+
+import pytest
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.shared import Pt
+
+from core.models import CompactGroupedDevice, GroupedDevice
+from template.filler import TEMPLATE_FILE, fill_word_template, format_accessories_list
+
+DATA = {'shd': '123/2024/HĐMB', 'shd_type': 'Hợp đồng', 'cty': 'Công ty ABC'}
+DEVICES = [
+    GroupedDevice('Máy đo huyết áp', 'HEM-7120', '', 'Omron', 'Nhật Bản', 'Cái', 2,
+                  ['Dây nguồn', 'Túi đựng'], 'SN001, SN002'),
+    GroupedDevice('Nhiệt kế điện tử', '', 'REF-9', '', '', 'Chiếc', 1, 'bao gồm: pin; hộp', ''),
+    GroupedDevice('Bơm tiêm điện', 'TE-331', '', 'Terumo', '', 'Bộ', 3, None, 'A1\nA2\nA3'),
+]
+
+
+def baseline_fill(data, grouped_devices) -> BytesIO:
+    """The original fill_word_template: python-docx rows and per-run placeholder replacement."""
+    document = Document(TEMPLATE_FILE)
+    table = document.tables[0]
+    for i in range(len(table.rows) - 1, 0, -1):
+        table.rows[i]._element.getparent().remove(table.rows[i]._element)
+    for count, item in enumerate(grouped_devices, 1):
+        info_parts = [item.ttb.strip()]
+        if item.model.strip():
+            info_parts.append(f"- Model: {item.model.strip()}")
+        if item.ref.strip():
+            info_parts.append(f"- REF: {item.ref.strip()}")
+        if item.hang.strip():
+            info_parts.append(f"- Hãng: {item.hang.strip()}")
+        if item.nsx.strip():
+            info_parts.append(f"- NSX: {item.nsx.strip()}")
+        pk_text = format_accessories_list(item.pk)
+        if pk_text:
+            info_parts.append(pk_text.strip())
+        new_row = table.add_row()
+        row_data = [str(count), "\n".join(info_parts), item.dvt.strip(), str(int(item.sl)), item.seri_text]
+        for i, cell_text in enumerate(row_data):
+            cell = new_row.cells[i]
+            cell.text = str(cell_text)
+            alignment = WD_ALIGN_PARAGRAPH.CENTER if i in (0, 2, 3) else WD_ALIGN_PARAGRAPH.LEFT
+            for para in cell.paragraphs:
+                para.alignment = alignment
+                for run in para.runs:
+                    run.font.name = 'Times New Roman'
+                    run.font.size = Pt(12)
+
+    now = datetime.now()
+    shd_value = str(data.get('shd', '')).strip()
+    shd_type = str(data.get('shd_type', 'Khác')).strip().lower().replace(' ', '')
+    replacement = ""
+    if shd_value:
+        if 'hopdong' in shd_type or 'hd' in shd_type:
+            replacement = f"Dựa theo HĐ số: {shd_value}"
+        elif 'po' in shd_type or 'de nghi' in shd_type:
+            replacement = f"Dựa theo PO: {shd_value}"
+        else:
+            replacement = f"Dựa theo số: {shd_value}"
+    shd_pattern = re.compile(re.escape("shd"), re.IGNORECASE)
+    for para in document.paragraphs:
+        for run in para.runs:
+            for name, value in (("day", now.day), ("month", now.month), ("year", now.year)):
+                if name in run.text:
+                    run.text = run.text.replace(name, str(value))
+            if shd_pattern.search(run.text):
+                run.text = shd_pattern.sub(replacement, run.text)
+    out = BytesIO()
+    document.save(out)
+    out.seek(0)
+    return out
+
+
+def document_xml(docx: BytesIO) -> bytes:
+    with zipfile.ZipFile(docx) as z:
+        return z.read('word/document.xml')
+
+
+def table_rows(docx: BytesIO):
+    docx.seek(0)
+    return [[c.text for c in row.cells] for row in Document(docx).tables[0].rows]
+
+
+@pytest.mark.parametrize('shd_type', ['Hợp đồng', 'HD', 'PO', 'Khác'])
+def test_matches_baseline_output(repo_root, shd_type):
+    data = dict(DATA, shd_type=shd_type)
+    expected = document_xml(baseline_fill(data, DEVICES))
+    assert document_xml(fill_word_template(data, DEVICES)) == expected
+    assert document_xml(fill_word_template(data, DEVICES, fast_rows=False)) == expected
+
+
+def test_empty_shd_matches_baseline(repo_root):
+    data = dict(DATA, shd='')
+    assert document_xml(fill_word_template(data, DEVICES)) == document_xml(baseline_fill(data, DEVICES))
+
+
+def test_rows_and_accessories(repo_root):
+    rows = table_rows(fill_word_template(DATA, DEVICES))
+    assert len(rows) == 1 + len(DEVICES)
+    assert rows[1][0] == '1'
+    assert rows[1][1] == ("Máy đo huyết áp\n- Model: HEM-7120\n- Hãng: Omron\n- NSX: Nhật Bản\n"
+                          "- Phụ kiện:\n  + Dây nguồn\n  + Túi đựng")
+    assert rows[1][2:] == ['Cái', '2', 'SN001, SN002']
+    assert rows[2][1] == "Nhiệt kế điện tử\n- REF: REF-9\n- Phụ kiện:\n  + pin\n  + hộp"
+    assert rows[3][3:] == ['3', 'A1\nA2\nA3']
+
+
+def test_compact_devices_fill_like_mutable_ones(repo_root):
+    compact = [
+        CompactGroupedDevice(d.ttb, d.model, d.ref, d.hang, d.nsx, d.dvt, d.sl,
+                             tuple(d.pk) if isinstance(d.pk, list) else d.pk, d.seri_text)
+        for d in DEVICES
+    ]
+    assert document_xml(fill_word_template(DATA, compact)) == document_xml(fill_word_template(DATA, DEVICES))
+
+
+def test_no_devices_leaves_only_the_header(repo_root):
+    assert len(table_rows(fill_word_template(DATA, []))) == 1
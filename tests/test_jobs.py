@@ -0,0 +1,88 @@
+"""SQLite job queue: claim order, requeue of timed-out jobs and the result cache."""
+
+import pytest
+
+from core import jobs
+from core.jobs import (JOB_TIMEOUT, MAX_ATTEMPTS, PRIORITY_BATCH, PRIORITY_UI, RESULT_CACHE_TTL,
+                       STATUS_DONE, STATUS_FAILED, STATUS_RUNNING, JobOutput, JobQueue)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.db'))
+
+
+def submit(queue, name, priority=PRIORITY_UI):
+    return queue.submit(name, b'%PDF-1.4', 'application/pdf', f'doc-{name}', ['docx'], priority)
+
+
+def backdate(queue, job_id, seconds):
+    with queue._conn:
+        queue._conn.execute("UPDATE jobs SET started_at = started_at - ? WHERE id = ?", (seconds, job_id))
+
+
+def test_claims_by_priority_then_age(queue):
+    batch = submit(queue, 'batch.pdf', PRIORITY_BATCH)
+    first = submit(queue, 'first.pdf')
+    second = submit(queue, 'second.pdf')
+    assert [queue.claim('w').id for _ in range(3)] == [first, second, batch]
+    assert queue.claim('w') is None
+
+
+def test_claim_marks_running_and_hands_out_payload(queue):
+    job_id = submit(queue, 'a.pdf')
+    job = queue.claim('w1')
+    assert (job.id, job.status, job.attempts, job.payload) == (job_id, STATUS_RUNNING, 1, b'%PDF-1.4')
+    assert job.formats == ['docx']
+    assert queue.pending() == 1
+
+
+def test_running_job_is_not_reclaimed_before_timeout(queue):
+    submit(queue, 'a.pdf')
+    queue.claim('w1')
+    assert queue.claim('w2') is None
+
+
+def test_timed_out_job_is_requeued(queue):
+    job_id = submit(queue, 'a.pdf')
+    queue.claim('w1')
+    backdate(queue, job_id, JOB_TIMEOUT + 1)
+    job = queue.claim('w2')
+    assert job.id == job_id
+    assert job.attempts == 2
+
+
+def test_job_fails_after_max_attempts(queue):
+    job_id = submit(queue, 'a.pdf')
+    for _ in range(MAX_ATTEMPTS):
+        assert queue.claim('w').id == job_id
+        backdate(queue, job_id, JOB_TIMEOUT + 1)
+    assert queue.claim('w') is None
+    job = queue.get(job_id)
+    assert job.status == STATUS_FAILED
+    assert job.attempts == MAX_ATTEMPTS
+    assert job.error == f"timed out after {MAX_ATTEMPTS} attempts"
+    assert queue.pending() == 0
+
+
+def test_complete_stores_result_and_outputs(queue):
+    job_id = submit(queue, 'a.pdf')
+    queue.claim('w')
+    queue.complete(job_id, {'shd': 'HĐ 1'}, [JobOutput('docx', 'a.docx', 'application/x', b'data')])
+    job = queue.wait(job_id, timeout=0)
+    assert job.status == STATUS_DONE
+    assert job.result == {'shd': 'HĐ 1'}
+    assert job.outputs == [JobOutput('docx', 'a.docx', 'application/x', b'data')]
+    assert queue.claim('w') is None
+
+
+def test_result_cache_expires(queue, monkeypatch):
+    queue.cache_result('key', {'a': 1})
+    assert queue.cached_result('key') == {'a': 1}
+
+    now = jobs.time.time()
+    monkeypatch.setattr(jobs.time, 'time', lambda: now + RESULT_CACHE_TTL + 1)
+    assert queue.cached_result('key') is None
+    queue.claim('w')
+    monkeypatch.undo()
+    assert queue._conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0] == 0
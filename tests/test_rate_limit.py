@@ -0,0 +1,95 @@
+"""Token buckets: refill, 429 back-off and recovery, in-process and SQLite-shared."""
+
+import pytest
+
+from sdk.rate_limit import (MIN_RATE_FRACTION, RECOVERY_STEP_FRACTION, RateLimiter, RateLimitTimeout,
+                            SharedRateLimiter, TokenBucket)
+
+KEY = 'test-api-key-0001'
+
+
+def test_bucket_starts_full_and_refills_at_rate():
+    bucket = TokenBucket(max_rate=1.0, capacity=2, updated=0.0)
+    for _ in range(2):
+        assert bucket.wait_time(0.0) == 0
+        bucket.take()
+    assert bucket.wait_time(0.0) == pytest.approx(1.0)
+    assert bucket.wait_time(0.5) == pytest.approx(0.5)
+    assert bucket.wait_time(1.0) == 0
+
+
+def test_bucket_refill_is_capped_at_capacity():
+    bucket = TokenBucket(max_rate=1.0, capacity=2, tokens=0.0, updated=0.0)
+    bucket.wait_time(100.0)
+    assert bucket.tokens == 2
+
+
+def test_decrease_pauses_and_halves_rate():
+    bucket = TokenBucket(max_rate=1.0, capacity=2, updated=0.0)
+    bucket.decrease(now=0.0, cooldown=5.0)
+    assert bucket.rate == 0.5
+    assert bucket.tokens == 0
+    # Nothing refills during the pause; afterwards one token takes 1 / rate seconds
+    assert bucket.wait_time(4.0) == pytest.approx(1.0 + 2.0)
+    assert bucket.wait_time(5.0) == pytest.approx(2.0)
+    assert bucket.wait_time(7.0) == 0
+
+
+def test_rate_never_drops_below_floor_and_recovers_stepwise():
+    bucket = TokenBucket(max_rate=1.0, capacity=1, updated=0.0)
+    for _ in range(10):
+        bucket.decrease(now=0.0, cooldown=0.0)
+    assert bucket.rate == pytest.approx(MIN_RATE_FRACTION)
+    bucket.increase()
+    assert bucket.rate == pytest.approx(MIN_RATE_FRACTION + RECOVERY_STEP_FRACTION)
+    for _ in range(100):
+        bucket.increase()
+    assert bucket.rate == 1.0
+
+
+def test_limiter_times_out_when_bucket_is_empty():
+    limiter = RateLimiter(limits={'ocr': 60.0}, burst=1)
+    limiter.acquire(KEY, 'ocr', timeout=0.01)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(KEY, 'ocr', timeout=0.01)
+    # Separate endpoints and unlimited endpoints are unaffected
+    limiter.acquire(KEY, 'chat', timeout=0.01)
+    assert limiter.wait_time(KEY, 'chat') == 0
+
+
+def test_limiter_backs_off_and_recovers():
+    limiter = RateLimiter(limits={'ocr': 60.0}, burst=1)
+    limiter.on_rate_limited(KEY, 'ocr', retry_after=10.0)
+    assert limiter.wait_time(KEY, 'ocr') > 9.0
+    (rate,) = limiter.stats().values()
+    assert rate == 30.0
+    limiter.on_success(KEY, 'ocr')
+    (rate,) = limiter.stats().values()
+    assert rate == 33.0
+
+
+def test_shared_limiter_shares_tokens_between_instances(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    first = SharedRateLimiter(path, limits={'ocr': 60.0}, burst=1)
+    second = SharedRateLimiter(path, limits={'ocr': 60.0}, burst=1)
+    first.acquire(KEY, 'ocr', timeout=0.01)
+    with pytest.raises(RateLimitTimeout):
+        second.acquire(KEY, 'ocr', timeout=0.01)
+
+    second.on_rate_limited(KEY, 'ocr', retry_after=10.0)
+    assert first.wait_time(KEY, 'ocr') > 9.0
+    assert list(first.stats().values()) == [30.0]
+
+
+def test_shared_limiter_success_at_full_rate_does_not_write(tmp_path):
+    limiter = SharedRateLimiter(str(tmp_path / 'jobs.db'), limits={'ocr': 60.0}, burst=1)
+    limiter.acquire(KEY, 'ocr', timeout=0.01)
+    writes = limiter._conn.total_changes
+    limiter.on_success(KEY, 'ocr')
+    assert limiter._conn.total_changes == writes
+
+    limiter.on_rate_limited(KEY, 'ocr', retry_after=1.0)
+    writes = limiter._conn.total_changes
+    limiter.on_success(KEY, 'ocr')
+    assert limiter._conn.total_changes == writes + 1
+    assert list(limiter.stats().values()) == [33.0]
@@ -0,0 +1,16 @@
+"""Document context — which document the current call is working on.
+
+The document id lives in a context variable, so threads and tasks started
+with a copied context (renderers, OCR pages) inherit it. It is set by
+core.usage.usage_scope and read by usage accounting and profiling; keeping
+it here lets utils modules use it without depending on core.
+"""
+
+import contextvars
+
+doc_var: contextvars.ContextVar[str] = contextvars.ContextVar('usage_doc', default='')
+
+
+def current_doc() -> str:
+    """Id of the document being processed, '' outside any document scope."""
+    return doc_var.get()
@@ -0,0 +1,165 @@
+"""Image helpers — MIME sniffing and photo preprocessing before OCR.
+
+Phone photos are far larger than OCR needs. `prepare_for_ocr` rotates by
+EXIF, converts to grayscale, downscales to MAX_SIDE, crops to the page
+(or the printed area of a scan), optionally deskews, and re-encodes as JPEG.
+`scan_quality` estimates whether a local OCR engine can read the image.
+Pillow is optional: without it images are sent unchanged.
+"""
+
+import io
+from typing import Optional, Tuple
+from config.settings import get_bool, get_setting
+from utils.logging_setup import get_logger
+
+try:
+    from PIL import Image, ImageFilter, ImageOps, ImageStat
+except ImportError:  # pragma: no cover - Pillow ships with streamlit, but stay usable without it
+    Image = None
+
+logger = get_logger('utils.image')
+
+PREPROCESS_IMAGES = get_bool('IMAGE', 'PREPROCESS', True)
+DESKEW = get_bool('IMAGE', 'DESKEW', False)
+# Long side in pixels; ~A4 at 250-300 dpi, enough for small table text
+MAX_SIDE = get_setting('IMAGE', 'MAX_SIDE', 2400, int)
+JPEG_QUALITY = get_setting('IMAGE', 'JPEG_QUALITY', 85, int)
+CROP_THRESHOLD = 200      # gray level separating paper (above) from ink/background (below)
+CROP_PADDING = 0.02       # keep 2% of the side around the detected content
+MIN_CROP_GAIN = 0.05      # skip cropping that removes less than 5% of the area
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+DESKEW_SAMPLE_SIDE = 600
+QUALITY_SAMPLE_SIDE = 800
+QUALITY_INK_LEVEL = 96      # gray levels below this count as ink
+QUALITY_MIN_SIDE = 1000     # short side (px) below which small text gets unreadable
+
+_SIGNATURES = (
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+)
+
+
+def sniff_mime_type(data) -> Optional[str]:
+    """MIME type from the file's magic bytes, or None if unrecognized."""
+    head = bytes(data[:16])
+    for signature, mime in _SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def _content_box(gray) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box worth keeping, padded; None if cropping is not worth it.
+
+    On a dark background (a page photographed on a desk) that is the paper;
+    on a light one (a scan) it is the printed content.
+    """
+    width, height = gray.size
+    scale = max(1, max(width, height) // 800)
+    small = gray.reduce(scale).filter(ImageFilter.MedianFilter(5))
+    border = _border_mean(small)
+    if border < CROP_THRESHOLD:
+        mask = small.point(lambda v: 255 if v >= CROP_THRESHOLD else 0)
+    else:
+        mask = small.point(lambda v: 255 if v < CROP_THRESHOLD else 0)
+    box = mask.getbbox()
+    if not box:
+        return None
+    box = [v * scale for v in box]
+    pad_x, pad_y = int(width * CROP_PADDING), int(height * CROP_PADDING)
+    left, top = max(0, box[0] - pad_x), max(0, box[1] - pad_y)
+    right, bottom = min(width, box[2] + pad_x), min(height, box[3] + pad_y)
+    if (right - left) * (bottom - top) > (1 - MIN_CROP_GAIN) * width * height:
+        return None
+    return left, top, right, bottom
+
+
+def _border_mean(gray) -> float:
+    """Mean gray level of a 2-pixel frame around the image."""
+    width, height = gray.size
+    strips = [(0, 0, width, 2), (0, height - 2, width, height), (0, 0, 2, height), (width - 2, 0, width, height)]
+    return sum(ImageStat.Stat(gray.crop(s)).mean[0] for s in strips) / len(strips)
+
+
+def _skew_angle(gray) -> float:
+    """Rotation (degrees) that makes text lines horizontal, by projection profile.
+
+    Text rows give the sharpest row-darkness profile (highest variance)
+    when they are level; each candidate angle is scored on a small sample.
+    """
+    sample = gray.copy()
+    sample.thumbnail((DESKEW_SAMPLE_SIDE, DESKEW_SAMPLE_SIDE))
+    sample = ImageOps.invert(sample)
+    best_angle, best_score = 0.0, -1.0
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    for i in range(-steps, steps + 1):
+        angle = i * DESKEW_STEP
+        rotated = sample.rotate(angle, resample=Image.BILINEAR, fillcolor=0)
+        profile = rotated.resize((1, rotated.height), Image.BOX)
+        score = ImageStat.Stat(profile).var[0]
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def prepare_for_ocr(data: bytes, mime_type: str) -> Tuple[bytes, str]:
+    """Shrink a photo/scan for OCR. Returns (bytes, mime); the input unchanged
+    for PDFs, when disabled, without Pillow, or when the result would not be smaller.
+    """
+    if not PREPROCESS_IMAGES or Image is None or not mime_type.startswith('image/'):
+        return data, mime_type
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img)
+            gray = img.convert('L')
+        if max(gray.size) > MAX_SIDE:
+            gray.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+        box = _content_box(gray)
+        if box:
+            gray = gray.crop(box)
+        if DESKEW:
+            angle = _skew_angle(gray)
+            if angle:
+                gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+        out = io.BytesIO()
+        gray.save(out, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed, sending original: {type(e).__name__}: {e}")
+        return data, mime_type
+
+    if out.tell() >= len(data):
+        return data, mime_type
+    logger.info(f"Preprocessed image: {len(data)} -> {out.tell()} bytes, {gray.size[0]}x{gray.size[1]}")
+    return out.getvalue(), 'image/jpeg'
+
+
+def scan_quality(data: bytes) -> Optional[float]:
+    """0..1 estimate of how well a local OCR engine will read the image; None if unknown.
+
+    Clean scans are bimodal (white paper, black ink) and large enough for
+    small table text; phone photos have gray shadows and gradients in
+    between. The score is the share of pixels that are clearly paper or
+    ink, scaled down when the short side is below QUALITY_MIN_SIDE.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            size = img.size
+            gray = img.convert('L')
+        gray.thumbnail((QUALITY_SAMPLE_SIDE, QUALITY_SAMPLE_SIDE))
+        histogram = gray.histogram()
+    except Exception as e:
+        logger.warning(f"Scan quality estimate failed: {type(e).__name__}: {e}")
+        return None
+    total = sum(histogram) or 1
+    clear = sum(histogram[:QUALITY_INK_LEVEL]) + sum(histogram[CROP_THRESHOLD:])
+    return round(clear / total * min(1.0, min(size) / QUALITY_MIN_SIDE), 3)
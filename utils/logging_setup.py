@@ -3,6 +3,7 @@
 import os
 import time
 import logging
+import multiprocessing
 from datetime import datetime
 from logging.handlers import RotatingFileHandler
 
@@ -31,7 +32,10 @@ def setup_logging():
         pass
 
     timestamp = datetime.now().strftime('%Y-%m-%d-%H%M%S')
-    _log_file = os.path.join(LOG_DIR, f'fix-{timestamp}.log')
+    # Worker processes start together: give each its own file
+    process = multiprocessing.current_process()
+    suffix = '' if process.name == 'MainProcess' else f'-{process.name}-{process.pid}'
+    _log_file = os.path.join(LOG_DIR, f'fix-{timestamp}{suffix}.log')
 
     logger = logging.getLogger('bbbg')
     logger.setLevel(logging.DEBUG)
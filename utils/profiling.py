@@ -0,0 +1,269 @@
+"""Hot-path profiling — opt-in per-document profiles of the slow stages.
+
+Functions decorated with `profiled(stage)` (extraction, grouping, file
+naming, Word filling) are profiled when one of the triggers fires:
+
+- [PROFILING] enabled = true (or batch.py --profile): every call;
+- sample_rate: that fraction of calls;
+- slow_ms: every call is only timed (two clock reads, no profiler). A call
+  that takes at least slow_ms is logged and arms the stage: its next call
+  runs under the sampling profiler, and that profile is kept if the call is
+  slow again. A stage that is slow once in a while costs nothing more.
+
+The sampling profiler writes collapsed stacks (`.folded`, the input format
+of flamegraph.pl and speedscope); profiler = cprofile writes pstats dumps
+(`.prof`, for snakeviz or pstats). Artifacts are named after the document
+id (see core.usage.usage_scope) and the stage.
+"""
+
+import os
+import re
+import sys
+import time
+import pstats
+import random
+import cProfile
+import functools
+import threading
+import contextvars
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from config.settings import get_bool, get_setting
+from utils.context import current_doc
+from utils.logging_setup import get_logger
+
+logger = get_logger('utils.profiling')
+
+PROFILING_ENABLED = get_bool('PROFILING', 'ENABLED', False)
+SAMPLE_RATE = get_setting('PROFILING', 'SAMPLE_RATE', 0.0, float)
+SLOW_MS = get_setting('PROFILING', 'SLOW_MS', 0.0, float)       # 0 disables the slow trigger
+PROFILER = get_setting('PROFILING', 'PROFILER', 'sampling', str.lower)   # sampling | cprofile
+SAMPLE_INTERVAL_MS = get_setting('PROFILING', 'INTERVAL_MS', 5.0, float)
+PROFILE_DIR = get_setting('PROFILING', 'PATH', 'profiling')
+MAX_STACK_DEPTH = 64
+
+_TRIGGER_ALWAYS = 'always'
+_TRIGGER_SAMPLED = 'sampled'
+_TRIGGER_SLOW = 'slow'        # armed by a slow timed call; kept only if slow again
+_TRIGGER_TIMED = 'timed'      # slow_ms set: time the call, profile nothing
+
+# Profiling a stage that calls another profiled stage covers both: no nesting
+_active: contextvars.ContextVar[bool] = contextvars.ContextVar('profiling_active', default=False)
+# Only one cProfile.Profile can be enabled at a time; concurrent calls fall back to sampling
+_cprofile_lock = threading.Lock()
+# Stages whose last timed call was slow: their next call is sampled
+_armed = set()
+_armed_lock = threading.Lock()
+
+
+@dataclass
+class ProfileArtifact:
+    """One captured profile."""
+    stage: str
+    doc_id: str
+    elapsed_ms: float
+    trigger: str
+    path: str = ""
+    stacks: Counter = field(default_factory=Counter)   # sampling profiles only
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every `interval` seconds from a helper thread."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_MS / 1000):
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+        self.stacks: Counter = Counter()
+
+    def start(self) -> 'SamplingProfiler':
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            names = []
+            while frame is not None and len(names) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+
+class _Collector:
+    """Keeps this run's artifacts in memory for `report` (batch.py --profile)."""
+
+    def __init__(self):
+        self.forced = False
+        self.artifacts: List[ProfileArtifact] = []
+        self._lock = threading.Lock()
+
+    def add(self, artifact: ProfileArtifact) -> None:
+        if self.forced:
+            with self._lock:
+                self.artifacts.append(artifact)
+
+
+_collector = _Collector()
+
+
+def enable_for_run() -> None:
+    """Profile every call from now on and keep the artifacts for `report`."""
+    _collector.forced = True
+
+
+def _trigger(stage: str) -> Optional[str]:
+    if _collector.forced or PROFILING_ENABLED:
+        return _TRIGGER_ALWAYS
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return _TRIGGER_SAMPLED
+    if SLOW_MS > 0:
+        if stage in _armed:
+            with _armed_lock:
+                if stage in _armed:
+                    _armed.discard(stage)
+                    return _TRIGGER_SLOW
+        return _TRIGGER_TIMED
+    return None
+
+
+def _timed(stage: str, fn, args, kwargs):
+    """Run fn without a profiler; a call over slow_ms is logged and arms sampling for the stage."""
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= SLOW_MS:
+            logger.info(f"Slow {stage}: {elapsed_ms:.0f} ms (doc={current_doc()[:12]}), sampling its next call")
+            with _armed_lock:
+                _armed.add(stage)
+
+
+def _safe_name(doc_id: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', doc_id)[:16] or 'nodoc'
+
+
+def _artifact_path(artifact: ProfileArtifact, extension: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(
+        PROFILE_DIR,
+        f"{_safe_name(artifact.doc_id)}-{artifact.stage}-{stamp}-{os.urandom(3).hex()}{extension}",
+    )
+
+
+def _write_folded(path: str, stacks: Counter) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+def profiled(stage: str, doc_id_from: Optional[Callable[..., str]] = None):
+    """Decorator: profile calls to the function when a trigger fires.
+
+    `doc_id_from(*args, **kwargs)` names the document when it is not in the
+    current usage scope; it is only called when an artifact is written.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trigger = None if _active.get() else _trigger(stage)
+            if trigger is None:
+                return fn(*args, **kwargs)
+            if trigger == _TRIGGER_TIMED:
+                return _timed(stage, fn, args, kwargs)
+
+            use_cprofile = (
+                trigger != _TRIGGER_SLOW and PROFILER == 'cprofile' and _cprofile_lock.acquire(blocking=False)
+            )
+            profiler = cProfile.Profile() if use_cprofile else None
+            sampler = None if use_cprofile else SamplingProfiler(threading.get_ident()).start()
+            token = _active.set(True)
+            started = time.perf_counter()
+            if profiler:
+                profiler.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if profiler:
+                    profiler.disable()
+                    _cprofile_lock.release()
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                stacks = sampler.stop() if sampler else Counter()
+                _active.reset(token)
+                if trigger != _TRIGGER_SLOW or elapsed_ms >= SLOW_MS:
+                    doc_id = current_doc() or (doc_id_from(*args, **kwargs) if doc_id_from else '')
+                    _save(ProfileArtifact(stage, doc_id, elapsed_ms, trigger, stacks=stacks), profiler)
+        return wrapper
+    return decorator
+
+
+def _save(artifact: ProfileArtifact, profiler: Optional[cProfile.Profile]) -> None:
+    try:
+        if profiler is not None:
+            artifact.path = _artifact_path(artifact, '.prof')
+            profiler.dump_stats(artifact.path)
+        else:
+            artifact.path = _artifact_path(artifact, '.folded')
+            _write_folded(artifact.path, artifact.stacks)
+    except OSError as e:
+        logger.warning(f"Failed to write {artifact.stage} profile: {e}")
+    logger.info(
+        f"Profiled {artifact.stage}: doc={artifact.doc_id[:12]} trigger={artifact.trigger} "
+        f"elapsed_ms={artifact.elapsed_ms:.0f} artifact={artifact.path}"
+    )
+    _collector.add(artifact)
+
+
+def report(top: int = 15) -> str:
+    """Aggregate this run's profiles: per-stage timings, merged artifacts, hottest functions."""
+    artifacts = list(_collector.artifacts)
+    if not artifacts:
+        return "Không có profile nào được ghi."
+
+    by_stage: Dict[str, List[float]] = {}
+    for a in artifacts:
+        by_stage.setdefault(a.stage, []).append(a.elapsed_ms)
+    lines = [f"{'stage':<20} {'calls':>6} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+    for stage, times in sorted(by_stage.items(), key=lambda kv: -sum(kv[1])):
+        lines.append(f"{stage:<20} {len(times):>6} {sum(times):>10.0f} "
+                     f"{sum(times) / len(times):>9.0f} {max(times):>9.0f}")
+
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    stacks = sum((a.stacks for a in artifacts), Counter())
+    if stacks:
+        path = os.path.join(PROFILE_DIR, f"run-{stamp}.folded")
+        _write_folded(path, stacks)
+        self_time = Counter()
+        for stack, count in stacks.items():
+            self_time[stack.rsplit(';', 1)[-1]] += count
+        total = sum(stacks.values())
+        lines.append(f"\nSampling: {total} mẫu, gộp vào {path}")
+        lines += [f"{count / total:>6.1%}  {name}" for name, count in self_time.most_common(top)]
+
+    prof_paths = [a.path for a in artifacts if a.path.endswith('.prof')]
+    if prof_paths:
+        path = os.path.join(PROFILE_DIR, f"run-{stamp}.prof")
+        stats = pstats.Stats(*prof_paths)
+        stats.dump_stats(path)
+        lines.append(f"\ncProfile: {len(prof_paths)} profile, gộp vào {path}")
+        lines += _top_functions(stats, top)
+    return '\n'.join(lines)
+
+
+def _top_functions(stats: pstats.Stats, top: int) -> List[str]:
+    rows = sorted(stats.stats.items(), key=lambda kv: -kv[1][3])[:top]   # by cumulative time
+    return [
+        f"{cumulative * 1000:>9.0f} ms  {calls:>7}  {func} ({os.path.basename(filename)}:{line})"
+        for (filename, line, func), (_, calls, _, cumulative, _) in rows
+    ]
@@ -1,32 +1,69 @@
-"""Text normalization and string utility helpers."""
+"""Text normalization and string utility helpers.
+
+The normalization patterns are compiled at import, so the first document
+does not pay for compiling them (see core.readiness).
+"""
 
 import re
+import unicodedata
 from typing import Any
 
+_STANDARDIZE_REPLACEMENTS = [
+    ('ÀÂẮẶẲẴ', 'AAAAA'), ('ÈÉẸẺẼ', 'EEEEE'), ('ỀẾỆỂỄ', 'EEEEE'),
+    ('ÌÍỊỈĨ', 'IIIII'), ('ÒÓỌỎÕ', 'OOOOO'), ('ỒỐỘỔỖ', 'OOOOO'),
+    ('ỜỚỢỞỠ', 'OOOOO'), ('ÙÚỤỦŨ', 'UUUUU'), ('ỪỨỰỬỮ', 'UUUUU'),
+    ('ỲÝỴỶỸ', 'YYYYY'), ('Đ', 'D'),
+]
+# zip() pairs each source letter with a target letter; letters past the target's end are kept
+_STANDARDIZE_TABLE = str.maketrans({s: d for src, dst in _STANDARDIZE_REPLACEMENTS for s, d in zip(src, dst)})
+_SPACES_RE = re.compile(r'\s+')
+_ILLEGAL_FILENAME_RE = re.compile(r'[\\/*?":<>|.]')
+
+_COMPANY_PREFIXES = [
+    r"CÔNG TY TNHH MỘT THÀNH VIÊN", r"CÔNG TY TNHH MTV",
+    r"CÔNG TY TNHH HAI THÀNH VIÊN TRỞ LÊN", r"CÔNG TY CỔ PHẦN",
+    r"CÔNG TY TNHH", r"CÔNG TY", r"TNHH", r"CỔ PHẦN",
+]
+_COMPANY_SUFFIXES = [
+    r"MỘT THÀNH VIÊN", r"MTV", r"HAI THÀNH VIÊN TRỞ LÊN",
+    r"CỔ PHẦN", r"TNHH",
+]
+_COMPANY_COMMON_TERMS = [
+    r"THƯƠNG MẠI VÀ DỊCH VỤ", r"DỊCH VỤ VÀ THƯƠNG MẠI",
+    r"TM VÀ DV", r"DV VÀ TM", r"TM & DV", r"DV & TM",
+    r"TM", r"DV", r"CÔNG NGHỆ", r"THƯƠNG MẠI", r"TRANG THIẾT BỊ",
+    r"Y TẾ", r"XÂY DỰNG", r"ĐẦU TƯ", r"PHÁT TRIỂN", r"GIẢI PHÁP",
+    r"KỸ THUẬT", r"SẢN XUẤT", r"NHẬP KHẨU", r"XUẤT NHẬP KHẨU",
+    r"KINH DOANH", r"PHÂN PHỐI", r"VIỆT NAM"
+]
+_COMPANY_AFFIX_RES = [
+    re.compile(r'^\s*' + re.escape(p) + r'\s*|\s*' + re.escape(p) + r'\s*$', re.IGNORECASE)
+    for p in _COMPANY_PREFIXES + _COMPANY_SUFFIXES
+]
+_COMPANY_TERM_RES = [
+    re.compile(r'\b' + re.escape(term) + r'\b', re.IGNORECASE) for term in _COMPANY_COMMON_TERMS
+]
+
 
 def standardize_string(text: Any) -> str:
     """Normalize Vietnamese diacritics to ASCII-safe equivalents."""
     if not isinstance(text, str):
         return str(text)
 
-    replacements = [
-        ('ÀÂẮẶẲẴ', 'AAAAA'), ('ÈÉẸẺẼ', 'EEEEE'), ('ỀẾỆỂỄ', 'EEEEE'),
-        ('ÌÍỊỈĨ', 'IIIII'), ('ÒÓỌỎÕ', 'OOOOO'), ('ỒỐỘỔỖ', 'OOOOO'),
-        ('ỜỚỢỞỠ', 'OOOOO'), ('ÙÚỤỦŨ', 'UUUUU'), ('ỪỨỰỬỮ', 'UUUUU'),
-        ('ỲÝỴỶỸ', 'YYYYY'), ('Đ', 'D'),
-    ]
-    for src, dst in replacements:
-        for s, d in zip(src, dst):
-            text = text.replace(s, d)
-
+    text = text.translate(_STANDARDIZE_TABLE)
     text = text.lower().replace('-', ' ').strip()
-    return re.sub(r'\s+', ' ', text).strip()
+    return _SPACES_RE.sub(' ', text).strip()
+
+
+def strip_accents(text: str) -> str:
+    """Lowercase and strip all Vietnamese diacritics (both cases), e.g. 'Hãng SX' -> 'hang sx'."""
+    text = unicodedata.normalize('NFD', str(text).replace('đ', 'd').replace('Đ', 'D'))
+    return ''.join(c for c in text if unicodedata.category(c) != 'Mn').lower()
 
 
 def clean_filename(filename: str, max_len: int = 200) -> str:
     """Remove filesystem-illegal characters from filename."""
-    chars_to_remove = r'[\\/*?":<>|.]'
-    cleaned = re.sub(chars_to_remove, '', filename)
+    cleaned = _ILLEGAL_FILENAME_RE.sub('', filename)
     return cleaned[:max_len] if len(cleaned) > max_len else cleaned
 
 
@@ -38,33 +75,12 @@ def shorten_company_name(company_name: str) -> str:
     original = company_name.strip()
     name = original
 
-    prefixes = [
-        r"CÔNG TY TNHH MỘT THÀNH VIÊN", r"CÔNG TY TNHH MTV",
-        r"CÔNG TY TNHH HAI THÀNH VIÊN TRỞ LÊN", r"CÔNG TY CỔ PHẦN",
-        r"CÔNG TY TNHH", r"CÔNG TY", r"TNHH", r"CỔ PHẦN",
-    ]
-    suffixes = [
-        r"MỘT THÀNH VIÊN", r"MTV", r"HAI THÀNH VIÊN TRỞ LÊN",
-        r"CỔ PHẦN", r"TNHH",
-    ]
-    common_terms = [
-        r"THƯƠNG MẠI VÀ DỊCH VỤ", r"DỊCH VỤ VÀ THƯƠNG MẠI",
-        r"TM VÀ DV", r"DV VÀ TM", r"TM & DV", r"DV & TM",
-        r"TM", r"DV", r"CÔNG NGHỆ", r"THƯƠNG MẠI", r"TRANG THIẾT BỊ",
-        r"Y TẾ", r"XÂY DỰNG", r"ĐẦU TƯ", r"PHÁT TRIỂN", r"GIẢI PHÁP",
-        r"KỸ THUẬT", r"SẢN XUẤT", r"NHẬP KHẨU", r"XUẤT NHẬP KHẨU",
-        r"KINH DOANH", r"PHÂN PHỐI", r"VIỆT NAM"
-    ]
-
-    for p in prefixes + suffixes:
-        name = re.sub(
-            r'^\s*' + re.escape(p) + r'\s*|\s*' + re.escape(p) + r'\s*$',
-            '', name, flags=re.IGNORECASE
-        ).strip(" ,.-_&")
-
-    for term in common_terms:
-        name = re.sub(r'\b' + re.escape(term) + r'\b', '', name, flags=re.IGNORECASE).strip()
-        name = re.sub(r'\s+', ' ', name).strip(" ,.-_&")
+    for pattern in _COMPANY_AFFIX_RES:
+        name = pattern.sub('', name).strip(" ,.-_&")
+
+    for pattern in _COMPANY_TERM_RES:
+        name = pattern.sub('', name).strip()
+        name = _SPACES_RE.sub(' ', name).strip(" ,.-_&")
 
     return name if name else original
 
@@ -0,0 +1,122 @@
+"""Extraction workers — processes that take jobs from the shared queue.
+
+Each process claims one job at a time from the job database (core.jobs),
+extracts, groups and renders it, and stores the result and files for the
+UI to collect. Rate-limit buckets and finished extractions are shared
+through the same database, so N processes behave like one client.
+
+Usage:
+    BBBG_WORKERS_ENABLED=true python worker.py --processes 4
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from typing import Any, Dict, List, Tuple
+from core.archive import archive_handover
+from core.extractor import extract_handover
+from core.filename import generate_filename
+from core.fuzzy_group import group_for_output
+from core.jobs import USE_WORKERS, Job, JobOutput, PRIORITY_BATCH, job_queue
+from core.models import HandoverData
+from core.readiness import WARMUP_ENABLED, warm_up
+from core.serial_index import serial_index
+from core.usage import PRIORITY_LOW, PRIORITY_NORMAL, usage_scope
+from config.settings import get_setting
+from render.pipeline import render_outputs
+from utils.text import convert_none_to_empty_string
+from utils.logging_setup import get_logger
+
+logger = get_logger('worker')
+
+DEFAULT_PROCESSES = get_setting('WORKERS', 'PROCESSES', os.cpu_count() or 2, int)
+POLL_INTERVAL = get_setting('WORKERS', 'POLL_INTERVAL', 0.5, float)
+
+
+def process_job(job: Job) -> Tuple[Dict[str, Any], List[JobOutput]]:
+    """Extract, check serials, group and render one job. Raises ValueError if nothing was extracted."""
+    priority = PRIORITY_LOW if job.priority >= PRIORITY_BATCH else PRIORITY_NORMAL
+    with usage_scope(doc_id=job.doc_id, priority=priority):
+        data = extract_handover(job.payload, job.mime)
+        if not data or 'ds' not in data:
+            raise ValueError(f"Không trích xuất được {job.filename}")
+        data = convert_none_to_empty_string(data)
+        handover = HandoverData.from_dict(data)
+        duplicates = [d.describe() for d in serial_index.check_and_record(job.doc_id, handover)]
+        grouped, merges = group_for_output(handover.ds)
+        filename = generate_filename(data, grouped)
+        outputs = [
+            JobOutput(o.format, o.filename, o.mime, o.content.getvalue())
+            for o in render_outputs(data, grouped, job.formats or ['docx'], filename)
+        ]
+    archive_handover(job.doc_id, job.filename, data, grouped, outputs)
+    result = {
+        'data': data,
+        'duplicates': duplicates,
+        'merges': [m.describe() for m in merges],
+    }
+    return result, outputs
+
+
+def run_worker(poll_interval: float = POLL_INTERVAL) -> None:
+    """Claim and process jobs until interrupted."""
+    name = f"{multiprocessing.current_process().name}-{os.getpid()}"
+    if WARMUP_ENABLED:
+        warm_up()
+    logger.info(f"Worker {name} started")
+    while True:
+        job = job_queue.claim(name)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        started = time.perf_counter()
+        try:
+            result, outputs = process_job(job)
+        except Exception as e:
+            logger.error(f"Job {job.id[:8]} ({job.filename}) failed: {type(e).__name__}: {e}")
+            job_queue.fail(job.id, str(e))
+            continue
+        job_queue.complete(job.id, result, outputs)
+        logger.info(f"Job {job.id[:8]} ({job.filename}) done in {time.perf_counter() - started:.1f}s")
+
+
+def _worker_main(poll_interval: float) -> None:
+    try:
+        run_worker(poll_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Chạy các tiến trình trích xuất dùng chung hàng đợi")
+    parser.add_argument('--processes', type=int, default=DEFAULT_PROCESSES)
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    args = parser.parse_args(argv)
+
+    if not USE_WORKERS:
+        logger.warning("[WORKERS] enabled is off: rate limits and the result cache are not shared")
+
+    # spawn: PyMuPDF and SQLite handles must not be inherited through fork()
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=_worker_main, args=(args.poll_interval,), name=f"worker{i + 1}")
+        for i in range(max(1, args.processes))
+    ]
+    for p in processes:
+        p.start()
+    print(f"{len(processes)} worker đang chạy, hàng đợi: {job_queue.pending()} việc. Ctrl+C để dừng.")
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.join()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())